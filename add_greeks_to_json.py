@@ -1,13 +1,12 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*
-import vollib.black_scholes as bs
-import vollib.black_scholes.implied_volatility as iv
-import vollib.black_scholes.greeks.analytical as gk
 from datetime import date, datetime
 from argparse import ArgumentParser
+import pandas as pd
 import json
 import os
 import sys
+import greeks
 
 
 if __name__ == '__main__':
@@ -31,25 +30,12 @@ if __name__ == '__main__':
     else:
         sys.exit('ERROR: given input file does not exist')
     
-    # Iterate json entries and calculate greeks using Black-Scholes
-    for entry in data:
-        last_price = entry['last_price']
-        K = entry['strike']
-        S = config.underlying_price  # underlying_price
-        session_date = datetime.strptime(config.session_date, "%d%m%Y").date()
-        opt_date = datetime.strptime(entry['expiration_date'], "%d/%m/%Y").date()
-        t = (opt_date - session_date).days / 365.  # time to expiration (in years)
-        r = config.risk_free_rate
-        flag = entry['right'].lower()
-        
-        sigma = iv.implied_volatility(last_price, S, K, t, r, flag)
-        print(sigma, last_price, S, K, t, r, flag)
-        sigma = 0 if sigma < 1e-10 else sigma
-        entry['iv'] = sigma
-        entry['delta'] = gk.delta(flag, S, K, t, r, sigma)
-        entry['gamma'] = gk.gamma(flag, S, K, t, r, sigma)
-        entry['theta'] = gk.theta(flag, S, K, t, r, sigma) * 365
-        entry['vega'] = gk.vega(flag, S, K, t, r, sigma)
+    # Calculate greeks for all the json entries at once using Black-Scholes
+    session_date = datetime.strptime(config.session_date, "%d%m%Y")
+    df = greeks.add_greeks(pd.DataFrame(data), config.underlying_price, config.risk_free_rate, session_date)
+    df = df[greeks.greek_columns].astype(object)
+    for entry, values in zip(data, df.where(pd.notnull(df), None).to_dict(orient='records')):
+        entry.update(values)
     
     # Remove existing json file and save the new one with the greeks
     #os.remove(config.input_json) TODO
@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import json
+import hashlib
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+# Bulk conversion of folders of raw daily files (used by meff2json and cboe2json). Every converted input is recorded
+# in a manifest per converter, so that files already converted (and not modified since then) are skipped:
+#     cache/backfill/<converter>.json -> input path -> {mtime, size, sha1, args, outputs}
+cache_folder = path.join('cache', 'backfill')
+manifest_save_interval = 50  # Converted files between manifest saves
+progress_interval = 1.0  # Seconds between progress lines
+
+
+def file_digest(file_path: str):
+    '''
+    Returns the SHA1 hash of a file contents
+    '''
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_input_files(input_folder: str, extension: str):
+    '''
+    Returns the sorted list of files in a folder with the given extension (case insensitive)
+    '''
+    return sorted([path.join(input_folder, f) for f in os.listdir(input_folder) if path.isfile(path.join(input_folder, f)) and f.lower().endswith(extension)])
+
+
+def load_manifest(manifest_path: str):
+    if path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest: dict, manifest_path: str):
+    os.makedirs(path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def is_up_to_date(entry: dict, file_path: str, args: list):
+    '''
+    Checks if an input file was already converted with the same arguments and its outputs still exist.
+    A file is considered unchanged if its size and modification time are the same as when it was converted,
+    or otherwise if its contents hash is the same (e.g. it was copied again from a backup).
+    '''
+    if not entry or entry.get('args') != args or not all(path.isfile(o) for o in entry.get('outputs', [])):
+        return False
+    stat = os.stat(file_path)
+    if entry['size'] != stat.st_size:
+        return False
+    if entry['mtime'] == stat.st_mtime:
+        return True
+    if entry['sha1'] == file_digest(file_path):
+        entry['mtime'] = stat.st_mtime
+        return True
+    return False
+
+
+def _convert_file(convert, file_path: str, args: list):
+    '''
+    Runs a converter on a single input file, isolating any error so that a bad file does not stop the backfill
+    returns:
+        (list of output paths or None if conversion failed, input file stats, error message)
+    '''
+    try:
+        stat = os.stat(file_path)
+        entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': file_digest(file_path), 'args': args}
+        outputs = convert(file_path, *args)
+        if outputs is None:
+            return None, entry, 'no output was written'
+        return list(outputs), entry, None
+    except Exception as e:
+        traceback.print_exc()
+        return None, None, str(e)
+
+
+def run_backfill(name: str, convert, input_files: list, args=(), workers=1, force_rewrite=False, root=cache_folder):
+    '''
+    Converts a list of input files in a pool of worker processes, skipping the ones which are already up to date
+    name: Name of the converter (the manifest is stored as <root>/<name>.json)
+    convert: Module level function converting a single input file: convert(file_path, *args) -> list of output paths
+    input_files: List of input file paths
+    args: Additional arguments for the converter
+    workers: Number of worker processes
+    force_rewrite: Converts again all the input files if True
+    root: Folder where manifests are stored
+    returns:
+        dict with the lists of converted, skipped and failed input files
+    '''
+    manifest_path = path.join(root, '{}.json'.format(name))
+    manifest = load_manifest(manifest_path)
+    args = list(args)
+    summary = {'converted': [], 'skipped': [], 'failed': []}
+
+    pending = []
+    for file_path in input_files:
+        key = path.abspath(file_path)
+        if not force_rewrite and is_up_to_date(manifest.get(key), file_path, args):
+            summary['skipped'].append(file_path)
+        else:
+            pending.append(file_path)
+    total_bytes = sum(os.path.getsize(f) for f in pending)
+    print('{}: {} files to convert ({:.1f} MB), {} already up to date'.format(name, len(pending), total_bytes / 1e6, len(summary['skipped'])))
+
+    start = time.perf_counter()
+    last_progress = start
+    done_bytes = 0
+
+    def record(file_path, outputs, entry, error):
+        nonlocal last_progress, done_bytes
+        done_bytes += os.path.getsize(file_path)
+        if outputs is None:
+            print('ERROR while converting file {}: {}'.format(file_path, error))
+            summary['failed'].append(file_path)
+        else:
+            entry['outputs'] = outputs
+            manifest[path.abspath(file_path)] = entry
+            summary['converted'].append(file_path)
+            if len(summary['converted']) % manifest_save_interval == 0:
+                save_manifest(manifest, manifest_path)
+        done = len(summary['converted']) + len(summary['failed'])
+        now = time.perf_counter()
+        if now - last_progress >= progress_interval or done == len(pending):
+            elapsed = now - start
+            print('[{}/{}] {:.1f} files/s, {:.1f} MB/s, {} failed'.format(done, len(pending), done / elapsed, done_bytes / 1e6 / elapsed, len(summary['failed'])))
+            last_progress = now
+
+    try:
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_convert_file, convert, f, args): f for f in pending}
+                for future in as_completed(futures):
+                    try:
+                        outputs, entry, error = future.result()
+                    except Exception as e:
+                        # A worker process died while converting this file
+                        outputs, entry, error = None, None, str(e)
+                    record(futures[future], outputs, entry, error)
+        else:
+            for f in pending:
+                record(f, *_convert_file(convert, f, args))
+    finally:
+        # Save the manifest even if interrupted, so that converted files are not converted again
+        save_manifest(manifest, manifest_path)
+    return summary
@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import numpy as np
+import pandas as pd
+import sys
+import time
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+from report_generator import get_big_movements
+
+
+def _legacy_get_big_movements(ldf: pd.DataFrame, pdf: pd.DataFrame, n=10):
+    '''
+    Row by row implementation replaced by report_generator.get_big_movements, kept as regression reference
+    (DataFrame.append calls are replaced by a single pd.concat, as append is not available in current pandas)
+    '''
+    ldf = ldf.drop_duplicates()
+    ldf['expiration_date'] = ldf['expiration_date'].apply(lambda x: datetime.strptime(x, '%d/%m/%Y').strftime('%Y/%m/%d'))
+    pdf = pdf.drop_duplicates()
+    pdf['expiration_date'] = pdf['expiration_date'].apply(lambda x: datetime.strptime(x, '%d/%m/%Y').strftime('%Y/%m/%d'))
+
+    ldf_high_volume = ldf[ldf.volume > 0].nlargest(n, 'volume').drop_duplicates(keep='first')
+    ldf['oiev_chart_filename'] = ldf['expiration_date'].apply(lambda x: datetime.strptime(x, '%Y/%m/%d').strftime('%Y%m%d'))
+
+    call_oi = []
+    put_oi = []
+    for expiry in sorted(ldf.expiration_date.unique().tolist()):
+        call_oi.append(ldf.loc[(ldf.expiration_date == expiry) & (ldf.right == 'C')].nlargest(3, 'open_interest').drop_duplicates(keep='first'))
+        put_oi.append(ldf.loc[(ldf.expiration_date == expiry) & (ldf.right == 'P')].nlargest(3, 'open_interest').drop_duplicates(keep='first'))
+    ldf_high_call_oi = pd.concat(call_oi) if call_oi else ldf.iloc[0:0]
+    ldf_high_put_oi = pd.concat(put_oi) if put_oi else ldf.iloc[0:0]
+
+    mdf = ldf.merge(pdf, on=['strike', 'right', 'expiration_date'], how='inner', suffixes=('_latest', '_previous'))
+    mdf['open_interest_diff'] = mdf.apply(lambda x: x['open_interest_latest'] - x['open_interest_previous'], axis=1)
+    mdf['open_interest_diff_pc'] = mdf.apply(lambda x: (x['open_interest_latest'] - x['open_interest_previous']) / x['open_interest_previous'] if x['open_interest_previous'] > 0 else x['open_interest_latest'], axis=1)
+    mdf['open_interest_diff_pc_str'] = mdf.apply(lambda x: '{:.2f}%'.format(100 * x['open_interest_diff_pc']), axis=1)
+    mdf['oiev_chart_filename'] = mdf['expiration_date'].apply(lambda x: datetime.strptime(x, '%Y/%m/%d').strftime('%Y%m%d'))
+
+    mdf_highest_changers = mdf.loc[mdf.open_interest_diff > 0].nlargest(n, 'open_interest_diff').drop_duplicates(keep='first')
+    mdf_highest_pc_changers = mdf.loc[mdf.open_interest_diff > 0].nlargest(n, 'open_interest_diff_pc').drop_duplicates(keep='first')
+    return {'highest_volume': ldf_high_volume, 'highest_call_oi': ldf_high_call_oi, 'highest_put_oi': ldf_high_put_oi, 'highest_changers': mdf_highest_changers, 'highest_pc_changers': mdf_highest_pc_changers,}
+
+
+def generate_history(num_sessions: int, num_strikes: int, num_expiries: int, seed=0):
+    '''
+    Generates a synthetic history of daily option chains (json-like, with dd/mm/YYYY dates), where each session
+    lists the next monthly expiries. Open interest and volume are small random integers, so ties are frequent.
+    returns:
+        list of dataframes, one per session
+    '''
+    rng = np.random.RandomState(seed)
+    first_session = datetime(2015, 1, 2)
+    sessions = [first_session + timedelta(days=i) for i in range(int(num_sessions * 7 / 5) + 7) if (first_session + timedelta(days=i)).weekday() < 5][:num_sessions]
+    strikes = 3000.0 + 25.0 * np.arange(num_strikes)
+    expiries = [datetime(2015 + m // 12, m % 12 + 1, 15) for m in range(len(sessions) // 15 + num_expiries + 2)]
+    history = []
+    for session in sessions:
+        session_expiries = [t for t in expiries if t > session][:num_expiries]
+        k, t, right = [a.ravel() for a in np.meshgrid(strikes, [t.strftime('%d/%m/%Y') for t in session_expiries], ['C', 'P'], indexing='ij')]
+        rows = len(k)
+        last_price = np.round(rng.uniform(0.5, 300, rows), 1)
+        history.append(pd.DataFrame({
+            'session_date': session.strftime('%d/%m/%Y'), 'expiration_date': t, 'strike': k, 'right': right,
+            'open_price': last_price, 'high_price': last_price, 'low_price': last_price, 'last_price': last_price,
+            'percentage_diff_to_prev_day': np.round(rng.normal(0, 5, rows), 2),
+            'volume': rng.poisson(3, rows) * (rng.rand(rows) < 0.3), 'open_interest': rng.poisson(rng.uniform(0, 200, rows)),
+            'open_interest_date': session.strftime('%d/%m/%Y')}))
+    return history
+
+
+def check_regression(new: dict, old: dict):
+    '''
+    Returns the list of movement tables where both implementations differ (values, columns and index)
+    '''
+    mismatches = []
+    for key in old:
+        try:
+            pd.testing.assert_frame_equal(new[key], old[key], check_dtype=False, check_index_type=False)
+        except AssertionError:
+            mismatches.append(key)
+    return mismatches
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--sessions', type=int, default=500,
+                        help='Number of sessions in the synthetic history (every consecutive pair is compared). Default: 500')
+    parser.add_argument('-k', '--strikes', type=int, default=80,
+                        help='Number of strikes per expiry. Default: 80')
+    parser.add_argument('-e', '--expiries', type=int, default=12,
+                        help='Number of expiries per session. Default: 12')
+    config = parser.parse_args()
+
+    history = generate_history(config.sessions, config.strikes, config.expiries)
+    pairs = list(zip(history[1:], history[:-1]))
+
+    start = time.perf_counter()
+    legacy = [_legacy_get_big_movements(ldf.copy(), pdf.copy()) for ldf, pdf in pairs]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [get_big_movements(ldf.copy(), pdf.copy()) for ldf, pdf in pairs]
+    vectorized_time = time.perf_counter() - start
+
+    mismatches = [(i, check_regression(new, old)) for i, (new, old) in enumerate(zip(vectorized, legacy))]
+    mismatches = [(i, keys) for i, keys in mismatches if keys]
+    print('Consecutive session pairs: {} ({} options per session)'.format(len(pairs), len(history[0])))
+    print('Row by row: {:.3f} s ({:.1f} ms per pair)'.format(legacy_time, 1000 * legacy_time / len(pairs)))
+    print('Vectorized: {:.3f} s ({:.1f} ms per pair, {:.1f}x faster)'.format(vectorized_time, 1000 * vectorized_time / len(pairs), legacy_time / vectorized_time))
+    print('Pairs with different output: {}'.format(len(mismatches)))
+    for i, keys in mismatches[:10]:
+        print('  {} vs {}: {}'.format(pairs[i][0].session_date.iloc[0], pairs[i][1].session_date.iloc[0], ', '.join(keys)))
+    if mismatches:
+        # Fails as a regression test, showing the first difference found
+        i, keys = mismatches[0]
+        pd.testing.assert_frame_equal(vectorized[i][keys[0]], legacy[i][keys[0]], check_dtype=False, check_index_type=False)
+        sys.exit(1)
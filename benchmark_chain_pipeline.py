@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+from os import path
+import sys
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from scrapy.exporters import JsonItemExporter
+from scrapy.utils.test import get_crawler
+from scrapyEurex.items import OptionItem
+from scrapyEurex.pipelines import ChainStorePipeline
+from scrapyEurex.spiders.daxspider import DaxSpider
+import chain_store
+
+
+def generate_items(num_expiries: int, num_strikes: int, session_date='15/09/2017', missing_ratio=0.3, seed=0):
+    '''
+    Generates the items crawled for a session (one by one, as the spiders do), with some options not traded
+    '''
+    rng = np.random.RandomState(seed)
+    for m in range(num_expiries):
+        expiration_date = '15/{:02d}/{}'.format(m % 12 + 1, 2018 + m // 12)
+        for right in ['C', 'P']:
+            for strike in 8000.0 + 25.0 * np.arange(num_strikes):
+                traded = rng.rand() > missing_ratio
+                prices = [round(float(p), 1) if traded else 'N/A' for p in rng.uniform(1, 500, 4)]
+                yield OptionItem(session_date=session_date, expiration_date=expiration_date, strike=float(strike), right=right,
+                                 open_price=prices[0], high_price=prices[1], low_price=prices[2], last_price=prices[3],
+                                 percentage_diff_to_prev_day=round(float(rng.uniform(-20, 20)), 2), volume=int(rng.randint(0, 100)) if traded else 0,
+                                 open_interest=int(rng.randint(0, 20000)), open_interest_date=session_date if traded else 'n.a.')
+
+
+def _run_json_feed(items, root: str):
+    '''
+    Writes the items as the json feed of the spiders did, and then the feed to the chain store
+    '''
+    feed_path = path.join(root, 'feed.json')
+    with open(feed_path, 'wb') as f:
+        exporter = JsonItemExporter(f)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+    return chain_store.write_json_file(feed_path, 'DAX', root=root)
+
+
+def _run_pipeline(items, root: str):
+    crawler = get_crawler(DaxSpider, {'EUREX_STORE_DIR': root})
+    spider = DaxSpider()
+    pipeline = ChainStorePipeline.from_crawler(crawler)
+    for item in items:
+        pipeline.process_item(item, spider)
+    pipeline.close_spider(spider)
+    pipeline.spider_closed(spider, 'finished')
+    return chain_store.partition_path('DAX', '20170915', root)
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # MB (ru_maxrss is in KB on Linux)
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-e', '--expiries', type=int, nargs='+', default=[10, 40, 160],
+                        help='Number of expiries of each benchmarked chain. Default: 10 40 160')
+    parser.add_argument('-k', '--strikes', type=int, default=300,
+                        help='Number of strikes per expiry. Default: 300')
+    parser.add_argument('--mode', type=str, default=None, choices=['json', 'pipeline'],
+                        help='Runs a single mode for a single chain size, in this process')
+    config = parser.parse_args()
+
+    if config.mode:
+        # Every run is done in its own process, so that its peak memory can be measured
+        root = tempfile.mkdtemp()
+        try:
+            baseline = _max_rss()
+            start = time.perf_counter()
+            partition = (_run_pipeline if config.mode == 'pipeline' else _run_json_feed)(generate_items(config.expiries[0], config.strikes), root)
+            elapsed = time.perf_counter() - start
+            df = pd.read_parquet(partition)
+            sort_columns = ['expiration_date', 'right', 'strike']
+            print(elapsed, _max_rss() - baseline, pd.util.hash_pandas_object(df.sort_values(sort_columns), index=False).sum())
+        finally:
+            shutil.rmtree(root)
+    else:
+        print('{:>10s}{:>12s}{:>12s}{:>18s}{:>18s}{:>8s}'.format('Options', 'Json (s)', 'Store (s)', 'Json peak (MB)', 'Store peak (MB)', 'Same'))
+        for num_expiries in config.expiries:
+            results = {}
+            for mode in ['json', 'pipeline']:
+                output = subprocess.check_output([sys.executable, __file__, '--mode', mode, '-e', str(num_expiries), '-k', str(config.strikes)])
+                results[mode] = output.decode().split()
+            print('{:>10d}{:>12.2f}{:>12.2f}{:>18.1f}{:>18.1f}{:>8s}'.format(
+                num_expiries * config.strikes * 2, float(results['json'][0]), float(results['pipeline'][0]), float(results['json'][1]),
+                float(results['pipeline'][1]), str(results['json'][2] == results['pipeline'][2])))
@@ -0,0 +1,58 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import numpy as np
+import pandas as pd
+import time
+from argparse import ArgumentParser
+import chain_store
+from benchmark_big_movements import generate_history
+
+
+def generate_legacy_frame(num_sessions: int, num_strikes: int, num_expiries: int, missing_ratio=0.2, seed=0):
+    '''
+    Generates a multi-session options dataframe as it was loaded before the canonical schema: dates and rights as
+    strings, and prices as objects because of the 'N/A' strings emitted by the spiders for options not traded
+    '''
+    rng = np.random.RandomState(seed)
+    df = pd.concat(generate_history(num_sessions, num_strikes, num_expiries, seed), ignore_index=True)
+    df['open_interest_date'] = df['session_date']
+    for column in chain_store.price_columns:
+        values = df[column].astype(object)
+        values[rng.rand(len(df)) < missing_ratio] = 'N/A'
+        df[column] = values
+    return df.astype({c: object for c in chain_store.date_columns + ['right']})
+
+
+def _time_query(df: pd.DataFrame, expiry, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        df.loc[(df.expiration_date == expiry) & (df.right == 'C'), 'open_interest'].sum()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--sessions', type=int, default=250,
+                        help='Number of sessions in the synthetic history. Default: 250')
+    parser.add_argument('-k', '--strikes', type=int, default=80,
+                        help='Number of strikes per expiry. Default: 80')
+    parser.add_argument('-e', '--expiries', type=int, default=12,
+                        help='Number of expiries per session. Default: 12')
+    config = parser.parse_args()
+
+    legacy = generate_legacy_frame(config.sessions, config.strikes, config.expiries)
+    start = time.perf_counter()
+    typed = chain_store.normalize_chain(legacy)
+    normalize_time = time.perf_counter() - start
+
+    legacy_memory = legacy.memory_usage(deep=True)
+    typed_memory = typed.memory_usage(deep=True)
+    print('Rows: {}'.format(len(legacy)))
+    print('{:<30s}{:>14s}{:>14s}'.format('Column', 'Legacy (MB)', 'Typed (MB)'))
+    for column in chain_store.chain_columns:
+        print('{:<30s}{:>14.2f}{:>14.2f}'.format(column, legacy_memory[column] / 1e6, typed_memory[column] / 1e6))
+    print('{:<30s}{:>14.2f}{:>14.2f} ({:.1f}x smaller)'.format('Total', legacy_memory.sum() / 1e6, typed_memory.sum() / 1e6, legacy_memory.sum() / typed_memory.sum()))
+    print('Conversion to the canonical schema: {:.3f} s'.format(normalize_time))
+    expiry = legacy.expiration_date.iloc[0]
+    print('Query OI of the calls of an expiry: legacy {:.2f} ms, typed {:.2f} ms'.format(1000 * _time_query(legacy, expiry), 1000 * _time_query(typed, chain_store.parse_date(expiry))))
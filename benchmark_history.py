@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import shutil
+import tempfile
+import time
+import numpy as np
+from argparse import ArgumentParser
+import chain_store
+import history_cache
+from benchmark_big_movements import generate_history
+
+
+def _time_queries(query, contracts: list):
+    start = time.perf_counter()
+    for k, t, right in contracts:
+        query(k, t, right)
+    return (time.perf_counter() - start) / len(contracts)
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--sessions', type=int, default=750,
+                        help='Number of sessions in the synthetic history. Default: 750 (about 3 years)')
+    parser.add_argument('-k', '--strikes', type=int, default=80,
+                        help='Number of strikes per expiry. Default: 80')
+    parser.add_argument('-e', '--expiries', type=int, default=12,
+                        help='Number of expiries per session. Default: 12')
+    parser.add_argument('-q', '--queries', type=int, default=1000,
+                        help='Number of contracts whose history is queried. Default: 1000')
+    config = parser.parse_args()
+
+    ticker = 'BENCH'
+    root = tempfile.mkdtemp()
+    store_root = path.join(root, 'store')
+    cache_root = path.join(root, 'cache')
+    try:
+        # Build the history with all the sessions but the last 5 ones, and then append them incrementally
+        history = generate_history(config.sessions, config.strikes, config.expiries)
+        for df in history[:-5]:
+            chain_store.write_session(df, ticker, root=store_root)
+        start = time.perf_counter()
+        history_cache.update_history(ticker, cache_root, store_root)
+        build_time = time.perf_counter() - start
+        for df in history[-5:]:
+            chain_store.write_session(df, ticker, root=store_root)
+        start = time.perf_counter()
+        mapped = history_cache.update_history(ticker, cache_root, store_root)
+        update_time = time.perf_counter() - start
+        sessions = chain_store.list_sessions(ticker, store_root)
+
+        # Reference: the whole history loaded in memory as a pandas panel
+        start = time.perf_counter()
+        panel = history_cache.index_history(chain_store.load_chain(ticker, None, history_cache.history_columns, store_root))
+        panel_time = time.perf_counter() - start
+        consistent = mapped.to_panel().equals(panel)
+
+        rng = np.random.RandomState(0)
+        keys = panel.index.droplevel('session_date').unique()
+        contracts = [keys[i] for i in rng.randint(0, len(keys), config.queries)]
+        contracts = [(k, t, right) for t, k, right in contracts]
+
+        start = time.perf_counter()
+        history_cache._opened.clear()
+        history_cache.open_history(path.join(cache_root, ticker))
+        open_time = time.perf_counter() - start
+        mapped_query = _time_queries(lambda k, t, right: history_cache.get_contract_history(mapped, k, t, right), contracts)
+        panel_query = _time_queries(lambda k, t, right: history_cache.get_contract_history(panel, k, t, right), contracts)
+        find_query = _time_queries(mapped.find, contracts)
+        size = sum(path.getsize(path.join(cache_root, ticker, f)) for f in os.listdir(path.join(cache_root, ticker)))
+    finally:
+        shutil.rmtree(root)
+
+    print('Sessions: {} / rows: {} / contracts: {} / memory-mapped files: {:.1f} MB'.format(len(sessions), len(mapped), len(keys), size / 1e6))
+    print('Build: {:.2f} s / append last 5 sessions: {:.2f} s / consistent with a full load: {}'.format(build_time, update_time, consistent))
+    print('Open memory-mapped history: {:.3f} ms / load whole store as a pandas panel: {:.2f} s'.format(1000 * open_time, panel_time))
+    print('Contract history query: memory-mapped {:.1f} us (row range lookup {:.1f} us) / pandas panel {:.1f} us'.format(
+        1e6 * mapped_query, 1e6 * find_query, 1e6 * panel_query))
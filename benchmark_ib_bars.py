@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import asyncio
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+import ib_client
+import ib_bar_store
+from ib_fake_gateway import FakeGateway
+from benchmark_ib_client import option_contracts, generate_recording
+
+
+class _SeriesGateway(FakeGateway):
+    '''
+    Fake gateway answering historical data requests for any period from a daily series per contract (only up to the
+    current day of the gateway)
+    '''
+    def __init__(self, recording: dict, series: dict, today, **kwargs):
+        super().__init__(recording, **kwargs)
+        self.series = series
+        self.today = today
+
+    def historical_callbacks(self, contract, endDateTime: str, durationStr: str, barSizeSetting: str, whatToShow: str):
+        end = pd.Timestamp(endDateTime[:8]).date() if endDateTime else self.today
+        end = min(end, self.today)
+        start = ib_bar_store.duration_start(durationStr, end)
+        dates, values = self.series[ib_client.contract_key(contract)]
+        lo, hi = np.searchsorted(dates, start.strftime('%Y%m%d'), 'left'), np.searchsorted(dates, end.strftime('%Y%m%d'), 'right')
+        if lo == hi:
+            return None
+        bars = [['historicalData', {'date': d, 'open': v, 'high': v, 'low': v, 'close': v, 'volume': 0, 'barCount': 0, 'average': v}]
+                for d, v in zip(dates[lo:hi], values[lo:hi])]
+        return bars + [['historicalDataEnd', dates[lo], dates[hi - 1]]]
+
+
+def generate_series(contracts: dict, first_day='20160101', last_day='20171231', seed=0):
+    '''
+    Generates a daily implied volatility series (business days only) per contract
+    '''
+    rng = np.random.RandomState(seed)
+    dates = np.array(pd.bdate_range(first_day, last_day).strftime('%Y%m%d'))
+    return {ib_client.contract_key(c): (dates, np.round(rng.uniform(0.1, 0.4, len(dates)), 4).tolist()) for c in contracts.values()}
+
+
+async def _legacy_download(client, contracts: dict):
+    '''
+    Previous behaviour: a whole year of bars per contract, every run
+    '''
+    results = await client.download_historical_data(contracts, duration='1 Y')
+    return {name: ib_bar_store.bars_to_frame(bars) for name, bars in results.items()}
+
+
+async def _store_download(client, contracts: dict, today, root: str):
+    return await ib_bar_store.update_contracts(client, contracts, duration='1 Y', today=today, root=root)
+
+
+async def _run(gateway, limits: dict, download, *args):
+    client = ib_client.AsyncIBClient(gateway, ib_client.HistoricalDataPacer(max_same_contract=6, same_contract_window=0.2, **limits))
+    await client.connect('127.0.0.1', 4001, 1)
+    try:
+        start = time.perf_counter()
+        results = await download(client, *args)
+        return results, time.perf_counter() - start
+    finally:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--contracts', type=int, default=100,
+                        help='Number of option contracts to download. Default: 100')
+    parser.add_argument('-D', '--days', type=int, default=5,
+                        help='Number of daily runs after the first one. Default: 5')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='Latency of the fake gateway (seconds). Default: 0.05')
+    parser.add_argument('-B', '--bar_latency', type=float, default=0.002,
+                        help='Additional latency per bar sent by the fake gateway (seconds). Default: 0.002')
+    parser.add_argument('-r', '--max_requests', type=int, default=40,
+                        help='Historical data requests allowed per pacing window (scaled down from 60 every 10 minutes). Default: 40')
+    parser.add_argument('-W', '--window', type=float, default=1.0,
+                        help='Pacing window (seconds). Default: 1.0')
+    config = parser.parse_args()
+
+    contracts = option_contracts(config.contracts)
+    recording = generate_recording(contracts, 1)
+    recording['historicalData'] = {}
+    series = generate_series(contracts)
+    limits = {'max_requests': config.max_requests, 'window': config.window, 'identical_interval': 0.25}
+    # First run, the following business days, and a second run on the last day
+    days = list(pd.bdate_range('20170901', periods=config.days + 1).date)
+    days.append(days[-1])
+
+    root = tempfile.mkdtemp()
+    try:
+        print('{:<12s}{:>14s}{:>10s}{:>12s}{:>14s}{:>10s}{:>12s}{:>8s}'.format('Day', 'Full (s)', 'Requests', 'Bars', 'Store (s)', 'Requests',
+                                                                               'Bars', 'Same'))
+        for day in days:
+            stats = {}
+            results = {}
+            for name, download, args in [('full', _legacy_download, ()), ('store', _store_download, (day, root))]:
+                gateway = _SeriesGateway(recording, series, day, latency=config.latency, bar_latency=config.bar_latency, **limits)
+                results[name], elapsed = asyncio.run(_run(gateway, limits, download, contracts, *args))
+                stats[name] = (elapsed, gateway.stats['requests'], gateway.stats['bars'])
+            same = all(results['full'][c].equals(results['store'][c]) for c in contracts)
+            print('{:<12s}{:>14.2f}{:>10d}{:>12d}{:>14.2f}{:>10d}{:>12d}{:>8s}'.format(day.strftime('%Y-%m-%d'), *stats['full'], *stats['store'], str(same)))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import asyncio
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from argparse import ArgumentParser
+import ib_client
+from ib_fake_gateway import FakeGateway
+
+
+def option_contracts(num_contracts: int):
+    '''
+    Returns a dict of name -> partially defined ESTX50 option contract
+    '''
+    contracts = {}
+    for i in range(num_contracts):
+        strike = 3000.0 + 25.0 * (i // 2)
+        right = 'CP'[i % 2]
+        contracts['{}{:.0f}'.format(right, strike)] = ib_client.make_contract('ESTX50', 'OPT', 'DTB', 'EUR', lastTradeDateOrContractMonth='20171215',
+                                                                              strike=strike, right=right)
+    return contracts
+
+
+def generate_recording(contracts: dict, num_bars: int, what_to_show='OPTION_IMPLIED_VOLATILITY', bar_size='1 day', duration='1 Y', seed=0):
+    '''
+    Generates the recorded callbacks of a gateway for the contract details and historical bars of a set of contracts
+    '''
+    rng = np.random.RandomState(seed)
+    recording = {'contractDetails': {}, 'historicalData': {}}
+    dates = [(datetime(2017, 12, 15) - timedelta(days=i)).strftime('%Y%m%d') for i in range(num_bars)][::-1]
+    for i, contract in enumerate(contracts.values()):
+        resolved = ib_client.contract_to_dict(contract)
+        resolved.update({'conId': 100000 + i, 'multiplier': '10', 'localSymbol': 'OESX', 'tradingClass': 'OESX'})
+        recording['contractDetails'][ib_client.contract_key(contract)] = [['contractDetails', resolved], ['contractDetailsEnd']]
+        iv = np.round(rng.uniform(0.1, 0.4, num_bars), 4)
+        bars = [['historicalData', {'date': d, 'open': v, 'high': v, 'low': v, 'close': v, 'volume': 0, 'barCount': 0, 'average': v}]
+                for d, v in zip(dates, iv.tolist())]
+        key = ib_client.historical_data_key(contract, what_to_show, bar_size, duration)
+        recording['historicalData'][key] = bars + [['historicalDataEnd', dates[0], dates[-1]]]
+    return recording
+
+
+async def _download(gateway, pacer, contracts: dict, concurrent: bool):
+    client = ib_client.AsyncIBClient(gateway, pacer)
+    await client.connect('127.0.0.1', 4001, 1)
+    try:
+        start = time.perf_counter()
+        if concurrent:
+            results = await client.download_historical_data(contracts)
+        else:
+            # One request in flight at a time, as the blocking client did
+            results = {}
+            for name, contract in contracts.items():
+                results.update(await client.download_historical_data({name: contract}))
+        return results, time.perf_counter() - start
+    finally:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--contracts', type=int, default=100,
+                        help='Number of option contracts to download. Default: 100')
+    parser.add_argument('-b', '--bars', type=int, default=250,
+                        help='Number of bars per contract. Default: 250')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='Latency of the fake gateway (seconds). Default: 0.05')
+    parser.add_argument('-r', '--max_requests', type=int, default=40,
+                        help='Historical data requests allowed per pacing window (scaled down from 60 every 10 minutes). Default: 40')
+    parser.add_argument('-W', '--window', type=float, default=1.0,
+                        help='Pacing window (seconds). Default: 1.0')
+    config = parser.parse_args()
+
+    contracts = option_contracts(config.contracts)
+    recording = generate_recording(contracts, config.bars)
+    limits = {'max_requests': config.max_requests, 'window': config.window, 'identical_interval': 0.25}
+
+    runs = [('sequential', False, True), ('concurrent', True, True), ('concurrent, no pacing', True, False)]
+    reference = None
+    for name, concurrent, paced in runs:
+        gateway = FakeGateway(recording, latency=config.latency, **limits)
+        pacer = ib_client.HistoricalDataPacer(max_same_contract=6, same_contract_window=0.2, **limits) if paced else \
+            ib_client.HistoricalDataPacer(max_requests=10 ** 6, identical_interval=0.0)
+        results, elapsed = asyncio.run(_download(gateway, pacer, contracts, concurrent))
+        failed = sum(isinstance(r, Exception) for r in results.values())
+        if reference is None:
+            reference = results
+        same = all(results[k] == reference[k] for k in results if not isinstance(results[k], Exception))
+        print('{:<24s}{:>8.2f} s  {:>5d} failed  {:>5d} pacing violations  {:>4d} max in flight  {:>4d} pacer waits  same bars: {}'.format(
+            name, elapsed, failed, gateway.stats['pacing_violations'], gateway.stats['max_in_flight'], pacer.waits, same))
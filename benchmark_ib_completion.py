@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import io
+import queue
+import time
+import threading
+from contextlib import redirect_stdout
+from argparse import ArgumentParser
+from ibapi.wrapper import EWrapper
+import ib_client
+from ib_iv_downloader import TestWrapper, TestClient
+import ib_fake_gateway
+from ib_fake_gateway import FakeGateway
+from benchmark_ib_client import option_contracts, generate_recording
+
+
+_LEGACY_FINISHED = object()
+_LEGACY_STARTED = object()
+_LEGACY_TIME_OUT = object()
+
+
+class _LegacyFinishableQueue:
+    '''
+    Copy of the previous finishableQueue of ib_iv_downloader: a request is only done once its End marker is received,
+    or once no element was received for a whole timeout
+    '''
+    def __init__(self, queue_to_finish):
+        self._queue = queue_to_finish
+        self.status = _LEGACY_STARTED
+
+    def get(self, timeout):
+        contents_of_queue = []
+        finished = False
+        while not finished:
+            try:
+                current_element = self._queue.get(timeout=timeout)
+                if current_element is _LEGACY_FINISHED:
+                    finished = True
+                    self.status = _LEGACY_FINISHED
+                else:
+                    contents_of_queue.append(current_element)
+            except queue.Empty:
+                finished = True
+                self.status = _LEGACY_TIME_OUT
+        return contents_of_queue
+
+    def timed_out(self):
+        return self.status is _LEGACY_TIME_OUT
+
+
+class _LegacyApp(EWrapper):
+    '''
+    Previous TestWrapper and TestClient of ib_iv_downloader (with the current BarData callback), sending its requests
+    to a fake gateway. The latency of each request is recorded as the time spent waiting for it.
+    '''
+    def __init__(self, gateway: FakeGateway):
+        EWrapper.__init__(self)
+        self.gateway = gateway
+        self.gateway.wrapper = self
+        self._my_contract_details = {}
+        self._my_historic_data_dict = {}
+        self._my_errors = queue.Queue()
+        self.latency = ib_client.LatencyHistogram()
+
+    def error(self, id, errorCode, errorString, *args):
+        self._my_errors.put('IB error id %d errorcode %d string %s' % (id, errorCode, errorString))
+
+    def contractDetails(self, reqId, contractDetails):
+        self._my_contract_details.setdefault(reqId, queue.Queue()).put(contractDetails)
+
+    def contractDetailsEnd(self, reqId):
+        self._my_contract_details.setdefault(reqId, queue.Queue()).put(_LEGACY_FINISHED)
+
+    def historicalData(self, reqId, bar):
+        self._my_historic_data_dict.setdefault(reqId, queue.Queue()).put((bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume))
+
+    def historicalDataEnd(self, reqId, start, end):
+        self._my_historic_data_dict.setdefault(reqId, queue.Queue()).put(_LEGACY_FINISHED)
+
+    def _get(self, kind, finishable, timeout):
+        start = time.perf_counter()
+        items = finishable.get(timeout=timeout)
+        while not self._my_errors.empty():
+            self._my_errors.get()
+        self.latency.record(kind, 'timeout' if finishable.timed_out() else 'finished', time.perf_counter() - start)
+        return items
+
+    def resolve_ib_contract(self, ibcontract, reqId, timeout):
+        finishable = _LegacyFinishableQueue(self._my_contract_details.setdefault(reqId, queue.Queue()))
+        self.gateway.reqContractDetails(reqId, ibcontract)
+        details = self._get('contractDetails', finishable, timeout)
+        return details[0].contract if details else ibcontract
+
+    def get_IB_historical_data(self, ibcontract, tickerid, timeout):
+        finishable = _LegacyFinishableQueue(self._my_historic_data_dict.setdefault(tickerid, queue.Queue()))
+        self.gateway.reqHistoricalData(tickerid, ibcontract, '', '1 Y', '1 day', 'OPTION_IMPLIED_VOLATILITY', 1, 1, False, [])
+        historic_data = self._get('historicalData', finishable, timeout)
+        self.gateway.cancelHistoricalData(tickerid)
+        return historic_data
+
+
+class _FakeApp(TestWrapper, TestClient):
+    '''
+    Current TestWrapper and TestClient of ib_iv_downloader, sending its requests to a fake gateway
+    '''
+    def __init__(self, gateway: FakeGateway):
+        TestWrapper.__init__(self)
+        TestClient.__init__(self, wrapper=self)
+        self.init_error()
+        self.gateway = gateway
+        self.gateway.wrapper = self
+
+    def reqContractDetails(self, reqId, contract):
+        self.gateway.reqContractDetails(reqId, contract)
+
+    def reqHistoricalData(self, reqId, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate,
+                          keepUpToDate, chartOptions):
+        # The fake gateway replays the bars recorded for the implied volatility
+        self.gateway.reqHistoricalData(reqId, contract, '', durationStr, barSizeSetting, 'OPTION_IMPLIED_VOLATILITY', useRTH,
+                                       formatDate, keepUpToDate, chartOptions)
+
+    def cancelHistoricalData(self, reqId):
+        self.gateway.cancelHistoricalData(reqId)
+
+
+def _download(app, gateway: FakeGateway, contracts: dict, timeout: float, legacy: bool):
+    '''
+    Resolves and downloads the contracts one by one, as ib_iv_downloader does
+    '''
+    thread = threading.Thread(target=gateway.run, daemon=True)
+    gateway.connect('127.0.0.1', 4001, 1)
+    thread.start()
+    results = {}
+    start = time.perf_counter()
+    try:
+        for i, (name, contract) in enumerate(contracts.items()):
+            if legacy:
+                resolved = app.resolve_ib_contract(contract, 2 * i, timeout)
+                results[name] = app.get_IB_historical_data(resolved, 2 * i + 1, timeout)
+            else:
+                resolved = app.resolve_ib_contract(contract, timeout=timeout)
+                results[name] = app.get_IB_historical_data(resolved, timeout=timeout)
+    finally:
+        gateway.disconnect()
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--contracts', type=int, default=40,
+                        help='Number of option contracts to download. Default: 40')
+    parser.add_argument('-b', '--bars', type=int, default=250,
+                        help='Number of bars per contract. Default: 250')
+    parser.add_argument('-l', '--latency', type=float, default=0.02,
+                        help='Latency of the fake gateway (seconds). Default: 0.02')
+    parser.add_argument('-e', '--end_latency', type=float, default=0.1,
+                        help='Additional latency of the End callbacks (seconds). Default: 0.1')
+    parser.add_argument('-m', '--missing', type=int, default=4,
+                        help='Every how many contracts one has no historical data, and one is unknown. Default: 4')
+    parser.add_argument('-T', '--timeout', type=float, default=1.0,
+                        help='Wait of a request before giving up (scaled down from 10 seconds). Default: 1.0')
+    config = parser.parse_args()
+
+    contracts = option_contracts(config.contracts)
+    recording = generate_recording(contracts, config.bars)
+    # Some contracts are unknown to the gateway, and some have no data (the gateway only sends an error for them)
+    no_data = [['error', ib_fake_gateway.pacing_violation_code, ib_fake_gateway.no_data_message]]
+    for i, contract in enumerate(contracts.values()):
+        if i % config.missing == 1:
+            del recording['contractDetails'][ib_client.contract_key(contract)]
+        elif i % config.missing == 2:
+            recording['historicalData'][ib_client.historical_data_key(contract, 'OPTION_IMPLIED_VOLATILITY', '1 day', '1 Y')] = no_data
+
+    reference = None
+    for name, legacy in [('finishableQueue', True), ('completion', False)]:
+        gateway = FakeGateway(recording, latency=config.latency, end_latency=config.end_latency, max_requests=10 ** 6,
+                              identical_interval=0.0)
+        app = _LegacyApp(gateway) if legacy else _FakeApp(gateway)
+        with redirect_stdout(io.StringIO()):  # Progress and errors printed by the client
+            results, elapsed = _download(app, gateway, contracts, config.timeout, legacy)
+        if reference is None:
+            reference = results
+        print('{}: {:.2f} s, same bars: {}'.format(name, elapsed, results == reference))
+        print(app.latency.format())
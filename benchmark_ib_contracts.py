@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import asyncio
+import io
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from argparse import ArgumentParser
+import ib_client
+import ib_contract_cache
+from ib_fake_gateway import FakeGateway
+from benchmark_ib_completion import _FakeApp
+
+
+def option_chain(num_expiries: int, num_strikes: int):
+    '''
+    Returns a dict of name -> partially defined ESTX50 option contract, for every strike and right of several expiries
+    '''
+    contracts = {}
+    for m in range(num_expiries):
+        expiry = '{}{:02d}15'.format(2018 + m // 12, m % 12 + 1)
+        for i in range(num_strikes):
+            for right in ['C', 'P']:
+                strike = 3000.0 + 25.0 * i
+                contracts['{}{}{:.0f}'.format(expiry, right, strike)] = ib_client.make_contract('ESTX50', 'OPT', 'DTB', 'EUR', lastTradeDateOrContractMonth=expiry,
+                                                                                                strike=strike, right=right)
+    return contracts
+
+
+def generate_recording(contracts: dict):
+    '''
+    Generates the recorded contract details of a set of options, and of the whole chain of each of their expiries
+    '''
+    recording = {'contractDetails': {}, 'historicalData': {}}
+    for i, contract in enumerate(contracts.values()):
+        resolved = ib_client.contract_to_dict(contract)
+        resolved.update({'conId': 200000 + i, 'multiplier': '10', 'localSymbol': 'OESX', 'tradingClass': 'OESX'})
+        recording['contractDetails'][ib_client.contract_key(contract)] = [['contractDetails', resolved], ['contractDetailsEnd']]
+        chain = ib_client.make_contract('ESTX50', 'OPT', 'DTB', 'EUR', lastTradeDateOrContractMonth=contract.lastTradeDateOrContractMonth)
+        chain_callbacks = recording['contractDetails'].setdefault(ib_client.contract_key(chain), [])
+        chain_callbacks.append(['contractDetails', resolved])
+    for callbacks in recording['contractDetails'].values():
+        if callbacks[-1][0] != 'contractDetailsEnd':
+            callbacks.append(['contractDetailsEnd'])
+    return recording
+
+
+def _legacy_resolve(gateway, contracts: dict):
+    '''
+    Previous behaviour: one blocking contract details request per contract, every time
+    '''
+    app = _FakeApp(gateway)
+    thread = threading.Thread(target=gateway.run, daemon=True)
+    gateway.connect('127.0.0.1', 4001, 1)
+    thread.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            return {name: app.resolve_ib_contract(contract) for name, contract in contracts.items()}
+    finally:
+        gateway.disconnect()
+        thread.join()
+
+
+async def _resolve(gateway, contracts: dict, cache, bulk: bool):
+    client = ib_client.AsyncIBClient(gateway, contract_cache=cache)
+    await client.connect('127.0.0.1', 4001, 1)
+    try:
+        if bulk:
+            expiries = sorted(set(c.lastTradeDateOrContractMonth for c in contracts.values()))
+            await client.resolve_option_chain('ESTX50', 'DTB', 'EUR', expiries)
+        return await client.resolve_contracts(contracts)
+    finally:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-e', '--expiries', type=int, default=10,
+                        help='Number of expiries of the option chain. Default: 10')
+    parser.add_argument('-k', '--strikes', type=int, default=25,
+                        help='Number of strikes per expiry. Default: 25')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='Latency of the fake gateway (seconds). Default: 0.05')
+    config = parser.parse_args()
+
+    contracts = option_chain(config.expiries, config.strikes)
+    recording = generate_recording(contracts)
+    root = tempfile.mkdtemp()
+    now = [time.time()]
+    try:
+        runs = [('one by one, blocking', None, False), ('concurrent, no cache', None, False), ('chains, cold cache', True, True),
+                ('warm cache', True, False), ('expired cache', True, True)]
+        reference = None
+        print('{} options, {} expiries'.format(len(contracts), config.expiries))
+        for name, cached, bulk in runs:
+            gateway = FakeGateway(recording, latency=config.latency)
+            cache = ib_contract_cache.ContractCache(root, ttl=24 * 3600.0, clock=lambda: now[0]) if cached else None
+            if name == 'expired cache':
+                now[0] += 2 * 24 * 3600.0
+            start = time.perf_counter()
+            if name.startswith('one by one'):
+                results = _legacy_resolve(gateway, contracts)
+            else:
+                results = asyncio.run(_resolve(gateway, contracts, cache, bulk))
+            elapsed = time.perf_counter() - start
+            if cache is not None:
+                cache.save()
+            con_ids = {k: getattr(c, 'conId', None) for k, c in results.items()}
+            if reference is None:
+                reference = con_ids
+            print('{:<24s}{:>8.3f} s  {:>5d} requests  same contracts: {}  {}'.format(name, elapsed, gateway.stats['contract_requests'], con_ids == reference,
+                                                                                   cache.format_stats() if cache is not None else ''))
+    finally:
+        shutil.rmtree(root)
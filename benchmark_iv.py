@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import numpy as np
+import time
+from argparse import ArgumentParser
+import py_vollib.black_scholes as bs
+import iv_solver
+from skew_plot import _calculate_iv
+
+
+def generate_chain(n: int, S: float, r: float, seed=0):
+    '''
+    Generates a synthetic option chain of n rows priced with Black-Scholes, plus some zero price and below intrinsic rows
+    '''
+    rng = np.random.RandomState(seed)
+    K = np.round(S * rng.uniform(0.6, 1.4, n), 0)
+    t = rng.randint(1, 3 * 365, n) / 365.
+    sigma = rng.uniform(0.08, 0.8, n)
+    flag = np.where(rng.rand(n) < 0.5, 'C', 'P')
+    price = np.array([bs.black_scholes(f.lower(), S, k, tt, r, sg) for f, k, tt, sg in zip(flag, K, t, sigma)])
+    price[rng.rand(n) < 0.02] = 0.0  # Not traded options
+    below_intrinsic = rng.rand(n) < 0.02
+    price[below_intrinsic] = np.maximum(np.where(flag[below_intrinsic] == 'C', S - K[below_intrinsic], K[below_intrinsic] - S), 0) * 0.5
+    return price, K, t, flag
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--rows', type=int, default=10000,
+                        help='Number of options in the synthetic chain. Default: 10000')
+    config = parser.parse_args()
+
+    S = 3000.0
+    r = 0.008
+    price, K, t, flag = generate_chain(config.rows, S, r)
+
+    start = time.perf_counter()
+    scalar_iv = np.array([_calculate_iv(p, S, k, tt, r, f, 'BENCH') for p, k, tt, f in zip(price, K, t, flag)])
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vector_iv, converged = iv_solver.implied_volatility(price, S, K, t, r, flag)
+    vector_time = time.perf_counter() - start
+
+    both = ~np.isnan(scalar_iv) & ~np.isnan(vector_iv)
+    print('Rows: {}'.format(config.rows))
+    print('Scalar py_vollib: {:.3f} s'.format(scalar_time))
+    print('Vectorized:       {:.3f} s ({:.1f}x faster)'.format(vector_time, scalar_time / vector_time))
+    print('Converged rows: {} / NaN rows scalar: {} / NaN rows vectorized: {}'.format(int(converged.sum()), int(np.isnan(scalar_iv).sum()), int(np.isnan(vector_iv).sum())))
+    print('NaN mask mismatches: {}'.format(int((np.isnan(scalar_iv) != np.isnan(vector_iv)).sum())))
+    print('Max abs IV difference: {:.2e}'.format(np.abs(scalar_iv[both] - vector_iv[both]).max()))
@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import io
+import shutil
+import tempfile
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import meff2json
+
+
+def _legacy_load_meff_archive(input_file_path):
+    '''
+    Previous loading of a MEFF daily zip file, which extracts both nested zip files to disk and reads the data files back.
+    Kept as reference (a private temporary folder replaces the shared tmp/ folder, so that it can also run in parallel).
+    '''
+    tmp_folder = tempfile.mkdtemp()
+    try:
+        outer_zip = zipfile.ZipFile(input_file_path, 'r')
+        outer_zip.extractall(tmp_folder)
+        outer_zip.close()
+        inner_zip = zipfile.ZipFile(path.join(tmp_folder, meff2json.inner_zip_filename), 'r')
+        inner_zip.extractall(tmp_folder)
+        inner_zip.close()
+        contracts_data = pd.read_csv(path.join(tmp_folder, meff2json.contracts_file), sep=';', decimal=',',
+                                     header=None, names=meff2json.contracts_columns, dtype=meff2json.contracts_dtype, parse_dates=[0, 5],
+                                     usecols=[0, 2, 3, 4, 5, 6])
+        contracts_stats_data = pd.read_csv(path.join(tmp_folder, meff2json.contracts_stats_file), sep=';', decimal=',',
+                                           header=None, names=meff2json.contracts_stats_columns, dtype=meff2json.contracts_stats_dtype, parse_dates=[0],
+                                           usecols=[2, 3, 4, 5, 6, 13, 15])
+        return pd.merge(contracts_data, contracts_stats_data, how='inner', on='contract_code', sort=False)
+    finally:
+        shutil.rmtree(tmp_folder)
+
+
+def generate_archive(archive_path: str, session: datetime, num_strikes: int, seed=0):
+    '''
+    Writes a synthetic MEFF daily zip file (outer zip holding today_rv.zip with CCONTRACTS.C2 and CCONTRSTAT.C2)
+    with European and American options on every subgroup under study, plus some futures without strike
+    '''
+    rng = np.random.RandomState(seed)
+    session_str = session.strftime('%Y%m%d')
+    expiries = [(session + timedelta(days=30 * (m + 1))).strftime('%Y%m%d') for m in range(6)]
+    contracts = []
+    stats = []
+    for subgroup in meff2json.contract_subgroups:
+        for expiry in expiries:
+            contracts.append('{};X;F{}{};{};F;;{}'.format(session_str, subgroup, expiry, subgroup, expiry))
+            for strike in 10.0 + 0.25 * np.arange(num_strikes):
+                for right in ['C', 'P']:
+                    for style in ['', 'EU ']:
+                        code = '{}{}{}{}{:08.2f}'.format(right, style, subgroup, expiry, strike)
+                        contracts.append('{};X;{};{};O;{};{}'.format(session_str, code, subgroup, str(strike).replace('.', ','), expiry))
+        for line in contracts[-(len(expiries) * (1 + num_strikes * 4)):]:
+            price = '{:.3f}'.format(rng.uniform(0.01, 5)).replace('.', ',')
+            fields = ['X', 'X', line.split(';')[2], price, price, price, price] + ['0'] * 6 + [str(rng.randint(0, 500)), '0', str(rng.randint(0, 5000))]
+            stats.append(';'.join(fields))
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, 'w', zipfile.ZIP_DEFLATED) as inner_zip:
+        inner_zip.writestr(meff2json.contracts_file, '\n'.join(contracts) + '\n')
+        inner_zip.writestr(meff2json.contracts_stats_file, '\n'.join(stats) + '\n')
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as outer_zip:
+        outer_zip.writestr(meff2json.inner_zip_filename, inner.getvalue())
+
+
+def _time_loader(loader, archives: list, workers: int):
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(loader, archives))
+    else:
+        results = [loader(a) for a in archives]
+    return results, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-i', '--input_folder', type=str, default=None,
+                        help='Folder of MEFF daily zip files. Default: a temporary folder of synthetic archives')
+    parser.add_argument('-n', '--num_archives', type=int, default=40,
+                        help='Number of synthetic archives to generate when no input folder is given. Default: 40')
+    parser.add_argument('-k', '--strikes', type=int, default=60,
+                        help='Number of strikes per expiry in synthetic archives. Default: 60')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes for the parallel run. Default: number of CPUs')
+    config = parser.parse_args()
+
+    synthetic_folder = None
+    input_folder = config.input_folder
+    if input_folder is None:
+        synthetic_folder = tempfile.mkdtemp()
+        input_folder = synthetic_folder
+        for i in range(config.num_archives):
+            session = datetime(2017, 1, 2) + timedelta(days=i)
+            generate_archive(path.join(input_folder, 'RV{}.zip'.format(session.strftime('%Y%m%d'))), session, config.strikes, seed=i)
+    archives = sorted([path.join(input_folder, f) for f in os.listdir(input_folder) if f.lower().endswith('.zip')])
+
+    try:
+        legacy, legacy_time = _time_loader(_legacy_load_meff_archive, archives, 1)
+        in_memory, in_memory_time = _time_loader(meff2json.load_meff_archive, archives, 1)
+        parallel, parallel_time = _time_loader(meff2json.load_meff_archive, archives, config.workers)
+    finally:
+        if synthetic_folder:
+            shutil.rmtree(synthetic_folder)
+
+    mismatches = 0
+    for old, new, par in zip(legacy, in_memory, parallel):
+        if not (old.equals(new) and new.equals(par)):
+            mismatches += 1
+    rows = sum(len(df) for df in legacy)
+    print('Archives: {} ({} joined rows)'.format(len(archives), rows))
+    print('Extract to disk:           {:.3f} s ({:.0f} archives/s)'.format(legacy_time, len(archives) / legacy_time))
+    print('In memory:                 {:.3f} s ({:.0f} archives/s, {:.1f}x faster)'.format(in_memory_time, len(archives) / in_memory_time, legacy_time / in_memory_time))
+    print('In memory, {:2d} workers:    {:.3f} s ({:.0f} archives/s, {:.1f}x faster)'.format(config.workers, parallel_time, len(archives) / parallel_time, legacy_time / parallel_time))
+    print('Archives with different data: {}'.format(mismatches))
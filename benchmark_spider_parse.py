@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import re
+import shutil
+import tempfile
+import time
+import numpy as np
+from argparse import ArgumentParser
+from datetime import datetime
+from scrapy.http import HtmlResponse, Request
+from scrapyEurex.items import OptionItem
+from scrapyEurex.spiders.daxspider import DaxSpider
+
+
+fixture_pattern = r'(?P<expiration_date>\d{6})_(?P<right>[CP])\.html$'  # Saved pages are named like 201709_C.html
+
+
+def _legacy_parse_opt_chain(response):
+    '''
+    Option chain page parser as it was before the shared EurexOptionSpider (one xpath query per field and row)
+    '''
+    table_rows = response.xpath('(//table[@class="dataTable"])[1]/tbody/tr')
+    for row in table_rows[:-1]:
+        item = OptionItem()
+        item['right'] = response.meta.get('right')
+        item['strike'] = float(row.xpath('./td[1]/span/text()').extract()[0].replace(',', ''))
+
+        opt_date = datetime.strptime(response.meta.get('expiration_date'), '%Y%m').date()
+        for d in range(15, 22):
+            opt_date = opt_date.replace(day=d)
+            if opt_date.weekday() == 4:
+                break
+        item['expiration_date'] = opt_date.strftime('%d/%m/%Y')
+
+        item['session_date'] = datetime.strptime(row.xpath('./td[12]/span/text()').extract()[0], '%m/%d/%Y').strftime('%d/%m/%Y')
+        item['percentage_diff_to_prev_day'] = float(row.xpath('./td[10]/span/text()').extract()[0].replace('%', '').rstrip())
+        item['volume'] = int(row.xpath('./td[15]/span/text()').extract()[0].replace(',', ''))
+        item['open_interest'] = int(row.xpath('./td[16]/span/text()').extract()[0].replace(',', ''))
+        try:
+            item['open_interest_date'] = datetime.strptime(row.xpath('./td[17]/span/text()').extract()[0], '%m/%d/%Y').strftime('%d/%m/%Y')
+        except:
+            item['open_interest_date'] = 'n.a.'
+        for field, column in [('last_price', 11), ('open_price', 3), ('high_price', 4), ('low_price', 5)]:
+            price = row.xpath('./td[{}]/span/text()'.format(column)).extract()[0].replace(',', '')
+            try:
+                item[field] = float(price)
+            except ValueError:
+                item[field] = 'N/A'
+        yield item
+
+
+def generate_option_page(num_strikes: int, seed=0, traded_ratio=0.7):
+    '''
+    Generates an option chain page with the layout of the Eurex single view quotes (17 columns per strike,
+    plus a last row with the totals), with some options not traded
+    '''
+    rng = np.random.RandomState(seed)
+    rows = []
+    for strike in 8000 + 50 * np.arange(num_strikes):
+        traded = rng.rand() < traded_ratio
+        prices = ['{:,.2f}'.format(p) if traded else 'n.a.' for p in rng.uniform(1, 500, 4)]
+        open_interest = rng.randint(0, 20000)
+        cells = ['{:,.2f}'.format(strike), '1', prices[0], prices[1], prices[2], '', '', '', '',
+                 '{:.2f} %'.format(rng.uniform(-20, 20)), prices[3], '09/15/2017', '', '',
+                 '{:,d}'.format(rng.randint(0, 5000) if traded else 0), '{:,d}'.format(open_interest),
+                 '09/14/2017' if open_interest else 'n.a.']
+        rows.append('<tr>{}</tr>'.format(''.join('<td class="num"><span>{}</span></td>'.format(c) for c in cells)))
+    rows.append('<tr><td colspan="14"><span>Total</span></td></tr>')
+    return ('<html><head><title>Quotes</title></head><body><div id="content">'
+            '<select id="maturityDate"><option value="">All</option><option value="201709">Sep 17</option></select>'
+            '<table class="dataTable"><thead><tr><th>Strike</th></tr></thead><tbody>{}</tbody></table>'
+            '<table class="dataTable"><tbody><tr><td><span>0</span></td></tr></tbody></table>'
+            '</div></body></html>').format(''.join(rows))
+
+
+def load_fixtures(input_folder: str):
+    '''
+    Loads the saved option chain pages of a folder as scrapy responses
+    '''
+    responses = []
+    for f in sorted(os.listdir(input_folder)):
+        match = re.search(fixture_pattern, f)
+        if match:
+            with open(path.join(input_folder, f), 'rb') as page:
+                body = page.read()
+            url = 'http://www.eurexchange.com/{}'.format(f)
+            responses.append(HtmlResponse(url, body=body, encoding='utf-8', request=Request(url, meta=match.groupdict())))
+    return responses
+
+
+def _time_parser(parse, responses: list, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            # Build the response again, so that the html parsing of the page is included
+            response = response.replace(body=response.body)
+            items = list(parse(response))
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-i', '--input_folder', type=str, default=None,
+                        help='Folder with saved option chain pages (named like 201709_C.html). Default: generated pages')
+    parser.add_argument('-p', '--pages', type=int, default=40,
+                        help='Number of generated pages. Default: 40')
+    parser.add_argument('-k', '--strikes', type=int, default=150,
+                        help='Number of strikes per generated page. Default: 150')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of timed runs. Default: 3')
+    config = parser.parse_args()
+
+    input_folder = config.input_folder
+    if input_folder is None:
+        input_folder = tempfile.mkdtemp()
+        for i in range(config.pages):
+            with open(path.join(input_folder, '{}{:02d}_{}.html'.format(2017 + i // 24, i // 2 % 12 + 1, 'CP'[i % 2])), 'w') as f:
+                f.write(generate_option_page(config.strikes, seed=i))
+    try:
+        responses = load_fixtures(input_folder)
+    finally:
+        if config.input_folder is None:
+            shutil.rmtree(input_folder)
+
+    spider = DaxSpider()
+    legacy_items = [dict(item) for response in responses for item in _legacy_parse_opt_chain(response)]
+    items = [dict(item) for response in responses for item in spider.parse_opt_chain(response)]
+    print('Pages: {} / items: {} / same items as the legacy parser: {}'.format(len(responses), len(items), items == legacy_items))
+    legacy_time = _time_parser(_legacy_parse_opt_chain, responses, config.repeat)
+    new_time = _time_parser(spider.parse_opt_chain, responses, config.repeat)
+    print('Legacy parser: {:.3f} s ({:.0f} rows/s)'.format(legacy_time, len(items) / legacy_time))
+    print('Shared parser: {:.3f} s ({:.0f} rows/s) / {:.1f}x faster'.format(new_time, len(items) / new_time, legacy_time / new_time))
@@ -5,14 +5,28 @@ from argparse import ArgumentParser
 import os
 from datetime import datetime
 import re
+import chain_store
+import backfill
 
 
 column_names = ['name', 'last_price', 'volume', 'open_interest']
 columns_dtypes = {'name': str, 'last_price': float, 'volume': int, 'open_interest': int}
 expiration_month_codes = {'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8, 'I': 9, 'J': 10, 'K': 11, 'L': 12, 'M': 1, 'N': 2, 'O': 3, 'P': 4, 'Q': 5, 'R': 6, 'S': 7, 'T': 8, 'U': 9, 'V': 10, 'W': 11, 'X': 12}
 ticker = None
+call_columns = [0, 1, 5, 6]
+put_columns = [7, 8, 12, 13]
+# Strike is the third token of a contract name, and expiration date (see cboe_strdate_to_datetime) starts with the first digit of the last one
+contract_name_pattern = r'^\S+\s+\S+\s+(?P<strike>\S+).*\s[^\s\d]*(?P<year>\d{2})(?P<day>\d{2})(?P<month>[A-X])\S*$'
 
-def cboe_to_json(input_file_path: str, output_folder: str):
+def cboe_to_json(input_file_path: str, output_folder: str, ticker=ticker):
+    '''
+    Converts a CBOE daily quotes file into a json file (and a chain store partition if a ticker is given)
+    input_file_path: Path to the CBOE daily file, named after its session date (YYYYMMDD)
+    output_folder: Folder where the json file is written. Default: current folder
+    ticker: Ticker under which data is also written to the chain store
+    returns:
+        list of written file paths, or None if the file could not be converted
+    '''
     try:
         # Get session date from the input filename
         session_date_input_format = '%Y%m%d'
@@ -20,40 +34,48 @@ def cboe_to_json(input_file_path: str, output_folder: str):
         numbers_in_path = re.findall('\d+', input_file_path)
         session_date = datetime.strptime(numbers_in_path[-1], session_date_input_format).strftime(session_date_output_format)
         
-        # Load calls
-        dfc = pd.read_csv(input_file_path, sep=',', decimal='.', header=None, names=column_names, dtype=columns_dtypes, usecols=[0, 1, 5, 6], skiprows=3)
-        dfc = dfc[dfc.name.str.contains('-') == False]  # Keep contract names without '-' (not exchange specific)
+        # Load calls and puts at once (calls are on the left side of each row, puts on the right one)
+        sides = pd.read_csv(input_file_path, sep=',', decimal='.', header=None, usecols=call_columns + put_columns, skiprows=3,
+                            dtype={c: columns_dtypes[n] for c, n in zip(call_columns + put_columns, column_names * 2)})
+        dfc = sides[call_columns].set_axis(column_names, axis=1)
         dfc['right'] = 'C'
-        dfc['session_date'] = session_date
-        dfc = dfc.join(dfc['name'].apply(contract_name_to_columns))
-        
-        # Load puts
-        dfp = pd.read_csv(input_file_path, sep=',', decimal='.', header=None, names=column_names, dtype=columns_dtypes, usecols=[7, 8, 12, 13], skiprows=3)
-        dfp = dfp[dfp.name.str.contains('-') == False]  # Keep contract names without '-' (not exchange specific)
+        dfp = sides[put_columns].set_axis(column_names, axis=1)
         dfp['right'] = 'P'
-        dfp['session_date'] = session_date
-        dfp = dfp.join(dfp['name'].apply(contract_name_to_columns))
-        
-        df = pd.concat([dfc, dfp])
+        df = pd.concat([dfc, dfp], ignore_index=True)
+        df = df[df.name.str.contains('-') == False]  # Keep contract names without '-' (not exchange specific)
+        df['session_date'] = session_date
+        df = df.join(contract_names_to_columns(df['name']))
         
         output_path = '{}.json'.format(numbers_in_path[-1])
         if output_folder:
             output_path = os.path.join(output_folder, output_path)
         df.to_json(output_path, orient='records')
+        outputs = [output_path]
+        if ticker:
+            outputs.append(chain_store.write_session(df, ticker, datetime.strptime(session_date, session_date_output_format)))
+        return [o for o in outputs if o]
     except Exception as e:
         print('ERROR while reading file {}: {}'.format(input_file_path, e))
+        return None
         
         
-def contract_name_to_columns(name: str):
-    tokens = name.split()
-    strike = float(tokens[2])
-    contract_name = tokens[-1]
-    numbers_in_contract_name = re.findall('\d+', contract_name)
-    start_pos = contract_name.index(numbers_in_contract_name[0])
-    expiration_date = cboe_strdate_to_datetime(contract_name[start_pos:start_pos+5])
-    return pd.Series({'strike': strike, 'expiration_date': expiration_date})
-    
-    
+def contract_names_to_columns(names: pd.Series):
+    '''
+    Extracts strike and expiration date from a whole column of contract names at once
+    names: Contract names, like '17 Mar 230.00 (SPY1717C230)'
+    returns:
+        dataframe with strike and expiration_date (dd/mm/YYYY) columns, with the same index as names
+    '''
+    tokens = names.str.extract(contract_name_pattern)
+    unparsed = tokens['month'].isnull()
+    if unparsed.any():
+        raise ValueError('cannot get strike and expiration date from contract name {}'.format(names[unparsed].iloc[0]))
+    month = tokens['month'].map(expiration_month_codes).astype(str).str.zfill(2)
+    # Raises for nonexistent dates, as cboe_strdate_to_datetime does
+    expiration_date = pd.to_datetime('20' + tokens['year'] + month + tokens['day'], format='%Y%m%d')
+    return pd.DataFrame({'strike': tokens['strike'].astype(float), 'expiration_date': chain_store.format_dates(expiration_date)}, index=names.index)
+
+
 def cboe_strdate_to_datetime(strdate: str):
     '''
     CBOE date format comes in the following 5 char format:
@@ -74,6 +96,12 @@ if __name__ == '__main__':
                         help='Determines the single daily zip file or folder to convert')
     parser.add_argument('-o', '--output_folder', type=str,
                         help='Determines the output  folder')   
+    parser.add_argument('-t', '--ticker', type=str, default=None,
+                        help='Determines the ticker under which data is also written to the chain store')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of worker processes used to convert a folder. Default: 1')
+    parser.add_argument('-f', '--force_rewrite', action='store_true', default=False,
+                        help='Converts again the files of a folder which are already up to date')
     args = parser.parse_args()
     
     output_folder = None
@@ -83,9 +111,10 @@ if __name__ == '__main__':
     if os.path.exists(args.input_file):
         if os.path.isfile(args.input_file):
             print('Reading file {}'.format(args.input_file))
-            cboe_to_json(args.input_file, output_folder)
+            cboe_to_json(args.input_file, output_folder, args.ticker)
         elif os.path.isdir(args.input_file):
             # Convert all available daily files data
-            [cboe_to_json(os.path.join(args.input_file, f), output_folder) for f in os.listdir(args.input_file) if os.path.isfile(os.path.join(args.input_file, f)) and f.lower().endswith('.dat')]
+            backfill.run_backfill('cboe2json', cboe_to_json, backfill.list_input_files(args.input_file, '.dat'), [output_folder, args.ticker],
+                                  args.workers, args.force_rewrite)
     else:
         print('ERROR: input file {} does not exist'.format(args.input_file))
\ No newline at end of file
@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+
+
+# Columnar on-disk store of option chains, partitioned by ticker and session date:
+#     store/<TICKER>/<YYYYMMDD>.parquet
+# Every partition holds the same typed columns, so that loaders can read only the partitions
+# and columns they need instead of parsing every daily json file.
+store_folder = 'store'
+partition_date_format = '%Y%m%d'
+legacy_date_format = '%d/%m/%Y'  # Date format used in json files (same as EUREX website)
+compression = 'snappy'
+
+chain_columns = ['session_date', 'expiration_date', 'strike', 'right', 'open_price', 'high_price', 'low_price', 'last_price',
+                 'percentage_diff_to_prev_day', 'volume', 'open_interest', 'open_interest_date']
+date_columns = ['session_date', 'expiration_date', 'open_interest_date']
+price_columns = ['open_price', 'high_price', 'low_price', 'last_price', 'percentage_diff_to_prev_day']
+int_columns = ['volume', 'open_interest']
+
+# Canonical in-memory (and on-disk) schema of an option chain: dates as datetime64, right as a categorical, prices as
+# float32 (NaN when missing, e.g. 'N/A' in spiders output) and volume and open interest as int32. Strikes are kept as
+# float64, as they are used as keys to find options (float32 cannot represent many of them exactly).
+right_dtype = pd.CategoricalDtype(['C', 'P'])
+chain_dtypes = dict([(c, 'datetime64[ns]') for c in date_columns] + [(c, 'float32') for c in price_columns] +
+                    [(c, 'int32') for c in int_columns] + [('strike', 'float64'), ('right', right_dtype)])
+
+
+def apply_schema(df: pd.DataFrame):
+    '''
+    Casts the chain columns found in an options dataframe to the canonical schema (see chain_dtypes), in place
+    df: Options dataframe, with dates either as datetime64 or as dd/mm/YYYY strings
+    '''
+    for column, dtype in chain_dtypes.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if column in date_columns:
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column], format=legacy_date_format, errors='coerce')
+            df[column] = df[column].astype(dtype)
+        elif column in int_columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(dtype)
+        elif column == 'right':
+            df[column] = df[column].astype(str).str.upper().astype(dtype)
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+
+def normalize_chain(df: pd.DataFrame):
+    '''
+    Returns a copy of an options dataframe with the store columns, in the canonical schema (see chain_dtypes)
+    df: Options dataframe as loaded from a json file (or as built by the converters)
+    '''
+    df = df.reindex(columns=chain_columns)
+    return apply_schema(df).reset_index(drop=True)
+
+
+def parse_date(value, date_format=legacy_date_format):
+    '''
+    Returns a date given either as a string (dd/mm/YYYY by default) or as a datetime-like value, as a Timestamp
+    '''
+    if isinstance(value, str):
+        return pd.Timestamp(datetime.strptime(value, date_format))
+    return pd.Timestamp(value)
+
+
+def format_dates(dates: pd.Series, date_format=legacy_date_format):
+    '''
+    Formats a datetime64 column as strings, formatting each distinct date only once
+    '''
+    codes, uniques = pd.factorize(dates, use_na_sentinel=False)
+    return pd.Series(pd.Series(uniques).dt.strftime(date_format).values.take(codes), index=dates.index, dtype=object)
+
+
+def partition_path(ticker: str, session: str, root=store_folder):
+    return path.join(root, ticker, '{}.parquet'.format(session))
+
+
+def write_session(df: pd.DataFrame, ticker: str, session_date=None, root=store_folder):
+    '''
+    Writes an options dataframe as the partition of a single session
+    df: Options dataframe (json-like or already normalized)
+    ticker: Ticker of the underlying asset
+    session_date: Session of the partition. Default: latest session date found in the data
+    root: Store root folder
+    returns:
+        path to the written partition, or None if there was no data to write
+    '''
+    df = normalize_chain(df)
+    if session_date is None:
+        if df.session_date.isnull().all():
+            return None
+        session_date = df.session_date.max()
+    session = pd.Timestamp(session_date).strftime(partition_date_format)
+    partition = partition_path(ticker, session, root)
+    os.makedirs(path.dirname(partition), exist_ok=True)
+    # Write into a temporary file first, so that readers never see half written partitions
+    tmp_partition = partition + '.tmp'
+    df.to_parquet(tmp_partition, index=False, compression=compression)
+    os.replace(tmp_partition, partition)
+    return partition
+
+
+def write_json_file(json_path: str, ticker: str, root=store_folder):
+    '''
+    Loads a daily json file and writes it as a partition of the store
+    '''
+    df = pd.read_json(json_path, convert_dates=False)
+    if df.empty:
+        return None
+    return write_session(df, ticker, root=root)
+
+
+def list_tickers(root=store_folder):
+    '''
+    Returns the sorted list of tickers with at least one session in the store
+    '''
+    if not path.isdir(root):
+        return []
+    return sorted([t for t in os.listdir(root) if list_sessions(t, root)])
+
+
+def list_sessions(ticker: str, root=store_folder):
+    '''
+    Returns the sorted list of sessions (YYYYMMDD strings) available in the store for a ticker
+    '''
+    ticker_folder = path.join(root, ticker)
+    if not path.isdir(ticker_folder):
+        return []
+    return sorted([f[:-len('.parquet')] for f in os.listdir(ticker_folder) if f.endswith('.parquet')])
+
+
+def to_legacy_dates(df: pd.DataFrame, columns=date_columns):
+    '''
+    Formats date columns as dd/mm/YYYY strings, as they are found in json files
+    '''
+    for column in columns:
+        if column in df.columns and pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = format_dates(df[column])
+    return df
+
+
+def load_chain(ticker: str, sessions=None, columns=None, root=store_folder, legacy_dates=False):
+    '''
+    Loads option chains from the store in the canonical schema (see chain_dtypes), reading only the partitions
+    and columns requested
+    ticker: Ticker of the underlying asset
+    sessions: List of sessions (YYYYMMDD strings or date-like values) to load. Default: all available
+    columns: List of columns to load. Default: all of them
+    root: Store root folder
+    legacy_dates: If True, date columns are returned as dd/mm/YYYY strings (as in json files)
+    '''
+    if sessions is None:
+        sessions = list_sessions(ticker, root)
+    else:
+        sessions = [s if isinstance(s, str) else pd.Timestamp(s).strftime(partition_date_format) for s in sessions]
+    frames = [pd.read_parquet(partition_path(ticker, s, root), columns=columns) for s in sessions]
+    if frames:
+        # Partitions written before the canonical schema have wider types, so they are cast after loading
+        df = apply_schema(pd.concat(frames, ignore_index=True))
+    else:
+        df = normalize_chain(pd.DataFrame())[columns or chain_columns]
+    if legacy_dates:
+        df = to_legacy_dates(df)
+    return df
+
+
+class SessionWriter:
+    '''
+    Writes the partition of a single session incrementally, one row group per batch of options, so that a chain can be
+    written while it is being crawled without keeping it in memory. The partition replaces the previous one (if any)
+    only when the writer is closed, so readers never see half written partitions.
+    ticker: Ticker of the underlying asset
+    session_date: Session of the partition
+    root: Store root folder
+    '''
+    def __init__(self, ticker: str, session_date, root=store_folder):
+        self.partition = partition_path(ticker, pd.Timestamp(session_date).strftime(partition_date_format), root)
+        self.schema = pa.Schema.from_pandas(normalize_chain(pd.DataFrame()), preserve_index=False)
+        os.makedirs(path.dirname(self.partition), exist_ok=True)
+        self.writer = pq.ParquetWriter(self.partition + '.tmp', self.schema, compression=compression)
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame):
+        '''
+        Appends a batch of options (json-like or already normalized) as a new row group
+        '''
+        self.writer.write_table(pa.Table.from_pandas(normalize_chain(df), schema=self.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self):
+        '''
+        Closes the partition and makes it visible to readers
+        returns:
+            path to the written partition
+        '''
+        self.writer.close()
+        os.replace(self.partition + '.tmp', self.partition)
+        return self.partition
+
+    def abort(self):
+        '''
+        Discards the partition being written, keeping the previous one (if any)
+        '''
+        self.writer.close()
+        os.remove(self.partition + '.tmp')
@@ -1,46 +1,118 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*
 import os
-import scrapy
+import time
+from argparse import ArgumentParser
 from scrapy.crawler import CrawlerProcess
 from scrapyEurex.spiders.daxspider import DaxSpider
 from scrapyEurex.spiders.estx50spider import Estx50Spider
 from datetime import datetime
-import time
 
 
 session_date_format = '%Y%m%d'
-session_date = datetime.now().strftime(session_date_format)
-
-try:
-    process = CrawlerProcess({
-        'USER_AGENT': 'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 5.1)',
-        'FEED_FORMAT': 'json',
-        'FEED_URI': os.path.join('data', 'ESTX50', '{}.json'.format(session_date)),
-        'DOWNLOAD_DELAY': 3,
-        'LOG_STDOUT': True,
-        'LOG_FILE': 'scrapy_output.txt',
-        'ROBOTSTXT_OBEY': False,
-        'RETRY_ENABLED': True,
-        'RETRY_HTTP_CODES': [500, 503, 504, 400, 404, 408],
-        'RETRY_TIMES': 5
-    })
-    process.crawl(Estx50Spider)
-    process = CrawlerProcess({
-        'USER_AGENT': 'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 5.1)',
-        'FEED_FORMAT': 'json',
-        'FEED_URI': os.path.join('data', 'DAX', '{}.json'.format(session_date)),
-        'DOWNLOAD_DELAY': 3,
-        'LOG_STDOUT': True,
-        'LOG_FILE': 'scrapy_output.txt',
-        'ROBOTSTXT_OBEY': False,
-        'RETRY_ENABLED': True,
-        'RETRY_HTTP_CODES': [500, 503, 504, 400, 404, 408],
-        'RETRY_TIMES': 5
-    })
-    process.crawl(DaxSpider)
-    process.start()  # the script will block here until the crawling is finished
-except Exception as e:
-    print('ERROR while crawling EUREX option chains: {}'.format(e))
-else:
-    print('Eurex option chains successfuly crawled')
+# Spider of each crawled product, which are all crawled at once
+products = {'ESTX50': Estx50Spider, 'DAX': DaxSpider}
+# Each product is written to its own feed (see ticker attribute of the spiders)
+feed_folder = 'data'
+feed_uri_template = os.path.join(feed_folder, '%(ticker)s', '{session_date}.json')
+# Every spider gets its own downloader, so AutoThrottle adapts the delay between requests of each product to the
+# latency observed for it (instead of a fixed 3 seconds delay), without going below DOWNLOAD_DELAY
+crawl_settings = {
+    'USER_AGENT': 'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 5.1)',
+    'DOWNLOAD_DELAY': 0.5,
+    'AUTOTHROTTLE_ENABLED': True,
+    'AUTOTHROTTLE_START_DELAY': 0.5,  # AutoThrottle never lowers the delay on non 200 responses, like 304 (not modified)
+    'AUTOTHROTTLE_MAX_DELAY': 30.0,
+    'AUTOTHROTTLE_TARGET_CONCURRENCY': 2.0,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 4,
+    'LOG_FILE': 'scrapy_output.txt',
+    'ROBOTSTXT_OBEY': False,
+    'RETRY_ENABLED': True,
+    'RETRY_HTTP_CODES': [500, 503, 504, 400, 404, 408],
+    'RETRY_TIMES': 5,
+    # Raw pages are archived per product and session date, and revalidated on later crawls (see scrapyEurex/httpcache.py)
+    'HTTPCACHE_ENABLED': True,
+    'HTTPCACHE_ALWAYS_STORE': True,
+    'HTTPCACHE_IGNORE_RESPONSE_CACHE_CONTROLS': ['no-store'],
+    'HTTPCACHE_STORAGE': 'scrapyEurex.httpcache.EurexCacheStorage',
+    'HTTPCACHE_POLICY': 'scrapyEurex.httpcache.EurexCachePolicy',
+    # Items of pages unchanged since the previous session are reused, and illiquid pages only requested once every
+    # few sessions (see scrapyEurex/incremental.py)
+    'EUREX_INCREMENTAL': True,
+    'EUREX_ILLIQUID_CADENCE': 5,
+    'EUREX_FEED_DIR': feed_folder,
+    # Options are written to the chain store while crawling (see scrapyEurex/pipelines.py)
+    'ITEM_PIPELINES': {'scrapyEurex.pipelines.ChainStorePipeline': 300}
+}
+# Parses again the pages archived for a session, without any network access nor delay between pages
+replay_settings = {
+    'EUREX_REPLAY': True,
+    'HTTPCACHE_POLICY': 'scrapy.extensions.httpcache.DummyPolicy',
+    'HTTPCACHE_IGNORE_MISSING': True,
+    'AUTOTHROTTLE_ENABLED': False,
+    'DOWNLOAD_DELAY': 0,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 16
+}
+
+
+def crawl_products(products: dict, session_date: str, settings=crawl_settings, replay=False):
+    '''
+    Crawls the option chains of several products concurrently (in a single reactor), each one to its own feed
+    products: Dict of ticker -> spider class
+    session_date: Session date (YYYYMMDD) used to name the feeds and archive the pages
+    settings: Scrapy settings
+    replay: If True, pages archived for the session are parsed again instead of being crawled
+    returns:
+        dict of ticker -> crawl stats (feed path, pages, items, pages revalidated, pages skipped and reused,
+        items reused, options written to the chain store, elapsed seconds, pages/s)
+    '''
+    feed_uri = feed_uri_template.format(session_date=session_date)
+    settings = dict(settings, FEEDS={feed_uri: {'format': 'json', 'overwrite': True}}, EUREX_SESSION_DATE=session_date)
+    if replay:
+        settings.update(replay_settings)
+    process = CrawlerProcess(settings)
+    crawlers = {}
+    for ticker, spider in products.items():
+        crawlers[ticker] = process.create_crawler(spider)
+        process.crawl(crawlers[ticker])
+    start = time.perf_counter()
+    process.start()  # the script will block here until all the crawls are finished
+    wall_time = time.perf_counter() - start
+
+    stats = {}
+    for ticker, crawler in crawlers.items():
+        crawl_stats = crawler.stats.get_stats()
+        elapsed = crawl_stats.get('elapsed_time_seconds', wall_time)
+        pages = crawl_stats.get('response_received_count', 0)
+        stats[ticker] = {'feed': feed_uri % {'ticker': ticker}, 'pages': pages, 'items': crawl_stats.get('item_scraped_count', 0),
+                         'revalidated': crawl_stats.get('httpcache/revalidate', 0), 'missing': crawl_stats.get('httpcache/ignore', 0),
+                         'skipped': crawl_stats.get('incremental/pages_skipped', 0), 'reused': crawl_stats.get('incremental/pages_reused', 0),
+                         'items_reused': crawl_stats.get('incremental/items_reused', 0), 'stored': crawl_stats.get('chain_store/rows', 0),
+                         'elapsed': elapsed, 'pages_per_second': pages / elapsed if elapsed else 0.0,
+                         'finish_reason': crawl_stats.get('finish_reason')}
+    stats['wall_time'] = wall_time
+    return stats
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--products', type=str, nargs='+', default=list(products.keys()),
+                        help='Products to crawl. Default: {}'.format(' '.join(products.keys())))
+    parser.add_argument('-r', '--replay', type=str, default=None,
+                        help='Session date (YYYYMMDD) whose archived pages are parsed again, without network access')
+    args = parser.parse_args()
+
+    session_date = args.replay or datetime.now().strftime(session_date_format)
+    try:
+        stats = crawl_products({t: products[t] for t in args.products}, session_date, replay=bool(args.replay))
+    except Exception as e:
+        print('ERROR while crawling EUREX option chains: {}'.format(e))
+    else:
+        print('Eurex option chains successfuly crawled in {:.1f} s'.format(stats.pop('wall_time')))
+        for ticker, s in stats.items():
+            print('{}: {} pages ({} not modified, {} not archived), {} options in {:.1f} s ({:.2f} pages/s), finish reason: {}'.format(
+                ticker, s['pages'], s['revalidated'], s['missing'], s['items'], s['elapsed'], s['pages_per_second'], s['finish_reason']))
+            print('{}: {} pages not requested and {} pages unchanged since the previous session, {} options reused'.format(
+                ticker, s['skipped'], s['reused'], s['items_reused']))
+            print('{}: {} options written to the chain store'.format(ticker, s['stored']))
@@ -6,6 +6,8 @@ import os
 from os.path import exists, isdir, isfile, join, split
 from argparse import ArgumentParser
 import open_interest_plot as oip
+import chain_store
+import history_cache
 
 
 if __name__ == '__main__':
@@ -15,6 +17,8 @@ if __name__ == '__main__':
                         help='Determines the path to a single daily json file')
     parser.add_argument('-f', '--input_folder', type=str,
                         help='Determines the path to folder containing several daily json files')
+    parser.add_argument('-T', '--ticker', type=str,
+                        help='Determines the ticker whose whole history is loaded from the chain store')
     parser.add_argument('-t', '--expiration_date', type=str, required=True,
                         help='Determines the expiration date under study. Example: 17/03/2017')
     parser.add_argument('-k', '--strike', type=float,
@@ -35,18 +39,18 @@ if __name__ == '__main__':
             # Load all available daily files data
             daily_files = [join(args.input_folder, f) for f in os.listdir(args.input_folder) if isfile(join(args.input_folder, f)) and f.lower().endswith('.json')]
             ticker = 'TEST'
+    elif args.ticker:
+        ticker = args.ticker
             
-    for file in daily_files:      
-        # Load contracts file
-        df = pd.read_json(file)
-        
-        # Append dataframe into a single dataframe with the info from all files
-        data = data.append(df)
+    # Load contracts files into a single dataframe with the info from all files (in the same schema as the chain store)
+    if daily_files:
+        data = chain_store.normalize_chain(pd.concat([pd.read_json(file, convert_dates=False) for file in daily_files]))
     
+    expiration_date = chain_store.parse_date(args.expiration_date)
     if args.input_file and args.expiration_date:
-        oip.plot_open_interest(data, args.expiration_date, ticker, False)
+        oip.plot_open_interest(data, expiration_date, ticker, '', False, False)
     
     if args.strike and args.expiration_date and not args.input_file:
         # If a certain option has been given with both strike and expiration, plot cummulative open interest
-        filename = oip.plot_open_interest_evolution(data, args.strike, args.expiration_date, ticker, True)
-        print(filename)
\ No newline at end of file
+        history = history_cache.update_history(ticker) if args.ticker else history_cache.index_history(data)
+        oip.plot_open_interest_evolution(history, args.strike, expiration_date, ticker, '', False, False)
\ No newline at end of file
@@ -1,64 +1,123 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*
 import pandas as pd
+import numpy as np
 import os
+from argparse import ArgumentParser
+import chain_store
 
 
 data_folder = 'data'
 tickers = ['BBVA', 'DAX', 'DIA', 'ESTX50', 'FIE', 'ITX', 'QQQ', 'SAN', 'SPY', 'TEF', 'VIX']
 ohlc_data_file = 'candlestick_data.csv'
+option_volume_file = 'daily_option_volume.csv'
 ohlc_dtype = {'session_date': str, 'close': float, 'open': float, 'percentage_high': float, 'high': float, 'low':float, 'volume': float}
 atm_percentage = 0.015
 
-for ticker in tickers:
+# Moneyness buckets, from lowest to highest strike/close ratio. A strike is ATM when lower edge <= strike/close <= upper edge
+call_buckets = ['itm_call_volume', 'atm_call_volume', 'otm_call_volume']
+put_buckets = ['otm_put_volume', 'atm_put_volume', 'itm_put_volume']
+volume_columns = ['itm_call_volume', 'atm_call_volume', 'otm_call_volume', 'itm_put_volume', 'atm_put_volume', 'otm_put_volume']
+
+
+def get_moneyness_buckets(strike: np.ndarray, close: np.ndarray, right: np.ndarray, edges=(1 - atm_percentage, 1 + atm_percentage)):
+    '''
+    Classifies each option in a single pass into one of the volume columns (ITM/ATM/OTM x call/put)
+    strike: Strikes
+    close: Underlying close price of the session of each option
+    right: Rights ('C' or 'P')
+    edges: Lower and upper strike/close ratios of the ATM bucket (both inclusive)
+    returns:
+        array with the name of the volume column of each option
+    '''
+    lower, upper = edges
+    bucket = (strike >= close * lower).astype(int) + (strike > close * upper)
+    return np.where(right == 'C', np.array(call_buckets)[bucket], np.array(put_buckets)[bucket])
+
+
+def aggregate_option_volume(df: pd.DataFrame, ohlc: pd.DataFrame, edges=(1 - atm_percentage, 1 + atm_percentage)):
+    '''
+    Sums the option volume of every moneyness bucket for all the sessions in an options dataframe at once
+    df: Options dataframe with session_date, strike, right and volume columns (see chain_store.chain_dtypes)
+    ohlc: Underlying OHLC dataframe with session_date (dd/mm/YYYY) and close columns
+    edges: Lower and upper strike/close ratios of the ATM bucket
+    returns:
+        dataframe with session_date plus one column per bucket (see volume_columns), one row per session with OHLC data
+    '''
+    closes = ohlc.drop_duplicates(subset='session_date', keep='last').set_index('session_date')['close']
+    closes.index = pd.to_datetime(closes.index, format=chain_store.legacy_date_format, errors='coerce')
+    df = df.assign(close=df['session_date'].map(closes))
+    df = df[df['close'].notnull()]
+    df['bucket'] = get_moneyness_buckets(df['strike'].values, df['close'].values, df['right'].values, edges)
+    optvol = df.groupby(['session_date', 'bucket'])['volume'].sum().unstack(fill_value=0)
+    optvol = optvol.reindex(columns=volume_columns, fill_value=0).astype(int)
+    optvol.columns.name = None
+    return optvol.reset_index()
+
+
+def update_option_volume(ticker: str, edges=(1 - atm_percentage, 1 + atm_percentage), force_rewrite=False):
+    '''
+    Adds the sessions of the chain store missing in the daily option volume file of a ticker
+    ticker: Ticker of the underlying asset
+    edges: Lower and upper strike/close ratios of the ATM bucket
+    force_rewrite: If True, all sessions are processed again
+    returns:
+        number of sessions added
+    '''
     ticker_data_folder = os.path.join(data_folder, ticker)
-    daily_files = sorted([f for f in os.listdir(ticker_data_folder) if os.path.isfile(os.path.join(ticker_data_folder, f)) and f.lower().endswith('.json')])
-    optvol = pd.DataFrame(columns=['session_date', 'itm_call_volume', 'atm_call_volume', 'otm_call_volume', 'itm_put_volume', 'atm_put_volume', 'otm_put_volume'])
-    ohlc = None
+    output_file = os.path.join(ticker_data_folder, option_volume_file)
     try:
-        ohlc = pd.read_csv(os.path.join(data_folder, ticker, ohlc_data_file), encoding='ISO-8859-1', sep=';', decimal=',', dtype=ohlc_dtype)
-    except ValueError as e:
+        ohlc = pd.read_csv(os.path.join(ticker_data_folder, ohlc_data_file), encoding='ISO-8859-1', sep=';', decimal=',', dtype=ohlc_dtype)
+    except (ValueError, OSError) as e:
         print('ERROR for {} while trying to read CSV data file: {}'.format(ticker, e))
-    else:
-        for dayf in daily_files:
-            csvfile = ''
-            try:
-                csvfile = os.path.join(data_folder, ticker, dayf)
-                df = pd.read_json(csvfile)
-            except ValueError as e:
-                print('ERROR while reading file {}: {}'.format(csvfile, e))
-            
-            today = ''
-            close = 0
-            try:
-                # Get adjusted close price for this ticker this day
-                today = df['session_date'].iloc[0]
-                close_series = ohlc.loc[ohlc['session_date'] == today, 'close']
-                if close_series.empty:
-                    print('WARNING: no OHLC data for {} on {}'.format(ticker, today))
-                else:
-                    # Sum volume for all call ATM, OTM and ITM options
-                    close = float(close_series)
-                    itm_call_volume = int(df.loc[(df['right'] == 'C') & (df['strike'] < close * (1-atm_percentage)), 'volume'].sum())
-                    atm_call_volume = int(df.loc[(df['right'] == 'C') & (df['strike'] >= close * (1-atm_percentage)) & (df['strike'] <= close * (1+atm_percentage)), 'volume'].sum())
-                    otm_call_volume = int(df.loc[(df['right'] == 'C') & (df['strike'] > close * (1+atm_percentage)), 'volume'].sum())
-                    otm_put_volume  = int(df.loc[(df['right'] == 'P') & (df['strike'] < close * (1-atm_percentage)), 'volume'].sum())
-                    atm_put_volume  = int(df.loc[(df['right'] == 'P') & (df['strike'] >= close * (1-atm_percentage)) & (df['strike'] <= close * (1+atm_percentage)), 'volume'].sum())
-                    itm_put_volume  = int(df.loc[(df['right'] == 'P') & (df['strike'] > close * (1+atm_percentage)), 'volume'].sum())
-                    
-                    optvol = optvol.append({
-                        'session_date': today,
-                        'itm_call_volume': itm_call_volume,
-                        'atm_call_volume': atm_call_volume,
-                        'otm_call_volume': otm_call_volume,
-                        'itm_put_volume':  itm_put_volume,
-                        'atm_put_volume':  atm_put_volume,
-                        'otm_put_volume':  otm_put_volume
-                    }, ignore_index=True)
-            except TypeError as e:
-                print('ERROR for {} while iterating {} for a close price of {}: {}'.format(ticker, today, close, e))
-                
-    # Join both dataframes
+        return 0
+
+    # Skip sessions already in the output file
+    existing = None
+    sessions = chain_store.list_sessions(ticker)
+    if not force_rewrite and os.path.isfile(output_file):
+        existing = pd.read_csv(output_file, sep=',', decimal='.', dtype={'session_date': str})
+        done = set(pd.to_datetime(existing['session_date'], format=chain_store.legacy_date_format).dt.strftime(chain_store.partition_date_format))
+        sessions = [s for s in sessions if s not in done]
+
+    frames = []
+    for session in sessions:
+        try:
+            frames.append(chain_store.load_chain(ticker, [session], columns=['session_date', 'strike', 'right', 'volume']))
+        except Exception as e:
+            print('ERROR while reading session {} of {}: {}'.format(session, ticker, e))
+    if not frames:
+        return 0
+    df = pd.concat(frames, ignore_index=True)
+    optvol = aggregate_option_volume(df, ohlc, edges)
+    for session_date in sorted(set(df['session_date'].unique()) - set(optvol['session_date'])):
+        print('WARNING: no OHLC data for {} on {}'.format(ticker, session_date.strftime(chain_store.legacy_date_format)))
+    if optvol.empty:
+        return 0
+    optvol['session_date'] = chain_store.format_dates(optvol['session_date'])
+
+    # Join both dataframes and append them to the already processed sessions
     df = ohlc.merge(optvol, on=['session_date'], how='inner')
+    if existing is not None:
+        df = pd.concat([existing, df], ignore_index=True)
+    df = df.iloc[pd.to_datetime(df['session_date'], format=chain_store.legacy_date_format).argsort(kind='mergesort')]
     df = df.set_index('session_date')
-    df.to_csv(os.path.join(ticker_data_folder, 'daily_option_volume.csv'), sep=',', decimal='.')
\ No newline at end of file
+    df.to_csv(output_file + '.tmp', sep=',', decimal='.')
+    os.replace(output_file + '.tmp', output_file)
+    return len(optvol)
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-t', '--tickers', type=str, nargs='+', default=tickers,
+                        help='Tickers to process. Default: {}'.format(' '.join(tickers)))
+    parser.add_argument('-e', '--edges', type=float, nargs=2, default=[1 - atm_percentage, 1 + atm_percentage],
+                        help='Lower and upper strike/close ratios of the ATM bucket. Default: {} {}'.format(1 - atm_percentage, 1 + atm_percentage))
+    parser.add_argument('-f', '--force_rewrite', action='store_true', default=False,
+                        help='Processes again all the sessions, instead of only the ones missing in {}'.format(option_volume_file))
+    config = parser.parse_args()
+
+    for ticker in config.tickers:
+        added = update_option_volume(ticker, tuple(config.edges), config.force_rewrite)
+        print('{}: {} sessions added'.format(ticker, added))
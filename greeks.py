@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+import iv_solver
+
+
+greek_columns = ['iv', 'delta', 'gamma', 'theta', 'vega', 'rho', 'vanna', 'vomma', 'charm', 'veta']
+
+
+def _norm_pdf(x):
+    return np.exp(-0.5 * x ** 2) / iv_solver.SQRT_2PI
+
+
+def black_scholes(flag, S, K, t, r, sigma):
+    '''
+    Black-Scholes option price for whole arrays of options (same inputs as py_vollib black_scholes)
+    flag: Rights ('C' or 'P', case insensitive) or boolean array which is True for calls
+    S: Underlying asset price
+    K: Strikes
+    t: Time to expiration in years
+    r: Risk-free interest rate
+    sigma: Volatilities
+    '''
+    S, K, t, r, sigma = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (S, K, t, r, sigma)])
+    sign = np.where(iv_solver.is_call(flag), 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma_sqrt_t = sigma * np.sqrt(t)
+        d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * t) / sigma_sqrt_t
+    d2 = d1 - sigma_sqrt_t
+    return sign * (S * ndtr(sign * d1) - K * np.exp(-r * t) * ndtr(sign * d2))
+
+
+def calculate_greeks(price, S, K, t, r, flag, sigma=None):
+    '''
+    Calculates implied volatility plus first and second order Black-Scholes greeks for a whole option chain
+    in a single vectorized pass, sharing d1, d2, N(d1), N(d2) and pdf(d1) among all of them.
+    Units follow vollib conventions: theta is per year, while vega, rho and every volatility sensitivity
+    (vanna, vomma, veta) are per 1% change. Charm and veta are the delta and vega decay per year.
+    price: Option prices (only used when sigma is not given)
+    S: Underlying asset price
+    K: Strikes
+    t: Time to expiration in years
+    r: Risk-free interest rate
+    flag: Rights ('C' or 'P', case insensitive) or boolean array which is True for calls
+    sigma: Volatilities to use instead of solving the implied volatility from the prices
+    returns:
+        dict of arrays, one per column in greek_columns
+    '''
+    S, K, t, r = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (S, K, t, r)])
+    call = np.broadcast_to(iv_solver.is_call(flag), S.shape)
+    if sigma is None:
+        sigma, _ = iv_solver.implied_volatility(price, S, K, t, r, call)
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), S.shape)
+    sigma = np.where(sigma < 1e-10, 0.0, sigma)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        sqrt_t = np.sqrt(t)
+        sigma_sqrt_t = sigma * sqrt_t
+        d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * t) / sigma_sqrt_t
+        d2 = d1 - sigma_sqrt_t
+        sign = np.where(call, 1.0, -1.0)
+        pdf_d1 = _norm_pdf(d1)
+        cdf_d1 = ndtr(sign * d1)
+        cdf_d2 = ndtr(sign * d2)
+        discounted_K = K * np.exp(-r * t)
+        raw_vega = S * pdf_d1 * sqrt_t
+
+        greeks = {
+            'iv': sigma,
+            'delta': sign * cdf_d1,
+            'gamma': pdf_d1 / (S * sigma_sqrt_t),
+            'theta': -S * pdf_d1 * sigma / (2 * sqrt_t) - sign * r * discounted_K * cdf_d2,
+            'vega': 0.01 * raw_vega,
+            'rho': 0.01 * sign * t * discounted_K * cdf_d2,
+            'vanna': -0.01 * pdf_d1 * d2 / sigma,
+            'vomma': 0.0001 * raw_vega * d1 * d2 / sigma,
+            'charm': -pdf_d1 * (2 * r * t - d2 * sigma_sqrt_t) / (2 * t * sigma_sqrt_t),
+            'veta': 0.01 * raw_vega * (r * d1 / sigma_sqrt_t - (1 + d1 * d2) / (2 * t)),
+        }
+    return greeks
+
+
+def add_greeks(df: pd.DataFrame, S: float, r: float, session_date):
+    '''
+    Adds implied volatility and greeks columns (see greek_columns) to an options dataframe
+    df: Options dataframe, with last_price, strike, right and expiration_date (datetime64 or dd/mm/YYYY) columns
+    S: Underlying asset price
+    r: Risk-free interest rate
+    session_date: Date from which time to expiration is measured
+    '''
+    t = iv_solver.years_to_expiry(df['expiration_date'], session_date)
+    price = pd.to_numeric(df['last_price'], errors='coerce').values  # 'N/A' prices become NaN
+    greeks = calculate_greeks(price, S, df['strike'].values, t, r, df['right'].values)
+    for column in greek_columns:
+        df[column] = greeks[column]
+    return df
@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import chain_store
+
+
+# Persistent per-ticker history of every contract, built from the chain store and stored as memory-mapped arrays:
+#     cache/history/<TICKER>/<column>.npy          -> one value per contract and session, sorted by contract and session date
+#     cache/history/<TICKER>/contract_<field>.npy  -> one row per contract (expiration_date, strike, right) sorted, with
+#                                                     the range of rows (start, stop) holding its history
+#     cache/history/<TICKER>/sessions.json         -> store sessions already ingested
+# Opening it only maps the files, and the history of a contract is found with a few binary searches over the contracts,
+# so it is read in microseconds without loading the rest of the history, and shared by several processes without copies.
+cache_folder = path.join('cache', 'history')
+index_columns = ['expiration_date', 'strike', 'right', 'session_date']
+value_columns = ['open_interest', 'volume', 'last_price']
+history_columns = index_columns + value_columns
+contract_fields = ['expiration_date', 'strike', 'right', 'start', 'stop']
+sessions_file = 'sessions.json'
+
+_opened = {}
+
+
+def index_history(df: pd.DataFrame):
+    '''
+    Returns an options dataframe indexed by (expiration_date, strike, right, session_date) and sorted,
+    so that the history of a given expiry and strike can be sliced with a binary search
+    df: Options dataframe, with dates either as datetime64 or as dd/mm/YYYY strings
+    '''
+    df = chain_store.apply_schema(df.reindex(columns=history_columns))
+    df = df.set_index(index_columns)
+    df = df[~df.index.duplicated(keep='last')]
+    return df.sort_index()
+
+
+class MappedHistory:
+    '''
+    Read-only history of a ticker backed by memory-mapped arrays (see update_history). Pickling it only carries
+    its folder, so it can be handed over to worker processes, which map the same files again.
+    '''
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.identity = os.stat(folder).st_ino
+        self.contracts = {f: np.load(path.join(folder, 'contract_{}.npy'.format(f)), mmap_mode='r') for f in contract_fields}
+        self.columns = {c: np.load(path.join(folder, '{}.npy'.format(c)), mmap_mode='r') for c in ['session_date'] + value_columns}
+
+    def __reduce__(self):
+        return (open_history, (self.folder,))
+
+    def __len__(self):
+        return len(self.columns['session_date'])
+
+    def find(self, k: float, t, right: str):
+        '''
+        Returns the (start, stop) range of rows holding the history of a contract, (0, 0) if it is unknown
+        '''
+        expiries = self.contracts['expiration_date']
+        expiry = np.datetime64(pd.Timestamp(t).date(), 'D')
+        lo, hi = np.searchsorted(expiries, expiry, 'left'), np.searchsorted(expiries, expiry, 'right')
+        strikes = self.contracts['strike'][lo:hi]
+        lo, hi = lo + np.searchsorted(strikes, k, 'left'), lo + np.searchsorted(strikes, k, 'right')
+        for i in range(lo, hi):
+            if self.contracts['right'][i] == right.encode():
+                return int(self.contracts['start'][i]), int(self.contracts['stop'][i])
+        return 0, 0
+
+    def contract_history(self, k: float, t, right: str):
+        '''
+        Returns the history of a single option as a dataframe indexed by session_date (see value_columns)
+        '''
+        start, stop = self.find(k, t, right)
+        index = pd.DatetimeIndex(self.columns['session_date'][start:stop].astype('datetime64[ns]'), name='session_date')
+        return pd.DataFrame({c: self.columns[c][start:stop] for c in value_columns}, index=index)
+
+    def to_panel(self, k=None, t=None):
+        '''
+        Returns the whole history (or only the calls and puts of a given strike and expiry) as a dataframe
+        indexed by (expiration_date, strike, right, session_date), like index_history does
+        '''
+        ranges = [self.find(k, t, right) for right in ['C', 'P']] if k is not None else [(0, len(self))]
+        frames = []
+        for start, stop in ranges:
+            first = np.searchsorted(self.contracts['start'], start, 'left')
+            last = np.searchsorted(self.contracts['start'], stop, 'left') if stop > start else first
+            lengths = self.contracts['stop'][first:last] - self.contracts['start'][first:last]
+            frame = {f: np.repeat(self.contracts[f][first:last], lengths) for f in ['expiration_date', 'strike', 'right']}
+            frame['session_date'] = self.columns['session_date'][start:stop]
+            frame.update({c: self.columns[c][start:stop] for c in value_columns})
+            frames.append(pd.DataFrame(frame))
+        df = pd.concat(frames, ignore_index=True)
+        df['right'] = df['right'].str.decode('ascii')
+        for column in ['expiration_date', 'session_date']:
+            df[column] = df[column].astype('datetime64[ns]')
+        return index_history(df)
+
+
+def open_history(folder: str):
+    '''
+    Opens the memory-mapped history in a folder, only once per process (unless it has been rebuilt since then)
+    '''
+    history = _opened.get(folder)
+    if history is None or history.identity != os.stat(folder).st_ino:
+        history = MappedHistory(folder)
+        _opened[folder] = history
+    return history
+
+
+def _write_history(panel: pd.DataFrame, folder: str, sessions: list):
+    '''
+    Writes a history panel (as returned by index_history) as memory-mapped arrays. Arrays are written into a new folder
+    which then replaces the previous one, so that processes which already mapped it keep reading consistent data.
+    '''
+    tmp_folder = folder + '.tmp'
+    if path.isdir(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+    df = panel.reset_index()
+    starts = np.flatnonzero(~df.duplicated(subset=['expiration_date', 'strike', 'right']).values)
+    contracts = {
+        'expiration_date': df['expiration_date'].values[starts].astype('datetime64[D]'),
+        'strike': df['strike'].values[starts].astype('float64'),
+        'right': df['right'].astype(str).values[starts].astype('S1'),
+        'start': starts.astype('int64'),
+        'stop': np.append(starts[1:], len(df))[:len(starts)].astype('int64'),
+    }
+    for f in contract_fields:
+        np.save(path.join(tmp_folder, 'contract_{}.npy'.format(f)), contracts[f])
+    np.save(path.join(tmp_folder, 'session_date.npy'), df['session_date'].values.astype('datetime64[D]'))
+    for c in value_columns:
+        np.save(path.join(tmp_folder, '{}.npy'.format(c)), df[c].values.astype(chain_store.chain_dtypes[c]))
+    with open(path.join(tmp_folder, sessions_file), 'w') as f:
+        json.dump(sessions, f)
+    if path.isdir(folder):
+        shutil.rmtree(folder)
+    os.replace(tmp_folder, folder)
+
+
+def _load_sessions(folder: str):
+    sessions_path = path.join(folder, sessions_file)
+    if path.isfile(sessions_path):
+        with open(sessions_path, 'r') as f:
+            return json.load(f)
+    return []
+
+
+def update_history(ticker: str, root=cache_folder, store_root=chain_store.store_folder, rebuild=False):
+    '''
+    Opens the memory-mapped history of a ticker, appending first the store sessions not ingested yet
+    ticker: Ticker of the underlying asset
+    root: Cache root folder
+    store_root: Chain store root folder
+    rebuild: If True, the history is built again from scratch
+    returns:
+        MappedHistory
+    '''
+    folder = path.join(root, ticker)
+    ingested = [] if rebuild else _load_sessions(folder)
+    new_sessions = sorted(set(chain_store.list_sessions(ticker, store_root)) - set(ingested))
+    if not new_sessions and path.isdir(folder) and not rebuild:
+        return open_history(folder)
+
+    new_data = index_history(chain_store.load_chain(ticker, new_sessions, history_columns, store_root))
+    if ingested:
+        panel = pd.concat([open_history(folder).to_panel(), new_data])
+        panel = panel[~panel.index.duplicated(keep='last')].sort_index()
+    else:
+        panel = new_data
+    _write_history(panel, folder, sorted(ingested + new_sessions))
+    return open_history(folder)
+
+
+def get_contract_history(history, k: float, t, right: str):
+    '''
+    Returns the history of a single option, indexed by session_date
+    history: MappedHistory returned by update_history, or panel returned by index_history
+    k: Strike of the option under study
+    t: Expiration date (datetime-like)
+    right: Right of the option ('C' or 'P')
+    '''
+    if isinstance(history, MappedHistory):
+        return history.contract_history(k, t, right)
+    try:
+        return history.loc[(pd.Timestamp(t), k, right)]
+    except KeyError:
+        return history.iloc[0:0].droplevel(['expiration_date', 'strike', 'right'])
+
+
+def slice_contracts(history, k: float, t):
+    '''
+    Returns the part of the history for a given strike and expiry (calls and puts) as a panel, like index_history does
+    history: MappedHistory returned by update_history, or panel returned by index_history
+    k: Strike of the options under study
+    t: Expiration date (datetime-like)
+    '''
+    if isinstance(history, MappedHistory):
+        return history.to_panel(k, t)
+    key = (pd.Timestamp(t), k)
+    return history.loc[key:key]
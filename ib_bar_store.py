@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import json
+import asyncio
+import math
+import pandas as pd
+from datetime import datetime, date, timedelta
+import ib_client
+
+
+# Persistent store of the historical bars downloaded from IB, one series per (contract, whatToShow, barSize):
+#     cache/ib_bars/<SYMBOL>/<secType>_<exchange>_<currency>[_<expiry>_<strike>_<right>]/<whatToShow>_<barSize>.parquet
+#     cache/ib_bars/<SYMBOL>/<secType>_<exchange>_<currency>[_<expiry>_<strike>_<right>]/<whatToShow>_<barSize>.json
+# The parquet file holds the bars as typed columns (see bar_dtypes), sorted by date, and the json file the date ranges
+# already downloaded ([[YYYYMMDD, YYYYMMDD], ...]), so that a date without bars (e.g. a holiday) is not requested again.
+# Only the ranges missing from the requested period are downloaded (see find_gaps), so once a series is stored, keeping
+# it up to date costs a single small request per day. The current day is never marked as downloaded, as its bar can
+# still change.
+bar_store_folder = path.join('cache', 'ib_bars')
+date_format = '%Y%m%d'
+bar_columns = ['date', 'open', 'high', 'low', 'close', 'volume']
+bar_dtypes = {'date': 'datetime64[ns]', 'open': 'float64', 'high': 'float64', 'low': 'float64', 'close': 'float64', 'volume': 'int64'}
+compression = 'snappy'
+max_days_duration = 365  # Longer gaps are requested in years (IB does not accept longer durations in days)
+
+
+def series_path(contract, what_to_show: str, bar_size: str, root=bar_store_folder):
+    '''
+    Returns the path (without extension) of the stored series of a contract (see the layout above)
+    contract: IB contract (only its symbol, secType, exchange, currency, expiry, strike and right are used)
+    '''
+    fields = [contract.secType, contract.exchange, contract.currency]
+    if contract.lastTradeDateOrContractMonth or contract.right:
+        fields += [contract.lastTradeDateOrContractMonth, '{:g}'.format(contract.strike), contract.right]
+    return path.join(root, contract.symbol, '_'.join(fields), '{}_{}'.format(what_to_show, bar_size.replace(' ', '')))
+
+
+def bars_to_frame(bars: list):
+    '''
+    Returns a list of IB bars as (date, open, high, low, close, volume) tuples as a dataframe, in the store schema
+    '''
+    df = pd.DataFrame(bars, columns=bar_columns)
+    dates = df['date'].astype(str).str.split().str.join(' ')
+    df['date'] = pd.to_datetime(dates, format='%Y%m%d %H:%M:%S' if dates.str.contains(':').any() else date_format)
+    return df.astype(bar_dtypes)
+
+
+def load_bars(contract, what_to_show='OPTION_IMPLIED_VOLATILITY', bar_size='1 day', root=bar_store_folder):
+    '''
+    Returns the stored bars of a contract as a dataframe (empty if there are none)
+    '''
+    bars_path = series_path(contract, what_to_show, bar_size, root) + '.parquet'
+    if not path.isfile(bars_path):
+        return bars_to_frame([])
+    return pd.read_parquet(bars_path)
+
+
+def load_coverage(contract, what_to_show: str, bar_size: str, root=bar_store_folder):
+    '''
+    Returns the date ranges of a series already downloaded, as a sorted list of (start, end) dates (both included)
+    '''
+    coverage_path = series_path(contract, what_to_show, bar_size, root) + '.json'
+    if not path.isfile(coverage_path):
+        return []
+    with open(coverage_path, 'r') as f:
+        return [(datetime.strptime(s, date_format).date(), datetime.strptime(e, date_format).date()) for s, e in json.load(f)]
+
+
+def merge_ranges(ranges: list):
+    '''
+    Returns a list of (start, end) date ranges sorted, with the overlapping or contiguous ones merged
+    '''
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_gaps(coverage: list, start: date, end: date):
+    '''
+    Returns the date ranges between start and end (both included) not covered yet, as a list of (start, end) dates
+    coverage: Date ranges already downloaded (see load_coverage)
+    '''
+    gaps = []
+    for covered_start, covered_end in merge_ranges(coverage):
+        if covered_end < start:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > start:
+            gaps.append((start, covered_start - timedelta(days=1)))
+        start = covered_end + timedelta(days=1)
+    if start <= end:
+        gaps.append((start, end))
+    return gaps
+
+
+def duration_start(duration: str, end: date):
+    '''
+    Returns the first day of a period given as an IB duration (e.g. '1 Y', '6 M', '2 W', '10 D') ending on a date
+    '''
+    value, unit = duration.split()
+    offsets = {'D': pd.DateOffset(days=int(value) - 1), 'W': pd.DateOffset(weeks=int(value)), 'M': pd.DateOffset(months=int(value)),
+               'Y': pd.DateOffset(years=int(value))}
+    return (pd.Timestamp(end) - offsets[unit.upper()]).date()
+
+
+def gap_request(start: date, end: date):
+    '''
+    Returns the end date time and duration of the IB request covering a date range
+    '''
+    days = (end - start).days + 1
+    if days <= max_days_duration:
+        return '{} 23:59:59'.format(end.strftime(date_format)), '{} D'.format(days)
+    years = math.ceil(days / 366.0)
+    while duration_start('{} Y'.format(years), end) > start:
+        years += 1
+    return '{} 23:59:59'.format(end.strftime(date_format)), '{} Y'.format(years)
+
+
+def write_bars(contract, what_to_show: str, bar_size: str, df: pd.DataFrame, coverage: list, root=bar_store_folder):
+    '''
+    Merges bars into the stored series of a contract (new bars replacing stored ones with the same date),
+    and marks some date ranges as downloaded
+    returns:
+        whole stored series as a dataframe
+    '''
+    series = series_path(contract, what_to_show, bar_size, root)
+    os.makedirs(path.dirname(series), exist_ok=True)
+    df = pd.concat([load_bars(contract, what_to_show, bar_size, root), df.astype(bar_dtypes)], ignore_index=True)
+    df = df.drop_duplicates(subset='date', keep='last').sort_values('date').reset_index(drop=True)
+    coverage = merge_ranges(load_coverage(contract, what_to_show, bar_size, root) + coverage)
+    # Write into temporary files first, so that readers never see half written series
+    df.to_parquet(series + '.parquet.tmp', index=False, compression=compression)
+    with open(series + '.json.tmp', 'w') as f:
+        json.dump([[s.strftime(date_format), e.strftime(date_format)] for s, e in coverage], f)
+    os.replace(series + '.parquet.tmp', series + '.parquet')
+    os.replace(series + '.json.tmp', series + '.json')
+    return df
+
+
+async def update_bars(client, contract, what_to_show='OPTION_IMPLIED_VOLATILITY', bar_size='1 day', duration='1 Y', today=None,
+                      root=bar_store_folder, **kwargs):
+    '''
+    Downloads the ranges of a period missing from the stored series of a contract (concurrently), and stores them
+    client: ib_client.AsyncIBClient
+    contract: IB contract (resolved, see ib_client.AsyncIBClient.resolve_contract)
+    duration: Period to keep up to date, up to today (as an IB duration)
+    today: Last day of the period. Default: current date
+    kwargs: Other arguments of ib_client.AsyncIBClient.get_historical_data (e.g. timeout)
+    returns:
+        dataframe with the stored bars of the period
+    '''
+    today = today or date.today()
+    start = duration_start(duration, today)
+    gaps = find_gaps(load_coverage(contract, what_to_show, bar_size, root), start, today)
+
+    async def download(gap):
+        end_date_time, gap_duration = gap_request(*gap)
+        return await client.get_historical_data(contract, what_to_show, gap_duration, bar_size, end_date_time, **kwargs)
+
+    results = await asyncio.gather(*[download(gap) for gap in gaps], return_exceptions=True)
+    bars = []
+    covered = []
+    for (gap_start, gap_end), result in zip(gaps, results):
+        if isinstance(result, Exception) and not ib_client.is_no_data(result):
+            print('ERROR while downloading {} {} bars of {} from {} to {}: {}'.format(what_to_show, bar_size, contract.symbol, gap_start, gap_end, result))
+            continue
+        if not isinstance(result, Exception):
+            bars += result
+        if gap_start < today:
+            covered.append((gap_start, min(gap_end, today - timedelta(days=1))))
+    df = write_bars(contract, what_to_show, bar_size, bars_to_frame(bars), covered, root) if gaps else load_bars(contract, what_to_show, bar_size, root)
+    return df[df['date'] >= pd.Timestamp(start)].reset_index(drop=True)
+
+
+async def update_contracts(client, contracts: dict, **kwargs):
+    '''
+    Resolves a set of contracts and updates their stored series concurrently (see update_bars)
+    contracts: Dict of name -> (maybe partially defined) contract
+    returns:
+        dict of name -> dataframe with the stored bars of the period, or the exception raised while resolving it
+    '''
+    async def update(contract):
+        return await update_bars(client, await client.resolve_contract(contract), **kwargs)
+
+    results = await asyncio.gather(*[update(c) for c in contracts.values()], return_exceptions=True)
+    return dict(zip(contracts.keys(), results))
+
+
+def load_symbol_bars(symbol: str, what_to_show='OPTION_IMPLIED_VOLATILITY', bar_size='1 day', root=bar_store_folder):
+    '''
+    Returns the stored bars of the underlying (not an option) contract of a symbol, e.g. the ESTX50 index,
+    or None if there are none
+    '''
+    folder = path.join(root, symbol)
+    if not path.isdir(folder):
+        return None
+    series_file = '{}_{}.parquet'.format(what_to_show, bar_size.replace(' ', ''))
+    for contract_folder in sorted(os.listdir(folder)):
+        if len(contract_folder.split('_')) == 3 and path.isfile(path.join(folder, contract_folder, series_file)):
+            return pd.read_parquet(path.join(folder, contract_folder, series_file))
+    return None
@@ -0,0 +1,503 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import asyncio
+import bisect
+import itertools
+import json
+import time
+import threading
+from collections import deque
+from ibapi.wrapper import EWrapper
+from ibapi.client import EClient
+from ibapi.contract import Contract, ContractDetails
+from ibapi.common import BarData
+
+
+# Asyncio layer over the IB API: every request gets its own id, and its results are delivered by the EWrapper callbacks
+# (called from the reader thread of the client) to a future awaited in the event loop, so many requests can be in
+# flight at once. Historical data requests are scheduled within the IB pacing limits (see HistoricalDataPacer).
+default_timeout = 60.0  # Seconds to wait for a request to finish
+first_request_id = 1000
+# Error codes sent with a request id which are only informational (e.g. market data farm connection is OK)
+warning_codes = range(2100, 2200)
+no_data_code = 162  # Error code sent when there is no data in the requested period (also for pacing violations)
+contract_fields = ['conId', 'symbol', 'secType', 'lastTradeDateOrContractMonth', 'strike', 'right', 'multiplier', 'exchange',
+                   'primaryExchange', 'currency', 'localSymbol', 'tradingClass']
+contract_key_fields = ['symbol', 'secType', 'exchange', 'currency', 'lastTradeDateOrContractMonth', 'strike', 'right']
+bar_fields = ['date', 'open', 'high', 'low', 'close', 'volume', 'barCount', 'average']
+
+
+class IBError(Exception):
+    '''
+    Error sent by the IB gateway for a request
+    '''
+    def __init__(self, reqId: int, code: int, message: str):
+        super().__init__('IB error id {} errorcode {} string {}'.format(reqId, code, message))
+        self.reqId = reqId
+        self.code = code
+
+
+def make_contract(symbol: str, sec_type: str, exchange: str, currency: str, **kwargs):
+    '''
+    Returns an IB contract with the given fields (see contract_fields)
+    '''
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = sec_type
+    contract.exchange = exchange
+    contract.currency = currency
+    for field, value in kwargs.items():
+        setattr(contract, field, value)
+    return contract
+
+
+def contract_key(contract: Contract):
+    '''
+    Returns a string identifying a (maybe partially defined) contract, e.g. 'ESTX50|IND|DTB|EUR||0.0|'
+    '''
+    return '|'.join(str(getattr(contract, f)) for f in contract_key_fields)
+
+
+def contract_to_dict(contract: Contract):
+    return {f: getattr(contract, f) for f in contract_fields}
+
+
+def contract_from_dict(fields: dict):
+    contract = Contract()
+    for field, value in fields.items():
+        setattr(contract, field, value)
+    return contract
+
+
+def bar_to_dict(bar: BarData):
+    return {f: getattr(bar, f) for f in bar_fields}
+
+
+def bar_from_dict(fields: dict):
+    bar = BarData()
+    for field, value in fields.items():
+        setattr(bar, field, value)
+    return bar
+
+
+def series_key(contract: Contract, what_to_show: str, bar_size: str):
+    return '{}|{}|{}'.format(contract_key(contract), what_to_show, bar_size)
+
+
+def historical_data_key(contract: Contract, what_to_show: str, bar_size: str, duration: str, end_date_time=''):
+    return '{}|{}|{}'.format(series_key(contract, what_to_show, bar_size), duration, end_date_time)
+
+
+def is_no_data(error: Exception):
+    '''
+    Returns True if an error is the one sent by IB when there is no data in the requested period (the same code is
+    also used for pacing violations)
+    '''
+    return getattr(error, 'code', None) == no_data_code and 'no data' in str(error)
+
+
+class LatencyHistogram:
+    '''
+    Histogram of the time between sending each kind of request and its completion (End callback, error or timeout)
+    '''
+    edges = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0]  # Upper bounds (seconds)
+    outcomes = ['finished', 'error', 'timeout']
+
+    def __init__(self):
+        self.counts = {}  # (kind, outcome) -> list of counts per bucket (the last one for latencies above every edge)
+        self.totals = {}  # (kind, outcome) -> total seconds
+        self.lock = threading.Lock()
+
+    def record(self, kind: str, outcome: str, latency: float):
+        bucket = bisect.bisect_left(self.edges, latency)
+        with self.lock:
+            counts = self.counts.setdefault((kind, outcome), [0] * (len(self.edges) + 1))
+            counts[bucket] += 1
+            self.totals[(kind, outcome)] = self.totals.get((kind, outcome), 0.0) + latency
+
+    def summary(self):
+        '''
+        Returns a dict of (kind, outcome) -> {count, total seconds, mean seconds, counts per bucket}
+        '''
+        with self.lock:
+            return {k: {'count': sum(c), 'total': self.totals[k], 'mean': self.totals[k] / sum(c), 'buckets': list(c)} for k, c in self.counts.items()}
+
+    def format(self):
+        '''
+        Returns the histogram as a text table, with a row per kind of request and outcome
+        '''
+        labels = ['<={:g}s'.format(e) for e in self.edges] + ['>{:g}s'.format(self.edges[-1])]
+        used = [i for i in range(len(labels)) if any(c[i] for c in self.counts.values())]
+        lines = ['{:<18s}{:<10s}{:>7s}{:>10s}{:>10s}'.format('Request', 'Outcome', 'Count', 'Mean (s)', 'Total (s)') + ''.join('{:>9s}'.format(labels[i]) for i in used)]
+        for (kind, outcome), s in sorted(self.summary().items()):
+            lines.append('{:<18s}{:<10s}{:>7d}{:>10.3f}{:>10.2f}'.format(kind, outcome, s['count'], s['mean'], s['total']) +
+                         ''.join('{:>9d}'.format(s['buckets'][i]) for i in used))
+        return '\n'.join(lines)
+
+
+class RequestCompletion:
+    '''
+    Completion of a request, tied to the End callback of its data stream and to the errors sent for its id: the callbacks
+    of the reader thread add results to it, and waiters are released as soon as the stream finishes or fails (instead
+    of waiting until no data arrived for a while). Its latency is recorded in a LatencyHistogram.
+    reqId: Request id
+    kind: Kind of request (e.g. historicalData)
+    key: Key of the request (e.g. see historical_data_key)
+    histogram: LatencyHistogram where the latency of the request is recorded, if any
+    '''
+    def __init__(self, reqId: int, kind: str, key: str, histogram=None):
+        self.reqId = reqId
+        self.kind = kind
+        self.key = key
+        self.histogram = histogram
+        self.items = []
+        self.error = None
+        self.outcome = None
+        self.callbacks = []  # Received callbacks (only kept when recording)
+        self.sent = time.perf_counter()
+        self.done = threading.Event()
+
+    def add(self, item):
+        self.items.append(item)
+
+    def finish(self):
+        self._complete('finished', None)
+
+    def fail(self, error: Exception):
+        self._complete('error', error)
+
+    def timeout(self):
+        '''
+        Gives up waiting for the request (if it has not finished yet)
+        '''
+        self._complete('timeout', None)
+
+    def _complete(self, outcome: str, error):
+        if self.outcome is not None:
+            return
+        self.outcome = outcome
+        self.error = error
+        if self.histogram is not None:
+            self.histogram.record(self.kind, outcome, time.perf_counter() - self.sent)
+        self.done.set()
+        self._notify()
+
+    def _notify(self):
+        pass
+
+    def wait(self, timeout=default_timeout):
+        '''
+        Blocks until the request finishes, fails or times out
+        returns:
+            list of received items (only the ones received before the timeout if it timed out)
+        raises:
+            IBError if the gateway sent an error for the request
+        '''
+        if not self.done.wait(timeout):
+            self.timeout()
+        if self.error is not None:
+            raise self.error
+        return self.items
+
+
+class IBRequest(RequestCompletion):
+    '''
+    Completion of a request awaited in an event loop: its future is resolved in the loop when the request completes
+    '''
+    def __init__(self, reqId: int, loop, kind: str, key: str, histogram=None):
+        super().__init__(reqId, kind, key, histogram)
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def _notify(self):
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if self.future.done():
+            return
+        if self.error is not None:
+            self.future.set_exception(self.error)
+        elif self.outcome == 'timeout':
+            self.future.cancel()
+        else:
+            self.future.set_result(self.items)
+
+
+class AsyncIBWrapper(EWrapper):
+    '''
+    Routes the callbacks of the IB gateway, and the errors sent for a request id, to the request (see RequestCompletion)
+    with the same id
+    '''
+    def __init__(self):
+        EWrapper.__init__(self)
+        self.requests = {}
+        self.latency = LatencyHistogram()
+        self.recording = None  # If a dict, callbacks of finished requests are recorded in it (see save_recording)
+        self.connected = None
+
+    def _record(self, reqId: int, name: str, *args):
+        request = self.requests.get(reqId)
+        if request is not None and self.recording is not None:
+            request.callbacks.append([name] + list(args))
+        return request
+
+    def nextValidId(self, orderId: int):
+        if self.connected is not None:
+            self.connected.finish()
+
+    def error(self, reqId, errorCode: int, errorString: str, *args):
+        request = self.requests.get(reqId)
+        if request is None or errorCode in warning_codes:
+            if errorCode not in warning_codes:
+                print('WARNING: IB error id {} errorcode {} string {}'.format(reqId, errorCode, errorString))
+            return
+        self._record(reqId, 'error', errorCode, errorString)
+        request.fail(IBError(reqId, errorCode, errorString))
+
+    def contractDetails(self, reqId: int, contractDetails: ContractDetails):
+        request = self._record(reqId, 'contractDetails', contract_to_dict(contractDetails.contract))
+        if request is not None:
+            request.add(contractDetails)
+
+    def contractDetailsEnd(self, reqId: int):
+        request = self._record(reqId, 'contractDetailsEnd')
+        if request is not None:
+            request.finish()
+
+    def historicalData(self, reqId: int, bar: BarData):
+        request = self._record(reqId, 'historicalData', bar_to_dict(bar))
+        if request is not None:
+            request.add((bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume))
+
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        request = self._record(reqId, 'historicalDataEnd', start, end)
+        if request is not None:
+            request.finish()
+
+
+class HistoricalDataPacer:
+    '''
+    Schedules historical data requests within the IB pacing limits, so that the gateway does not reject them:
+    - no more than max_requests requests within any window (60 every 10 minutes)
+    - no identical requests (same contract, data type, bar size and duration) within identical_interval seconds
+    - no more than max_same_contract requests for the same contract and data type within same_contract_window seconds
+    - no more than max_in_flight requests waiting for data at the same time
+    '''
+    def __init__(self, max_requests=60, window=600.0, identical_interval=15.0, max_same_contract=6, same_contract_window=2.0,
+                 max_in_flight=50, clock=time.monotonic):
+        self.max_requests = max_requests
+        self.window = window
+        self.identical_interval = identical_interval
+        self.max_same_contract = max_same_contract
+        self.same_contract_window = same_contract_window
+        self.clock = clock
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.sent = deque()
+        self.last_identical = {}
+        self.same_contract = {}
+        self.waits = 0
+        self.waited = 0.0
+
+    def delay(self, request_key: str, contract_key: str, now: float):
+        '''
+        Returns how many seconds a request has to wait before being sent
+        '''
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        wait = 0.0
+        if len(self.sent) >= self.max_requests:
+            wait = self.sent[0] + self.window - now
+        if request_key in self.last_identical:
+            wait = max(wait, self.last_identical[request_key] + self.identical_interval - now)
+        times = self.same_contract.get(contract_key)
+        if times is not None and len(times) >= self.max_same_contract:
+            wait = max(wait, times[-self.max_same_contract] + self.same_contract_window - now)
+        return wait
+
+    async def acquire(self, request_key: str, contract_key: str):
+        '''
+        Waits until a request can be sent, and records it as sent
+        '''
+        while True:
+            now = self.clock()
+            wait = self.delay(request_key, contract_key, now)
+            if wait <= 0:
+                break
+            self.waits += 1
+            self.waited += wait
+            await asyncio.sleep(wait)
+        self.sent.append(now)
+        self.last_identical[request_key] = now
+        self.same_contract.setdefault(contract_key, deque(maxlen=self.max_same_contract)).append(now)
+
+    def record_sent(self, request_key: str, contract_key: str):
+        '''
+        Records the time when the request acquired last has actually been sent, as the gateway counts it from then
+        (the thread reading the gateway messages may have delayed it)
+        '''
+        now = self.clock()
+        self.sent[-1] = now
+        self.last_identical[request_key] = now
+        self.same_contract[contract_key][-1] = now
+
+
+def _contract_details(contract: Contract):
+    details = ContractDetails()
+    details.contract = contract
+    return details
+
+
+class AsyncIBClient:
+    '''
+    Asyncio client of the IB gateway
+    gateway: Object with the EClient interface used to send requests. Default: a new EClient (a fake gateway replaying
+             recorded callbacks can be used instead, see ib_fake_gateway.py)
+    pacer: Scheduler of historical data requests. Default: HistoricalDataPacer with IB limits
+    contract_cache: Cache of resolved contracts (see ib_contract_cache.ContractCache) looked up before requesting
+                    contract details. Default: none
+    '''
+    def __init__(self, gateway=None, pacer=None, contract_cache=None):
+        self.wrapper = AsyncIBWrapper()
+        self.gateway = gateway if gateway is not None else EClient(self.wrapper)
+        self.gateway.wrapper = self.wrapper
+        self.pacer = pacer if pacer is not None else HistoricalDataPacer()
+        self.contract_cache = contract_cache
+        self.request_ids = itertools.count(first_request_id)
+        self.thread = None
+
+    @property
+    def latency(self):
+        '''
+        LatencyHistogram of the requests sent by the client
+        '''
+        return self.wrapper.latency
+
+    async def connect(self, host: str, port: int, client_id: int, timeout=10.0):
+        '''
+        Connects to the gateway and starts the thread reading its messages
+        '''
+        loop = asyncio.get_running_loop()
+        self.wrapper.connected = IBRequest(-1, loop, 'connect', '')
+        await loop.run_in_executor(None, self.gateway.connect, host, port, client_id)
+        self.thread = threading.Thread(target=self.gateway.run, daemon=True)
+        self.thread.start()
+        await asyncio.wait_for(self.wrapper.connected.future, timeout)
+
+    def disconnect(self):
+        self.gateway.disconnect()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def start_recording(self, **info):
+        '''
+        Starts recording the callbacks of every finished request, so that they can be replayed by a fake gateway
+        info: Other entries saved with the recording (e.g. today, the day it was made)
+        '''
+        self.wrapper.recording = dict(info, contractDetails={}, historicalData={})
+
+    def save_recording(self, recording_path: str):
+        with open(recording_path, 'w') as f:
+            json.dump(self.wrapper.recording, f, indent=1, sort_keys=True)
+
+    def _start_request(self, kind: str, key: str):
+        request = IBRequest(next(self.request_ids), asyncio.get_running_loop(), kind, key, self.wrapper.latency)
+        self.wrapper.requests[request.reqId] = request
+        return request
+
+    async def _wait(self, request: IBRequest, timeout: float):
+        try:
+            return await asyncio.wait_for(asyncio.shield(request.future), timeout)
+        except asyncio.TimeoutError:
+            request.timeout()
+            raise
+        finally:
+            self.wrapper.requests.pop(request.reqId, None)
+            # Requests without data are recorded as well, so that replaying them gives the same result
+            if self.wrapper.recording is not None and request.future.done() and not request.future.cancelled() and \
+                    (request.future.exception() is None or is_no_data(request.future.exception())):
+                self.wrapper.recording[request.kind][request.key] = request.callbacks
+
+    async def get_contract_details(self, contract: Contract, timeout=default_timeout):
+        '''
+        Returns the list of ContractDetails matching a (maybe partially defined) contract (only their contract is
+        set when they are found in the contract cache)
+        '''
+        if self.contract_cache is not None:
+            contracts = self.contract_cache.get(contract)
+            if contracts is not None:
+                return [_contract_details(c) for c in contracts]
+        request = self._start_request('contractDetails', contract_key(contract))
+        self.gateway.reqContractDetails(request.reqId, contract)
+        details = await self._wait(request, timeout)
+        if self.contract_cache is not None and details:
+            self.contract_cache.put(contract, [d.contract for d in details])
+        return details
+
+    async def resolve_contract(self, contract: Contract, timeout=default_timeout):
+        '''
+        From a partially defined contract, returns a fully defined one (the first one matching it)
+        '''
+        details = await self.get_contract_details(contract, timeout)
+        if not details:
+            raise IBError(-1, 200, 'No security definition has been found for {}'.format(contract_key(contract)))
+        if len(details) > 1:
+            print('WARNING: got multiple contracts for {}, using first one'.format(contract_key(contract)))
+        return details[0].contract
+
+    async def resolve_contracts(self, contracts: dict, timeout=default_timeout):
+        '''
+        Resolves a set of partially defined contracts concurrently
+        contracts: Dict of name -> (maybe partially defined) contract
+        returns:
+            dict of name -> fully defined contract, or the exception raised while resolving it
+        '''
+        results = await asyncio.gather(*[self.resolve_contract(c, timeout) for c in contracts.values()], return_exceptions=True)
+        return dict(zip(contracts.keys(), results))
+
+    async def resolve_option_chain(self, symbol: str, exchange: str, currency: str, expiries=None, timeout=default_timeout):
+        '''
+        Returns the fully defined contracts of every option (all strikes and rights) of an underlying, requesting the
+        options of each expiry concurrently
+        expiries: Expiries (YYYYMMDD or YYYYMM) whose options are resolved. Default: every expiry, in a single request
+        '''
+        chains = [make_contract(symbol, 'OPT', exchange, currency, lastTradeDateOrContractMonth=e) for e in expiries or ['']]
+        details = await asyncio.gather(*[self.get_contract_details(c, timeout) for c in chains])
+        return [d.contract for chain in details for d in chain]
+
+    async def get_historical_data(self, contract: Contract, what_to_show='OPTION_IMPLIED_VOLATILITY', duration='1 Y',
+                                  bar_size='1 day', end_date_time='', use_rth=1, timeout=default_timeout):
+        '''
+        Returns the historical bars of a contract, as a list of (date, open, high, low, close, volume) tuples
+        contract: IB contract (resolved, see resolve_contract)
+        what_to_show: Type of data (TRADES, MIDPOINT, OPTION_IMPLIED_VOLATILITY, HISTORICAL_VOLATILITY...)
+        duration: How far back from end_date_time (e.g. '1 Y', '10 D')
+        bar_size: Size of the bars (e.g. '1 day')
+        end_date_time: End of the requested period ('yyyymmdd hh:mm:ss'). Default: now
+        use_rth: 1 to only get data within regular trading hours
+        '''
+        key = historical_data_key(contract, what_to_show, bar_size, duration, end_date_time)
+        async with self.pacer.in_flight:
+            pacing_keys = key, '{}|{}'.format(contract_key(contract), what_to_show)
+            await self.pacer.acquire(*pacing_keys)
+            request = self._start_request('historicalData', key)
+            self.gateway.reqHistoricalData(request.reqId, contract, end_date_time, duration, bar_size, what_to_show, use_rth, 1, False, [])
+            self.pacer.record_sent(*pacing_keys)
+            try:
+                return await self._wait(request, timeout)
+            except asyncio.TimeoutError:
+                self.gateway.cancelHistoricalData(request.reqId)
+                raise
+
+    async def download_historical_data(self, contracts: dict, **kwargs):
+        '''
+        Resolves a set of contracts and downloads their historical data concurrently
+        contracts: Dict of name -> (maybe partially defined) contract
+        kwargs: Arguments of get_historical_data
+        returns:
+            dict of name -> list of bars, or the exception raised while resolving or downloading it
+        '''
+        async def download(contract):
+            return await self.get_historical_data(await self.resolve_contract(contract), **kwargs)
+
+        results = await asyncio.gather(*[download(c) for c in contracts.values()], return_exceptions=True)
+        return dict(zip(contracts.keys(), results))
@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import json
+import time
+import ib_client
+
+
+# Persistent cache of the contracts resolved by the IB gateway (see ib_client.AsyncIBClient.get_contract_details),
+# one json file per symbol:
+#     cache/ib_contracts/<SYMBOL>.json -> contract key (see ib_client.contract_key) -> {fetched: seconds since epoch,
+#                                                                                       contracts: [contract fields]}
+# Definitions of indices and options rarely change, so entries are used for ttl seconds before being requested again.
+# When a partially defined contract (e.g. every option of an expiry) resolves to several contracts, each one is also
+# stored under its own key, so resolving a whole option chain once is enough to resolve any of its options offline.
+contract_cache_folder = path.join('cache', 'ib_contracts')
+default_ttl = 7 * 24 * 3600.0
+
+
+class ContractCache:
+    '''
+    root: Cache folder
+    ttl: Seconds during which stored contracts are used
+    clock: Function returning the current time (seconds since epoch)
+    '''
+    def __init__(self, root=contract_cache_folder, ttl=default_ttl, clock=time.time):
+        self.root = root
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}  # Symbol -> contract key -> entry (loaded on first use)
+        self.dirty = set()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stored': 0, 'invalidated': 0}
+
+    def _symbol_path(self, symbol: str):
+        return path.join(self.root, '{}.json'.format(symbol))
+
+    def _symbol_entries(self, symbol: str):
+        entries = self.entries.get(symbol)
+        if entries is None:
+            entries = {}
+            if path.isfile(self._symbol_path(symbol)):
+                with open(self._symbol_path(symbol), 'r') as f:
+                    entries = json.load(f)
+            self.entries[symbol] = entries
+        return entries
+
+    def get(self, contract):
+        '''
+        Returns the fully defined contracts matching a (maybe partially defined) contract, or None if they are not
+        stored or have expired
+        '''
+        entry = self._symbol_entries(contract.symbol).get(ib_client.contract_key(contract))
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if self.clock() - entry['fetched'] > self.ttl:
+            self.stats['expired'] += 1
+            return None
+        self.stats['hits'] += 1
+        return [ib_client.contract_from_dict(c) for c in entry['contracts']]
+
+    def put(self, contract, contracts: list):
+        '''
+        Stores the fully defined contracts matching a (maybe partially defined) contract, and each one of them under
+        its own key
+        '''
+        now = self.clock()
+        entries = self._symbol_entries(contract.symbol)
+        by_key = {}
+        for c in contracts:
+            by_key.setdefault(ib_client.contract_key(c), []).append(ib_client.contract_to_dict(c))
+        by_key[ib_client.contract_key(contract)] = [ib_client.contract_to_dict(c) for c in contracts]
+        for key, resolved in by_key.items():
+            entries[key] = {'fetched': now, 'contracts': resolved}
+        self.stats['stored'] += len(by_key)
+        self.dirty.add(contract.symbol)
+
+    def invalidate(self, symbol=None, contract=None):
+        '''
+        Removes the stored contracts of a (maybe partially defined) contract, of every contract of a symbol, or of
+        every symbol if none is given
+        returns:
+            number of removed entries
+        '''
+        if contract is not None:
+            removed = int(self._symbol_entries(contract.symbol).pop(ib_client.contract_key(contract), None) is not None)
+            self.dirty.add(contract.symbol)
+        else:
+            symbols = set(self.entries)
+            if path.isdir(self.root):
+                symbols |= set(f[:-len('.json')] for f in os.listdir(self.root) if f.endswith('.json'))
+            if symbol is not None:
+                symbols = [symbol]
+            removed = 0
+            for s in symbols:
+                removed += len(self._symbol_entries(s))
+                self.entries[s] = {}
+                self.dirty.add(s)
+        self.stats['invalidated'] += removed
+        return removed
+
+    def save(self):
+        '''
+        Writes the symbols changed since the last save
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        for symbol in sorted(self.dirty):
+            # Write into a temporary file first, so that readers never see half written files
+            symbol_path = self._symbol_path(symbol)
+            with open(symbol_path + '.tmp', 'w') as f:
+                json.dump(self.entries[symbol], f, indent=1, sort_keys=True)
+            os.replace(symbol_path + '.tmp', symbol_path)
+        self.dirty = set()
+
+    def format_stats(self):
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['expired']
+        return 'Contract cache: {} hits, {} misses, {} expired ({:.0f}% hit rate), {} stored, {} invalidated'.format(
+            self.stats['hits'], self.stats['misses'], self.stats['expired'], 100.0 * self.stats['hits'] / lookups if lookups else 0.0,
+            self.stats['stored'], self.stats['invalidated'])
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import heapq
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime, date
+from ibapi.contract import ContractDetails
+import ib_client
+import ib_bar_store
+
+
+# Local stand-in for the IB gateway, with the EClient interface used by ib_client.AsyncIBClient. It replays callbacks
+# recorded from a real gateway (see AsyncIBClient.start_recording), in json files like:
+#     {"contractDetails": {<contract key>: [["contractDetails", {contract fields}], ["contractDetailsEnd"]]},
+#      "historicalData": {<historical data key>: [["historicalData", {bar fields}], ..., ["historicalDataEnd", start, end]]},
+#      "today": YYYYMMDD (day the recording was made, optional)}
+# Responses are sent by the thread running run() after a given latency, and historical data requests beyond the
+# pacing limits are rejected as the real gateway does, so that clients can be tested without a gateway nor network.
+# Historical data requests not recorded as such are answered with the bars recorded for the same contract, data type
+# and bar size within the requested period (so a recording can be replayed on any day, from any bar store), and raise
+# a KeyError if nothing was recorded for them, instead of being answered as if there was no data.
+pacing_violation_code = 162
+no_security_code = 200
+no_data_message = 'Historical Market Data Service error message:HMDS query returned no data'
+
+
+def load_recording(recording_path: str):
+    with open(recording_path, 'r') as f:
+        return json.load(f)
+
+
+class FakeGateway:
+    '''
+    recording: Recorded callbacks (see load_recording)
+    latency: Seconds between a request and its first callback
+    end_latency: Additional seconds before the last callback of a request (e.g. historicalDataEnd)
+    bar_latency: Additional seconds per bar sent for a historical data request (big requests take longer)
+    max_requests, window, identical_interval: Pacing limits of historical data requests (see ib_client.HistoricalDataPacer)
+    '''
+    def __init__(self, recording: dict, latency=0.05, end_latency=0.0, max_requests=60, window=600.0, identical_interval=15.0, bar_latency=0.0):
+        self.recording = recording
+        self.series = {}  # Series key (see ib_client.series_key) -> bar date -> recorded bar fields
+        for key, callbacks in recording.get('historicalData', {}).items():
+            bars = self.series.setdefault(key.rsplit('|', 2)[0], {})
+            bars.update((c[1]['date'], c[1]) for c in callbacks if c[0] == 'historicalData')
+        self.today = recording.get('today') or date.today().strftime(ib_bar_store.date_format)
+        self.latency = latency
+        self.end_latency = end_latency
+        self.bar_latency = bar_latency
+        self.max_requests = max_requests
+        self.window = window
+        self.identical_interval = identical_interval
+        self.wrapper = None
+        self.connected = False
+        self.scheduled = []  # Heap of (due time, sequence, request id, callback name, arguments)
+        self.sequence = 0
+        self.cancelled = set()
+        self.condition = threading.Condition()
+        self.sent = deque()
+        self.last_identical = {}
+        self.stats = {'requests': 0, 'pacing_violations': 0, 'max_in_flight': 0, 'bars': 0, 'contract_requests': 0}
+        self.in_flight = set()
+
+    def connect(self, host: str, port: int, clientId: int):
+        self.connected = True
+        self._schedule(None, [['nextValidId', 1]], 0.0)
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        with self.condition:
+            self.connected = False
+            self.condition.notify()
+
+    def _schedule(self, reqId, callbacks: list, latency: float):
+        now = time.monotonic()
+        with self.condition:
+            for i, callback in enumerate(callbacks):
+                due = now + latency + (self.end_latency if i == len(callbacks) - 1 else 0.0)
+                heapq.heappush(self.scheduled, (due, self.sequence, reqId, callback[0], callback[1:]))
+                self.sequence += 1
+            if reqId is not None:
+                self.in_flight.add(reqId)
+                self.stats['max_in_flight'] = max(self.stats['max_in_flight'], len(self.in_flight))
+            self.condition.notify()
+
+    def run(self):
+        '''
+        Sends the scheduled callbacks to the wrapper when they are due, until disconnected
+        '''
+        while True:
+            with self.condition:
+                while self.connected and (not self.scheduled or self.scheduled[0][0] > time.monotonic()):
+                    self.condition.wait(self.scheduled[0][0] - time.monotonic() if self.scheduled else None)
+                if not self.connected:
+                    return
+                due, _, reqId, name, args = heapq.heappop(self.scheduled)
+                if reqId in self.cancelled:
+                    continue
+                if name in ['contractDetailsEnd', 'historicalDataEnd', 'error']:
+                    self.in_flight.discard(reqId)
+            self._send(reqId, name, args)
+
+    def _send(self, reqId, name: str, args: list):
+        if name == 'nextValidId':
+            self.wrapper.nextValidId(*args)
+        elif name == 'contractDetails':
+            details = ContractDetails()
+            details.contract = ib_client.contract_from_dict(args[0])
+            self.wrapper.contractDetails(reqId, details)
+        elif name == 'historicalData':
+            self.wrapper.historicalData(reqId, ib_client.bar_from_dict(args[0]))
+        else:
+            getattr(self.wrapper, name)(reqId, *args)
+
+    def reqContractDetails(self, reqId: int, contract):
+        self.stats['contract_requests'] += 1
+        callbacks = self.recording.get('contractDetails', {}).get(ib_client.contract_key(contract))
+        if callbacks is None:
+            callbacks = [['error', no_security_code, 'No security definition has been found for the request']]
+        self._schedule(reqId, callbacks, self.latency)
+
+    def reqHistoricalData(self, reqId: int, contract, endDateTime: str, durationStr: str, barSizeSetting: str, whatToShow: str,
+                          useRTH: int, formatDate: int, keepUpToDate: bool, chartOptions: list):
+        self.stats['requests'] += 1
+        now = time.monotonic()
+        key = ib_client.historical_data_key(contract, whatToShow, barSizeSetting, durationStr, endDateTime)
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        if len(self.sent) >= self.max_requests or now - self.last_identical.get(key, -self.identical_interval) < self.identical_interval:
+            self.stats['pacing_violations'] += 1
+            callbacks = [['error', pacing_violation_code, 'Historical Market Data Service error message:Historical data request pacing violation']]
+        else:
+            self.sent.append(now)
+            self.last_identical[key] = now
+            callbacks = self.historical_callbacks(contract, endDateTime, durationStr, barSizeSetting, whatToShow)
+            if callbacks is None:
+                callbacks = [['error', pacing_violation_code, no_data_message]]
+        bars = sum(c[0] == 'historicalData' for c in callbacks)
+        self.stats['bars'] += bars
+        self._schedule(reqId, callbacks, self.latency + self.bar_latency * bars)
+
+    def historical_callbacks(self, contract, endDateTime: str, durationStr: str, barSizeSetting: str, whatToShow: str):
+        '''
+        Returns the callbacks answering a historical data request, or None if there is no data for it
+        (see the replay rules above)
+        '''
+        callbacks = self.recording.get('historicalData', {}).get(
+            ib_client.historical_data_key(contract, whatToShow, barSizeSetting, durationStr, endDateTime))
+        if callbacks is not None:
+            return callbacks
+        key = ib_client.series_key(contract, whatToShow, barSizeSetting)
+        series = self.series.get(key)
+        if series is None:
+            raise KeyError('Historical data not recorded: {}'.format(key))
+        end = endDateTime[:8] if endDateTime else self.today
+        start = ib_bar_store.duration_start(durationStr, datetime.strptime(end, ib_bar_store.date_format).date()).strftime(ib_bar_store.date_format)
+        dates = sorted(d for d in series if start <= d[:8] <= end)
+        if not dates:
+            return None
+        return [['historicalData', series[d]] for d in dates] + [['historicalDataEnd', dates[0], dates[-1]]]
+
+    def cancelHistoricalData(self, reqId: int):
+        with self.condition:
+            self.cancelled.add(reqId)
+            self.in_flight.discard(reqId)
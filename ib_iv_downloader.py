@@ -18,76 +18,41 @@
 #
 # Now I'll try and replicate the historical data example
 
-from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
 from ibapi.contract import Contract as IBcontract
 from threading import Thread
 import queue
 import datetime
+import asyncio
+import itertools
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+import ib_client
+import ib_bar_store
+import ib_contract_cache
+from ib_fake_gateway import FakeGateway, load_recording
 
-DEFAULT_HISTORIC_DATA_ID=50
-DEFAULT_GET_CONTRACT_ID=43
+# Underlying indices whose data is downloaded: ticker -> (symbol, security type, exchange, currency)
+universe = {'ESTX50': ('ESTX50', 'IND', 'DTB', 'EUR'), 'DAX': ('DAX', 'IND', 'DTB', 'EUR')}
 
-## marker for when queue is finished
-FINISHED = object()
-STARTED = object()
-TIME_OUT = object()
+## default time to wait for a request to finish (its End callback or an error for its id)
+MAX_WAIT_SECONDS = 10
 
-class finishableQueue(object):
 
-    def __init__(self, queue_to_finish):
-
-        self._queue = queue_to_finish
-        self.status = STARTED
-
-    def get(self, timeout):
-        """
-        Returns a list of queue elements once timeout is finished, or a FINISHED flag is received in the queue
-
-        :param timeout: how long to wait before giving up
-        :return: list of queue elements
-        """
-        contents_of_queue=[]
-        finished=False
-
-        while not finished:
-            try:
-                current_element = self._queue.get(timeout=timeout)
-                if current_element is FINISHED:
-                    finished = True
-                    self.status = FINISHED
-                else:
-                    contents_of_queue.append(current_element)
-                    ## keep going and try and get more data
-
-            except queue.Empty:
-                ## If we hit a time out it's most probable we're not getting a finished element any time soon
-                ## give up and return what we have
-                finished = True
-                self.status = TIME_OUT
-
-
-        return contents_of_queue
-
-    def timed_out(self):
-        return self.status is TIME_OUT
-
-
-
-
-
-class TestWrapper(EWrapper):
+class TestWrapper(ib_client.AsyncIBWrapper):
     """
     The wrapper deals with the action coming back from the IB gateway or TWS instance
 
-    We override methods in EWrapper that will get called when this action happens, like currentTime
+    The data callbacks, the End callbacks and the errors sent for a request id are routed to the completion of the
+    request with the same id (see ib_client.RequestCompletion), so a request returns as soon as its stream finishes or fails
 
-    Extra methods are added as we need to store the results in this object
+    Errors not related to a pending request are kept in a queue
     """
 
     def __init__(self):
-        self._my_contract_details = {}
-        self._my_historic_data_dict = {}
+        ib_client.AsyncIBWrapper.__init__(self)
 
     ## error handling code
     def init_error(self):
@@ -107,119 +72,95 @@ class TestWrapper(EWrapper):
         an_error_if=not self._my_errors.empty()
         return an_error_if
 
-    def error(self, id, errorCode, errorString):
+    def error(self, id, errorCode, errorString, *args):
         ## Overriden method
+        if id in self.requests and errorCode not in ib_client.warning_codes:
+            ib_client.AsyncIBWrapper.error(self, id, errorCode, errorString)
+            return
         errormsg = "IB error id %d errorcode %d string %s" % (id, errorCode, errorString)
         self._my_errors.put(errormsg)
 
 
-    ## get contract details code
-    def init_contractdetails(self, reqId):
-        contract_details_queue = self._my_contract_details[reqId] = queue.Queue()
-
-        return contract_details_queue
-
-    def contractDetails(self, reqId, contractDetails):
-        ## overridden method
-
-        if reqId not in self._my_contract_details.keys():
-            self.init_contractdetails(reqId)
-
-        self._my_contract_details[reqId].put(contractDetails)
-
-    def contractDetailsEnd(self, reqId):
-        ## overriden method
-        if reqId not in self._my_contract_details.keys():
-            self.init_contractdetails(reqId)
-
-        self._my_contract_details[reqId].put(FINISHED)
-
-    ## Historic data code
-    def init_historicprices(self, tickerid):
-        historic_data_queue = self._my_historic_data_dict[tickerid] = queue.Queue()
-
-        return historic_data_queue
-
-
-    def historicalData(self, tickerid , date:str, open:float, high:float,
-                       low:float, close:float, volume:int, barCount:int,
-                        WAP:float, hasGaps:int):
-
-        ## Overriden method
-        ## Note I'm choosing to ignore barCount, WAP and hasGaps but you could use them if you like
-        bardata=(date, open, high, low, close, volume)
-
-        historic_data_dict=self._my_historic_data_dict
-
-        ## Add on to the current data
-        if tickerid not in historic_data_dict.keys():
-            self.init_historicprices(tickerid)
-
-        historic_data_dict[tickerid].put(bardata)
-
-    def historicalDataEnd(self, tickerid, start:str, end:str):
-        ## overriden method
-
-        if tickerid not in self._my_historic_data_dict.keys():
-            self.init_historicprices(tickerid)
-
-        self._my_historic_data_dict[tickerid].put(FINISHED)
-
-
-
-
 class TestClient(EClient):
     """
     The client method
 
     We don't override native methods, but instead call them from our own wrappers
     """
-    def __init__(self, wrapper):
+    def __init__(self, wrapper, contract_cache=None):
         ## Set up with a wrapper inside
         EClient.__init__(self, wrapper)
-
-
-    def resolve_ib_contract(self, ibcontract, reqId=DEFAULT_GET_CONTRACT_ID):
+        self._request_ids = itertools.count(ib_client.first_request_id)
+        ## Resolved contracts are looked up here before requesting them (see ib_contract_cache.ContractCache)
+        self.contract_cache = contract_cache
+
+    def _start_request(self, kind, key, reqId=None):
+        ## Register the completion before sending the request, so no callback can be missed
+        if reqId is None:
+            reqId = next(self._request_ids)
+        request = ib_client.RequestCompletion(reqId, kind, key, self.wrapper.latency)
+        self.wrapper.requests[reqId] = request
+
+        return request
+
+    def _wait(self, request, timeout):
+        ## Wait until the request finishes or fails, or the timeout is over
+        try:
+            return request.wait(timeout)
+        except ib_client.IBError as e:
+            print(e)
+            return request.items
+        finally:
+            self.wrapper.requests.pop(request.reqId, None)
+            while self.wrapper.is_error():
+                print(self.get_error())
+
+    def resolve_ib_contract(self, ibcontract, reqId=None, timeout=MAX_WAIT_SECONDS):
 
         """
         From a partially formed contract, returns a fully fledged version
 
+        :param timeout: how long to wait for the contract details before giving up
         :returns fully resolved IB contract
         """
 
-        ## Make a place to store the data we're going to return
-        contract_details_queue = finishableQueue(self.init_contractdetails(reqId))
+        if self.contract_cache is not None:
+            cached_contracts = self.contract_cache.get(ibcontract)
+            if cached_contracts:
+                if len(cached_contracts)>1:
+                    print("got multiple contracts using first one")
+                return cached_contracts[0]
 
-        print("Getting full contract details from the server... ")
+        request = self._start_request('contractDetails', ib_client.contract_key(ibcontract), reqId)
 
-        self.reqContractDetails(reqId, ibcontract)
+        print("Getting full contract details from the server... ")
 
-        ## Run until we get a valid contract(s) or get bored waiting
-        MAX_WAIT_SECONDS = 10
-        new_contract_details = contract_details_queue.get(timeout = MAX_WAIT_SECONDS)
+        self.reqContractDetails(request.reqId, ibcontract)
 
-        while self.wrapper.is_error():
-            print(self.get_error())
+        new_contract_details = self._wait(request, timeout)
 
-        if contract_details_queue.timed_out():
-            print("Exceeded maximum wait for wrapper to confirm finished - seems to be normal behaviour")
+        if request.outcome == 'timeout':
+            print("Exceeded maximum wait of %d seconds for contract details" % timeout)
 
         if len(new_contract_details)==0:
             print("Failed to get additional contract details: returning unresolved contract")
             return ibcontract
 
+        if self.contract_cache is not None:
+            self.contract_cache.put(ibcontract, [details.contract for details in new_contract_details])
+
         if len(new_contract_details)>1:
             print("got multiple contracts using first one")
 
         new_contract_details=new_contract_details[0]
 
-        resolved_ibcontract=new_contract_details.summary
+        resolved_ibcontract=new_contract_details.contract
 
         return resolved_ibcontract
 
 
     def get_IB_historical_data(self, ibcontract, durationStr="1 Y", barSizeSetting="1 day",
-                               tickerid=DEFAULT_HISTORIC_DATA_ID):
+                               tickerid=None, timeout=MAX_WAIT_SECONDS):
 
         """
         Returns historical prices for a contract, up to today
@@ -227,50 +168,46 @@ class TestClient(EClient):
 
         ibcontract is a Contract
 
+        :param timeout: how long to wait for the data before giving up (the request is then cancelled)
         :returns list of prices in 4 tuples: Open high low close volume
         """
 
-
-        ## Make a place to store the data we're going to return
-        historic_data_queue = finishableQueue(self.init_historicprices(tickerid))
+        whatToShow = 'TRADES' #"OPTION_IMPLIED_VOLATILITY"
+        endDateTime = datetime.datetime.today().strftime("%Y%m%d %H:%M:%S %Z")
+        request = self._start_request('historicalData', ib_client.historical_data_key(ibcontract, whatToShow, barSizeSetting, durationStr, endDateTime),
+                                      tickerid)
 
         # Request some historical data. Native method in EClient
         self.reqHistoricalData(
-            reqId=tickerid,  # tickerId,
+            reqId=request.reqId,  # tickerId,
             contract=ibcontract,  # contract,
-            endDateTime=datetime.datetime.today().strftime("%Y%m%d %H:%M:%S %Z"),  # endDateTime,
+            endDateTime=endDateTime,  # endDateTime,
             durationStr=durationStr,  # durationStr,
             barSizeSetting=barSizeSetting,  # barSizeSetting,
-            whatToShow='TRADES', #"OPTION_IMPLIED_VOLATILITY",  # whatToShow,
+            whatToShow=whatToShow,  # whatToShow,
             useRTH=1,  # useRTH,
             formatDate=1,  # formatDate
             keepUpToDate= False,
             chartOptions=[] ## chartoptions not used
         )
 
-        ## Wait until we get a completed data, an error, or get bored waiting
-        MAX_WAIT_SECONDS = 10
-        print("Getting historical data from the server... could take %d seconds to complete " % MAX_WAIT_SECONDS)
-
-        historic_data = historic_data_queue.get(timeout = MAX_WAIT_SECONDS)
-
-        while self.wrapper.is_error():
-            print(self.get_error())
-
-        if historic_data_queue.timed_out():
-            print("Exceeded maximum wait for wrapper to confirm finished - seems to be normal behaviour")
+        ## Wait until we get a completed data, an error, or the timeout is over
+        print("Getting historical data from the server... could take up to %d seconds to complete " % timeout)
 
-        self.cancelHistoricalData(tickerid)
+        historic_data = self._wait(request, timeout)
 
+        if request.outcome == 'timeout':
+            print("Exceeded maximum wait of %d seconds for historical data: cancelling the request" % timeout)
+            self.cancelHistoricalData(request.reqId)
 
         return historic_data
 
 
 
 class TestApp(TestWrapper, TestClient):
-    def __init__(self, ipaddress, portid, clientid):
+    def __init__(self, ipaddress, portid, clientid, contract_cache=None):
         TestWrapper.__init__(self)
-        TestClient.__init__(self, wrapper=self)
+        TestClient.__init__(self, wrapper=self, contract_cache=contract_cache)
         self.init_error()
         self.connect(ipaddress, portid, clientid)
 
@@ -280,55 +217,99 @@ class TestApp(TestWrapper, TestClient):
         setattr(self, "_thread", thread)
 
 
-#if __name__ == '__main__':
-
-app = TestApp("127.0.0.1", 4001, 1)
-
-# Test with eurodollar futures
-
-ibcontract = IBcontract()
-ibcontract.secType = "CASH"
-ibcontract.symbol="EUR"
-ibcontract.exchange="IDEALPRO"
-ibcontract.currency = "GBP"
-
-resolved_ibcontract=app.resolve_ib_contract(ibcontract)
-
-historic_data = app.get_IB_historical_data(resolved_ibcontract)
-
-print('GE:')
-print(historic_data)
-print('')
-
-'''
-# Test with ESTX50
-
-ibcontract = IBcontract()
-ibcontract.symbol="ESTX50"
-ibcontract.secType = "IND"
-ibcontract.currency = "EUR"
-ibcontract.exchange="DTB"
-
-resolved_ibcontract=app.resolve_ib_contract(ibcontract)
-
-historic_data = app.get_IB_historical_data(resolved_ibcontract)
-
-print('ESTX50:')
-print(historic_data)
-print('')
-
-# Test with DAX
-ibcontract = IBcontract()
-ibcontract.symbol = "DAX"
-ibcontract.secType = "IND"
-ibcontract.currency = "EUR"
-ibcontract.exchange = "DTB"
-
-print('DAX:')
-print(historic_data)
-print('')
-'''
-#app.disconnect()
-
-
-
+async def download_iv(tickers: list, host: str, port: int, client_id: int, duration='1 Y', bar_size='1 day',
+                      what_to_show='OPTION_IMPLIED_VOLATILITY', gateway=None, record_path=None, store_root=ib_bar_store.bar_store_folder,
+                      contract_cache=None, today=None):
+    '''
+    Updates the stored historical bars of every ticker at once with the asyncio client (see ib_client.py), only
+    downloading the dates missing from the bar store (see ib_bar_store.py)
+    tickers: Tickers of the universe to download
+    gateway: Gateway used instead of connecting to IB (e.g. ib_fake_gateway.FakeGateway)
+    record_path: If given, the callbacks received are saved to this json file, to be replayed later
+    store_root: Bar store root folder
+    contract_cache: Cache of resolved contracts (see ib_contract_cache.ContractCache), saved after the download. Not used
+                    when recording (every contract must be requested to be recorded) nor with a gateway given (its
+                    contracts must not be cached)
+    today: Last day of the period, saved with the recording. Default: current date
+    returns:
+        dict of ticker -> dataframe with the bars of the period, or the exception raised for it
+    '''
+    today = today or datetime.date.today()
+    if record_path or gateway is not None:
+        contract_cache = None
+    client = ib_client.AsyncIBClient(gateway, contract_cache=contract_cache)
+    await client.connect(host, port, client_id)
+    try:
+        if record_path:
+            client.start_recording(today=today.strftime(ib_bar_store.date_format))
+        contracts = {t: ib_client.make_contract(*universe[t]) for t in tickers}
+        results = await ib_bar_store.update_contracts(client, contracts, what_to_show=what_to_show, bar_size=bar_size, duration=duration,
+                                                      today=today, root=store_root)
+        if record_path:
+            client.save_recording(record_path)
+        print(client.latency.format())
+        if contract_cache is not None:
+            contract_cache.save()
+            print(contract_cache.format_stats())
+    finally:
+        client.disconnect()
+    return results
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-t', '--tickers', type=str, nargs='+', default=list(universe.keys()),
+                        help='Tickers to download. Default: {}'.format(' '.join(universe.keys())))
+    parser.add_argument('-H', '--host', type=str, default='127.0.0.1',
+                        help='IB gateway host. Default: 127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=4001,
+                        help='IB gateway port. Default: 4001')
+    parser.add_argument('-c', '--client_id', type=int, default=1,
+                        help='IB client id. Default: 1')
+    parser.add_argument('-d', '--duration', type=str, default='1 Y',
+                        help='Period to download, up to today. Default: 1 Y')
+    parser.add_argument('-b', '--bar_size', type=str, default='1 day',
+                        help='Size of the bars. Default: 1 day')
+    parser.add_argument('-w', '--what_to_show', type=str, default='OPTION_IMPLIED_VOLATILITY',
+                        help='Type of data to download. Default: OPTION_IMPLIED_VOLATILITY')
+    parser.add_argument('--record', type=str, default=None,
+                        help='Saves the callbacks received from the gateway to this json file')
+    parser.add_argument('--replay', type=str, default=None,
+                        help='Replays the callbacks recorded in this json file instead of connecting to the gateway (into a temporary bar store)')
+    parser.add_argument('-s', '--store', type=str, default=ib_bar_store.bar_store_folder,
+                        help='Bar store folder. Default: {}'.format(ib_bar_store.bar_store_folder))
+    parser.add_argument('--contracts_ttl', type=float, default=ib_contract_cache.default_ttl / 3600,
+                        help='Hours during which resolved contracts are reused (not with --record nor --replay). Default: {:g}'.format(ib_contract_cache.default_ttl / 3600))
+    parser.add_argument('--refresh_contracts', action='store_true', default=False,
+                        help='Resolves the contracts of the downloaded tickers again, instead of using the cached ones')
+    args = parser.parse_args()
+
+    gateway = None
+    today = None
+    if args.replay:
+        # Recordings are replayed as of the day they were made
+        recording = load_recording(args.replay)
+        gateway = FakeGateway(recording)
+        if 'today' in recording:
+            today = datetime.datetime.strptime(recording['today'], ib_bar_store.date_format).date()
+    # Replayed bars are not stored, so that the bar store only marks as downloaded the dates sent by the real gateway
+    store_root = tempfile.mkdtemp() if args.replay else args.store
+    contract_cache = ib_contract_cache.ContractCache(ttl=args.contracts_ttl * 3600)
+    if args.refresh_contracts:
+        for ticker in args.tickers:
+            contract_cache.invalidate(universe[ticker][0])
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(download_iv(args.tickers, args.host, args.port, args.client_id, args.duration, args.bar_size,
+                                          args.what_to_show, gateway, args.record, store_root, contract_cache, today))
+    finally:
+        if args.replay:
+            shutil.rmtree(store_root)
+    for ticker, bars in results.items():
+        if isinstance(bars, Exception):
+            print('ERROR while downloading {}: {}'.format(ticker, bars))
+        else:
+            print('{}: {} bars'.format(ticker, len(bars)))
+            print(bars.tail())
+    print('Downloaded {} tickers in {:.2f} s'.format(len(results), time.perf_counter() - start))
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+MAX_TOTAL_VOLATILITY = 10.0  # Upper bound for sigma * sqrt(t) used to bracket the solution
+DEFAULT_TOLERANCE = 1e-10
+DEFAULT_MAX_ITERATIONS = 100
+
+
+def years_to_expiry(expiration_dates, reference_date, date_format='%d/%m/%Y'):
+    '''
+    Calculates time to expiration in years for a whole column of expiration dates at once
+    expiration_dates: Iterable of expiration dates as strings (or datetime-like values)
+    reference_date: Date from which time to expiration is measured (usually session date or today)
+    date_format: Format of the expiration date strings
+    '''
+    expiries = pd.to_datetime(pd.Series(expiration_dates), format=date_format).dt.normalize()
+    days = (expiries - pd.Timestamp(reference_date).normalize()).dt.days
+    return days.values / 365.
+
+
+def is_call(flag):
+    '''
+    Returns a boolean array which is True for calls, given an array of rights ('C'/'c' or 'P'/'p')
+    '''
+    flag = np.asarray(flag)
+    if flag.dtype == bool:
+        return flag
+    return np.char.lower(flag.astype(str)) == 'c'
+
+
+def _undiscounted_black(F, K, s, call):
+    '''
+    Undiscounted Black price for forward F, strike K and total volatility s = sigma * sqrt(t)
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = np.log(F / K) / s + 0.5 * s
+    d2 = d1 - s
+    sign = np.where(call, 1.0, -1.0)
+    return sign * (F * ndtr(sign * d1) - K * ndtr(sign * d2)), d1
+
+
+def _initial_guess(price, F, K, call):
+    '''
+    Corrado-Miller rational approximation of the total volatility, falling back to Brenner-Subrahmanyam
+    when the square root argument becomes negative (far from the money)
+    '''
+    c = np.where(call, price, price + F - K)  # Put-call parity on undiscounted prices
+    half_diff = c - 0.5 * (F - K)
+    radicand = half_diff ** 2 - (F - K) ** 2 / np.pi
+    guess = SQRT_2PI / (F + K) * (half_diff + np.sqrt(np.maximum(radicand, 0.0)))
+    fallback = SQRT_2PI * c / F
+    guess = np.where((radicand > 0) & (guess > 0), guess, fallback)
+    return np.clip(guess, 1e-4, MAX_TOTAL_VOLATILITY)
+
+
+def implied_volatility(price, S, K, t, r, flag, tol=DEFAULT_TOLERANCE, max_iter=DEFAULT_MAX_ITERATIONS):
+    '''
+    Calculates Black-Scholes implied volatility for a whole option chain at once.
+    Same inputs as py_vollib implied_volatility, but any of them can be an array (they are broadcasted).
+    Rows with zero/negative price or time, and rows with a price below intrinsic value (or above the maximum
+    possible price) are masked out and get NaN instead of raising an exception.
+    price: Option prices
+    S: Underlying asset price
+    K: Strikes
+    t: Time to expiration in years
+    r: Risk-free interest rate
+    flag: Rights ('C' or 'P', case insensitive) or boolean array which is True for calls
+    tol: Relative tolerance on the option time value
+    max_iter: Maximum number of iterations
+    returns:
+        tuple (iv, converged) of arrays, where converged is False for every masked or non converged row
+    '''
+    price, S, K, t, r = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (price, S, K, t, r)])
+    call = np.broadcast_to(is_call(flag), price.shape)
+
+    # Work with undiscounted prices and forwards, computed the same way as py_vollib does to match its rounding
+    with np.errstate(invalid='ignore', over='ignore'):
+        deflater = np.exp(-r * t)
+        F = S / deflater
+        p = price / deflater
+        intrinsic = np.where(call, np.maximum(F - K, 0.0), np.maximum(K - F, 0.0))
+        upper = np.where(call, F, K)
+        valid = (price > 0.0) & (t > 0.0) & (S > 0.0) & (K > 0.0) & (p >= intrinsic) & (p < upper)
+
+    iv = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+    if not valid.any():
+        return iv, converged
+
+    # In the money options are mapped to out of the money ones through put-call parity, so that only
+    # the time value is solved for (the price of an ITM option is insensitive to volatility)
+    p, F, K, t = p[valid], F[valid], K[valid], t[valid]
+    time_value = p - intrinsic[valid]
+    otm_call = F <= K
+
+    # Options priced exactly at intrinsic value have zero volatility, as in py_vollib
+    zero = time_value <= 0.0
+    time_value = np.where(zero, np.nan, time_value)
+    log_time_value = np.log(time_value)
+
+    # Newton iteration on the log of the time value, safeguarded by bisection on the total volatility bracket
+    lo = np.zeros(p.shape)
+    hi = np.full(p.shape, MAX_TOTAL_VOLATILITY)
+    s = _initial_guess(time_value, F, K, otm_call)
+    done = zero.copy()
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore', under='ignore'):
+        for _ in range(max_iter):
+            model, d1 = _undiscounted_black(F, K, s, otm_call)
+            diff = np.log(model) - log_time_value
+            done |= np.abs(diff) <= tol
+            if done.all():
+                break
+            # Price is increasing with volatility, so the sign of diff shrinks the bracket
+            hi = np.where(diff > 0, s, hi)
+            lo = np.where(diff < 0, s, lo)
+            vega = F * np.exp(-0.5 * d1 ** 2) / SQRT_2PI
+            newton = s - diff * model / vega
+            bisection = 0.5 * (lo + hi)
+            step = np.where(np.isfinite(newton) & (newton > lo) & (newton < hi), newton, bisection)
+            done |= (hi - lo) <= tol * s
+            s = np.where(done, s, step)
+
+    iv[valid] = np.where(zero, 0.0, s / np.sqrt(t))
+    converged[valid] = done
+    return iv, converged
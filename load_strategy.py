@@ -7,6 +7,7 @@ import json
 import sys
 import pandas as pd
 from risk_graph import plot_risk_graph
+import chain_store
 
 
 def load_strategy(filename):
@@ -40,22 +41,17 @@ if __name__ == '__main__':
     data = load_strategy(config.input_file)
     
     # Update last price for each options
-    # First check if there is data available in data folder for given ticker
-    data_folder = 'data'
-    available_tickers = [f for f in os.listdir(data_folder) if path.isdir(path.join(data_folder, f))]
-    if data['meta']['ticker'].upper() not in available_tickers:
-        sys.exit('ERROR: there is no available option data on ticker ' + str(data.meta.ticker))
+    # First check if there is data available in the chain store for given ticker
+    ticker = data['meta']['ticker'].upper()
+    sessions = chain_store.list_sessions(ticker)
+    if not sessions:
+        sys.exit('ERROR: there is no available option data on ticker ' + str(ticker))
     
-    # Get the latest daily file regarding that ticker
-    ticker_data_folder = path.join(data_folder, data['meta']['ticker'].upper())
-    daily_files = sorted([f for f in os.listdir(ticker_data_folder) if path.isfile(path.join(ticker_data_folder, f)) and f.lower().endswith('.json')])
-    latest_daily_filepath = path.join(ticker_data_folder, daily_files[-1])
-    
-    # Load the latest daily file and add last price data to the options composing input strategy
-    df = pd.read_json(latest_daily_filepath)
+    # Load the latest session regarding that ticker and add last price data to the options composing input strategy
+    df = chain_store.load_chain(ticker, sessions[-1:], columns=['strike', 'expiration_date', 'right', 'last_price'])
     for opt in data['options']:
         # Filter dataframe to find this option
-        filter = df[(df.strike == opt['strike']) & (df.expiration_date == opt['expiration_date']) & (df.right == opt['right'])]
+        filter = df[(df.strike == opt['strike']) & (df.expiration_date == chain_store.parse_date(opt['expiration_date'])) & (df.right == opt['right'])]
         if filter.empty:
             sys.exit('ERROR: unable to find ' + str(opt.right) + ' option with strike ' + str(opt.strike) + ' expiring on ' + str(opt.expiration_date))
         opt['last_price'] = filter.iloc[0].last_price
@@ -1,13 +1,13 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*
 import pandas as pd
-import numpy as np
 from argparse import ArgumentParser
-import shutil
-from os import listdir
+import io
 from os import path
 from datetime import datetime as dt
 import zipfile
+import chain_store
+import backfill
 
 
 inner_zip_filename = 'today_rv.zip'
@@ -20,133 +20,112 @@ contracts_stats_dtype = {'contract_code': str, 'high_price': float, 'low_price':
 
 contract_subgroups = {'20': 'FIE', '23': 'BBVA', '28': 'SAN', '31': 'TEF', '43': 'ITX'}
 
+def load_meff_archive(input_file_path):
+    '''
+    Loads contracts and contracts stats from a MEFF daily zip file and joins them on contract_code.
+    Both nested zip files are read in memory and their members are streamed into the CSV parser,
+    so nothing is written to disk and several archives can be loaded at the same time.
+    input_file_path: Path to the MEFF daily zip file
+    '''
+    # Inside the daily zip file there is another zip file which holds the data files
+    with zipfile.ZipFile(input_file_path, 'r') as outer_zip:
+        inner_zip_data = io.BytesIO(outer_zip.read(inner_zip_filename))
+    with zipfile.ZipFile(inner_zip_data, 'r') as inner_zip:
+        # Load contracts file
+        with inner_zip.open(contracts_file) as f:
+            contracts_data = pd.read_csv(f, sep=';', decimal=',',
+                                         header=None, names=contracts_columns, dtype=contracts_dtype, parse_dates=[0, 5],
+                                         usecols=[0, 2, 3, 4, 5, 6])
+        
+        # Now load contracts stats file (there are no dates in it: contract_code is only the join key)
+        with inner_zip.open(contracts_stats_file) as f:
+            contracts_stats_data = pd.read_csv(f, sep=';', decimal=',',
+                                               header=None, names=contracts_stats_columns, dtype=contracts_stats_dtype,
+                                               usecols=[2, 3, 4, 5, 6, 13, 15])
+    
+    # Join dataframes on contract_code
+    return pd.merge(contracts_data, contracts_stats_data, how='inner', on='contract_code', sort=False)
+
+
+def parse_meff_options(df: pd.DataFrame):
+    '''
+    Keeps only the option contracts of a MEFF daily file and adds their right, with dates formatted as in EUREX website
+    df: Contracts joined with their stats, as returned by load_meff_archive
+    returns:
+        options dataframe, with contract_subgroup still available to split it by ticker
+    '''
+    # Filter the dataframe to keep only options (rows which contain a defined strike)
+    # Also, only European type options are listed for miniIBEX, but we have to filter out European type from stock options
+    df = df[df.strike.notnull() & ~df.contract_code.str.contains('EU ', regex=False)]
+    
+    # Adapt session date and expiration date to the same format used in EUREX website
+    df['session_date'] = chain_store.format_dates(df['session_date'])
+    df['expiration_date'] = chain_store.format_dates(df['expiration_date'])
+    
+    # The first char of contract code is the right initial for option contracts
+    df['right'] = df['contract_code'].str[0]
+    
+    # Delete unused columns
+    return df.drop(columns=['contract_code', 'contract_type'])
+
+
 def meff_to_json(input_file_path, ticker=None):
+    '''
+    Converts a MEFF daily zip file into a json file (and a chain store partition) per ticker
+    input_file_path: Path to the MEFF daily zip file
+    ticker: Specific ticker to be extracted. Default: all the tickers in contract_subgroups
+    returns:
+        list of written file paths, or None if the input file does not exist
+    '''
     # Check if given input file exists
     if path.exists(input_file_path) and path.isfile(input_file_path):
-        # Delete tmp folder (if exists)
-        if path.exists('tmp') and path.isdir('tmp'):
-            shutil.rmtree('tmp')
-        
-        # First unzip (inside there is another zip file which also has to be unziped)
-        outer_zip = zipfile.ZipFile(input_file_path, 'r')
-        outer_zip.extractall('tmp')
-        outer_zip.close()
-        inner_zip = zipfile.ZipFile(path.join('tmp', inner_zip_filename), 'r')
-        inner_zip.extractall('tmp')
-        inner_zip.close()
-        
-        # Load contracts file
-        contracts_data = pd.read_csv(path.join('tmp', contracts_file), sep=';', decimal=',',
-                                     header=None, names=contracts_columns, dtype=contracts_dtype, parse_dates=[0, 5],
-                                     usecols=[0, 2, 3, 4, 5, 6])
-        
-        # Now load contracts stats file
-        contracts_stats_data = pd.read_csv(path.join('tmp', contracts_stats_file), sep=';', decimal=',',
-                                           header=None, names=contracts_stats_columns, dtype=contracts_stats_dtype, parse_dates=[0],
-                                           usecols=[2, 3, 4, 5, 6, 13, 15])
-        
-        # Join dataframes on contract_code
-        df = pd.merge(contracts_data, contracts_stats_data, how='inner', on='contract_code', sort=False)
-        
-        # Adapt session date and expiration date to the same format used in EUREX website
-        df['session_date'] = pd.to_datetime(df['session_date']).dt.strftime('%d/%m/%Y')
-        df['expiration_date'] = pd.to_datetime(df['expiration_date']).dt.strftime('%d/%m/%Y')
-        
-        # Filter the dataframe to keep only options (rows which contain a defined strike)
-        df.strike.replace('', np.nan, inplace=True)
-        df.dropna(subset=['strike'], inplace=True)
-        # The first char of contract code is the right initial for option contracts
-        # Also, only European type options are listed for miniIBEX, but we have to filter out European type from stock options
-        df['contract_code'] = df['contract_code'].apply(lambda x: np.nan if 'EU ' in x else x)
-        df.dropna(subset=['contract_code'], inplace=True)
-        df['right'] = df['contract_code'].apply(lambda x: x[0])
-        # Delete unused columns
-        del df['contract_code']
-        del df['contract_type']
+        outputs = []
+        # Load and join contracts and contracts stats, and keep options only
+        df = parse_meff_options(load_meff_archive(input_file_path))
         
         # Check if only a specific ticker is wanted, or all the default ones are
+        tickers = contract_subgroups
         if ticker and ticker in contract_subgroups.values():
-            subgroup_df = df[(df.contract_subgroup == ticker)]
-            
-            # Delete unused columns
-            del subgroup_df['contract_subgroup']
-        
-            # Save as json
-            _, file = path.split(input_file_path)
-            json_filename = file.replace('.zip', '.json')
-            subgroup_df.to_json(path.join('data', ticker, json_filename), orient='records')
-        else:
-            # Get options data for all of the subgroups under study
-            for key, value in contract_subgroups.items():
-                subgroup_df = df[(df.contract_subgroup == key)]
-                
-                # Delete unused columns
-                del subgroup_df['contract_subgroup']
-            
-                # Save as json
-                _, file = path.split(input_file_path)
-                json_filename = file.replace('.zip', '.json')
-                subgroup_df.to_json(path.join('data', value, json_filename), orient='records')
-        
-        # Delete tmp folder
-        shutil.rmtree('tmp')
+            tickers = {key: value for key, value in contract_subgroups.items() if value == ticker}
+        
+        # Save options data for each of the subgroups under study as json
+        _, file = path.split(input_file_path)
+        json_filename = file.replace('.zip', '.json')
+        for key, subgroup_df in df.groupby('contract_subgroup', sort=False):
+            if key in tickers:
+                subgroup_df = subgroup_df.drop(columns=['contract_subgroup'])
+                outputs.append(path.join('data', tickers[key], json_filename))
+                subgroup_df.to_json(outputs[-1], orient='records')
+                outputs.append(chain_store.write_session(subgroup_df, tickers[key]))
+        
+        return [o for o in outputs if o]
 
 
 def check_option(input_file_path, ticker, strike, expiration_date, right):
     '''
     Method to check if null values seen in the report already have null value in the raw data, or introduced later
+    input_file_path: Path to the MEFF daily zip file
+    ticker: Ticker of the underlying asset (one of contract_subgroups values)
+    strike: Strike of the option
+    expiration_date: Expiration date of the option (dd/mm/YYYY)
+    right: Right of the option ('C' or 'P')
+    returns:
+        dataframe with the raw data of the option (empty if not found), or None if the input file does not exist
     '''
     # Check if given input file exists
     if path.exists(input_file_path) and path.isfile(input_file_path):
-        # Delete tmp folder (if exists)
-        if path.exists('tmp') and path.isdir('tmp'):
-            shutil.rmtree('tmp')
-        
-        # First unzip (inside there is another zip file which also has to be unziped)
-        outer_zip = zipfile.ZipFile(input_file_path, 'r')
-        outer_zip.extractall('tmp')
-        outer_zip.close()
-        inner_zip = zipfile.ZipFile(path.join('tmp', inner_zip_filename), 'r')
-        inner_zip.extractall('tmp')
-        inner_zip.close()
-        
-        # Load contracts file
-        contracts_data = pd.read_csv(path.join('tmp', contracts_file), sep=';', decimal=',',
-                                     header=None, names=contracts_columns, dtype=contracts_dtype, parse_dates=[0, 5],
-                                     usecols=[0, 2, 3, 4, 5, 6])
-        
-        # Now load contracts stats file
-        contracts_stats_data = pd.read_csv(path.join('tmp', contracts_stats_file), sep=';', decimal=',',
-                                           header=None, names=contracts_stats_columns, dtype=contracts_stats_dtype, parse_dates=[0],
-                                           usecols=[2, 3, 4, 5, 6, 13, 15])
-        
-        # Join dataframes on contract_code
-        df = pd.merge(contracts_data, contracts_stats_data, how='inner', on='contract_code', sort=False)
-        
-        # Adapt session date and expiration date to the same format used in EUREX website
-        df['session_date'] = pd.to_datetime(df['session_date']).dt.strftime('%d/%m/%Y')
-        df['expiration_date'] = pd.to_datetime(df['expiration_date']).dt.strftime('%d/%m/%Y')
-        
-        # Filter the dataframe to keep only options (rows which contain a defined strike)
-        df.strike.replace('', np.nan, inplace=True)
-        df.dropna(subset=['strike'], inplace=True)
-        # The first char of contract code is the right initial for option contracts
-        # Also, only European type options are listed for miniIBEX, but we have to filter out European type from stock options
-        df['contract_code'] = df['contract_code'].apply(lambda x: np.nan if 'EU ' in x else x)
-        df.dropna(subset=['contract_code'], inplace=True)
-        df['right'] = df['contract_code'].apply(lambda x: x[0])
-        # Delete unused columns
-        del df['contract_code']
-        del df['contract_type']
+        # Load and join contracts and contracts stats, and keep options only
+        df = parse_meff_options(load_meff_archive(input_file_path))
         
         # Print desired option data
-        df.loc[(df['ticker'] == ticker) & (df['right'] == right) & (df['strike'] == strike) & (df['expiration_date'] == expiration_date)] #TODO
-        print('CUCU')
-        
-        # Delete tmp folder
-        shutil.rmtree('tmp')
-        
-        
+        subgroups = [key for key, value in contract_subgroups.items() if value == ticker]
+        option = df.loc[df['contract_subgroup'].isin(subgroups) & (df['right'] == right) & (df['strike'] == strike) & (df['expiration_date'] == expiration_date)]
+        if option.empty:
+            print('Option {} {} {} {} not found in file {}'.format(ticker, right, strike, expiration_date, input_file_path))
+        else:
+            print(option.to_string(index=False))
+        return option
+
 
 if __name__ == '__main__':
     # Configure the command line options
@@ -155,6 +134,10 @@ if __name__ == '__main__':
                         help='Determines the single daily zip file or folder to convert')
     parser.add_argument('-t', '--ticker', type=str, default=None,
                         help='Determines a specific ticker to be extracted')            
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of worker processes used to convert a folder. Default: 1')
+    parser.add_argument('-f', '--force_rewrite', action='store_true', default=False,
+                        help='Converts again the files of a folder which are already up to date')
     args = parser.parse_args()
     
     if path.exists(args.input_file):
@@ -162,5 +145,6 @@ if __name__ == '__main__':
             meff_to_json(args.input_file, args.ticker)
         elif path.isdir(args.input_file):
             # Convert all available daily files data
-            [meff_to_json(path.join(args.input_file, f), args.ticker) for f in listdir(args.input_file) if path.isfile(path.join(args.input_file, f)) and f.lower().endswith('.zip')]
+            backfill.run_backfill('meff2json', meff_to_json, backfill.list_input_files(args.input_file, '.zip'), [args.ticker],
+                                  args.workers, args.force_rewrite)
     
\ No newline at end of file
@@ -0,0 +1,37 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+from argparse import ArgumentParser
+import chain_store
+
+
+if __name__ == '__main__':
+    # Configure the command line options
+    parser = ArgumentParser()
+    parser.add_argument('-i', '--input_folder', type=str, default='data',
+                        help='Folder containing one subfolder of daily json files per ticker. Default: data')
+    parser.add_argument('-o', '--output_folder', type=str, default=chain_store.store_folder,
+                        help='Chain store root folder. Default: {}'.format(chain_store.store_folder))
+    parser.add_argument('-f', '--force_rewrite', action='store_true', default=False,
+                        help='Rewrites sessions already present in the store if activated')
+    config = parser.parse_args()
+
+    tickers = sorted([t for t in os.listdir(config.input_folder) if path.isdir(path.join(config.input_folder, t))])
+    for ticker in tickers:
+        ticker_data_folder = path.join(config.input_folder, ticker)
+        daily_files = sorted([f for f in os.listdir(ticker_data_folder) if path.isfile(path.join(ticker_data_folder, f)) and f.lower().endswith('.json')])
+        existing_sessions = set(chain_store.list_sessions(ticker, config.output_folder))
+        written = 0
+        skipped = 0
+        for f in daily_files:
+            # Daily files are named after their session (YYYYMMDD.json), so already migrated ones can be skipped without parsing them
+            if not config.force_rewrite and path.splitext(f)[0] in existing_sessions:
+                skipped += 1
+                continue
+            try:
+                if chain_store.write_json_file(path.join(ticker_data_folder, f), ticker, config.output_folder):
+                    written += 1
+            except Exception as e:
+                print('ERROR while migrating file {}: {}'.format(path.join(ticker_data_folder, f), e))
+        print('{}: {} sessions written, {} skipped'.format(ticker, written, skipped))
@@ -3,156 +3,145 @@
 import pandas as pd
 import numpy as np
 import scipy.stats as stats
-from datetime import datetime
 import os
 from os import path
 import matplotlib.pyplot as plt
-import matplotlib.cbook as cbook
-import matplotlib.image as image
+import chain_store
+import history_cache
+import plot_renderer
 
 import seaborn as sns;
 sns.set(style="white", color_codes=True)
 pd.options.mode.chained_assignment = None
 
 
-watermark_logo = os.path.join(os.getcwd(), 'templates', 'img', 'smartcondor_logo.png')
+def get_open_interest_profile(df: pd.DataFrame, t: str, min_oi_ratio=0.1):
+    '''
+    Returns the open interest of calls and puts per strike for a given expiration date, as a dataframe
+    indexed by strike (ascending) with call and put columns. Only strikes with some open interest are kept.
+    Duplicated rows for the same strike and right are resolved by keeping their maximum open interest.
+    df: Pandas DataFrame with options information
+    t: Expiration date of the options under study (datetime-like or dd/mm/YYYY string)
+    min_oi_ratio: Open interest lower than this ratio of the maximum open interest is considered as 0 (filters out strikes too OTM)
+    '''
+    df = df[pd.notnull(df['open_interest']) & (df.expiration_date == chain_store.parse_date(t))]
+    profile = df.pivot_table(index='strike', columns='right', values='open_interest', aggfunc='max', fill_value=0)
+    profile = profile.reindex(columns=['C', 'P'], fill_value=0).rename(columns={'C': 'call', 'P': 'put'})
+    profile.columns.name = None
+    if profile.empty:
+        return profile.astype(int)
+    profile[profile < min_oi_ratio * profile.values.max()] = 0
+    return profile[(profile > 0).any(axis=1)].astype(int).sort_index()
 
 
-def plot_open_interest(df: pd.DataFrame, t: str, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool):
+def plot_open_interest(df: pd.DataFrame, t: str, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool, output_format=plot_renderer.default_output_format, min_oi_ratio=0.1):
     '''
     Plots open interest for all the available strikes for a given expiration date
-    df: Pandas DataFrame with options information
-    t: Expiration date of the option under study
+    df: Pandas DataFrame with options information (see chain_store.chain_dtypes)
+    t: Expiration date of the option under study (datetime-like or dd/mm/YYYY string)
     ticker: Ticker of the underlying asset
     output_folder: Ouput folder
     rewrite_img: Rewrites image if exists, skips computation otherwise
     save_img: True to store plot as an image file, false to show it in a window
+    output_format: One of plot_renderer.output_formats
+    min_oi_ratio: Strikes with open interest lower than this ratio of the maximum open interest are filtered out
     '''
+    # Filter out for given expiration date and keep only contracts where open interest is not NaN
+    t = chain_store.parse_date(t)
+    df = df[pd.notnull(df['open_interest'])]
+    df = df[df.expiration_date == t]
+    
     img_path = ''
     svg_filename = ''
+    digest = None
     if save_img:
-        svg_filename = '{}_oi_{}.svg'.format(ticker, datetime.strptime(t, '%d/%m/%Y').strftime('%Y%m%d'))
+        svg_filename = plot_renderer.image_filename('{}_oi_{}'.format(ticker, t.strftime('%Y%m%d')), output_format)
         img_folder = path.join('reports', output_folder, 'img')
         img_path = path.join(img_folder, svg_filename)
-        # Check if image already exists, and skip computation (unless rewrite option is activated)
-        if not rewrite_img and img_path and path.isfile(img_path):
+        # Check if image already exists and was made from the same data, and skip computation (unless rewrite option is activated)
+        digest = plot_renderer.data_digest(df[['strike', 'right', 'open_interest']], ticker, t, output_format, min_oi_ratio)
+        if not plot_renderer.needs_render(img_path, digest, rewrite_img):
             return svg_filename
     
-    # Filter out for given expiration date and keep only contracts where open interest is not NaN
-    df = df[pd.notnull(df['open_interest'])]
-    df = df[df.expiration_date == t]
     if df.empty:
         return None
     
-    # Filter out strikes too OTM
-    max_oi = int(df.open_interest.max())
-    df.loc[df.open_interest < 0.1 * max_oi, 'open_interest'] = 0;
+    # Get open interest per strike (filtering out strikes too OTM)
+    profile = get_open_interest_profile(df, t, min_oi_ratio)
     
     # Check if there is open interest at all for current expiration date
-    if not df[df.open_interest > 0].empty:
-        # Get min and max strikes (where there is actually some open interest)
-        min_strike = int(df[df.open_interest > 0].strike.min())
-        max_strike = int(df[df.open_interest > 0].strike.max())
-        strikes = sorted(np.array(df[df.open_interest > 0].strike.unique().tolist()))
-        
-        # Separate calls from puts
-        call = df[df.right == 'C']
-        put  = df[df.right == 'P']
-        
-        # Iterate each to get ordered list of open interest per strike
-        call_oi = [0] * len(strikes)
-        put_oi  = [0] * len(strikes)
-        for i, s in enumerate(strikes):
-            try:
-                oi = call[call.strike == s]
-                if not oi.empty:
-                    call_oi[i] = int(oi.open_interest)
-                oi = put[put.strike == s]
-                if not oi.empty:
-                    put_oi[i] = int(oi.open_interest)
-            except TypeError as e:
-                print('ERROR trying to convert open interest {} to int type: {}'.format(oi.open_interest, e))
-        
+    if not profile.empty:
         # Calculate the vertical size of the plot in order to contain all bars without overlapping nor being too thin
-        num_bars = max(len(call_oi), len(put_oi))
+        num_bars = len(profile)
         dpi = 300
         fig_w = 8
         fig_h = max(4.2, num_bars * 100 / dpi)  # Set a minimum figure height of 4.2 inches (otherwise xlabel and/or plot title is cropped)
         
         # Plot
         fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-        df2 = pd.DataFrame({'strike': [s for s in strikes], 'call': call_oi, 'put': put_oi})
-        df2 = df2.set_index('strike')
-        df2[['call', 'put']].plot(kind='barh', color=['blue', 'red'], ax=ax)
+        profile[['call', 'put']].plot(kind='barh', color=['blue', 'red'], ax=ax)
         
         # Add watermark logo
-        logo_datafile = cbook.get_sample_data(watermark_logo, asfileobj=False)
-        logo = image.imread(logo_datafile)
-        #logo[:, :, -1] = 0.5  # set the alpha channel
-        fig.figimage(logo, xo=200, yo=200, alpha=0.5, origin='upper', zorder=3)
+        fig.figimage(plot_renderer.get_watermark(), xo=200, yo=200, alpha=0.5, origin='upper', zorder=3)
 
         ax.set_xlabel('Open interest')
         ax.set_ylabel('Strikes')
-        ax.set_title('Open interest for {} expiring on {} \nNote: strikes with open interest < 10% MAX are filtered out'.format(ticker, t))
+        ax.set_title('Open interest for {} expiring on {} \nNote: strikes with open interest < {:.0%} MAX are filtered out'.format(ticker, t.strftime(chain_store.legacy_date_format), min_oi_ratio))
         ax.legend()
 
         if save_img:
-            plt.savefig(img_path, format='svg', dpi=dpi)
+            plot_renderer.save_figure(fig, img_path, digest, output_format, dpi)
         else:
             plt.show()  # Show the plot
         plt.close('all')
     return svg_filename
     
     
-def plot_open_interest_evolution(df: pd.DataFrame, k: float, t: str, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool):
+def plot_open_interest_evolution(df: pd.DataFrame, k: float, t: str, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool, output_format=plot_renderer.default_output_format):
     '''
     Plots the evolution of open interest for both calls and puts of a given strike and expiry date
-    df: Pandas DataFrame with MEFF information
+    df: Historical options information, either as a history_cache.MappedHistory or as a Pandas DataFrame
+        indexed by (expiration_date, strike, right, session_date) (see history_cache.index_history)
     k: Strike of the option under study
-    t: Expiration date of the option under study
+    t: Expiration date of the option under study (datetime-like or YYYY/mm/dd string)
     ticker: Ticker of the underlying asset
     output_folder: Ouput folder
     rewrite_img: Rewrites image if exists, skips computation otherwise
     save_img: True to store plot as an image file, false to show it in a window
+    output_format: One of plot_renderer.output_formats
     '''
+    # Slice the history of this strike and expiry (already sorted by session date)
+    expiry = chain_store.parse_date(t, '%Y/%m/%d')
+    call = history_cache.get_contract_history(df, k, expiry, 'C')
+    put = history_cache.get_contract_history(df, k, expiry, 'P')
+    
     img_path = ''
     svg_filename = ''
+    digest = None
     if save_img:
-        svg_filename = '{}_oiev_{}_{}.svg'.format(ticker, k, datetime.strptime(t, '%Y/%m/%d').strftime('%Y%m%d'))
+        svg_filename = plot_renderer.image_filename('{}_oiev_{}_{}'.format(ticker, k, expiry.strftime('%Y%m%d')), output_format)
         img_folder = path.join('reports', output_folder, 'img')
         img_path = path.join(img_folder, svg_filename)
-        # Check if image already exists, and skip computation (unless rewrite option is activated)
-        if not rewrite_img and img_path and path.isfile(img_path):
+        # Check if image already exists and was made from the same data, and skip computation (unless rewrite option is activated)
+        digest = plot_renderer.data_digest(pd.concat([call, put], keys=['C', 'P']), ticker, k, expiry, output_format)
+        if not plot_renderer.needs_render(img_path, digest, rewrite_img):
             return svg_filename
     
-    # Traspose date format
-    tt = datetime.strptime(t, '%Y/%m/%d').strftime('%d/%m/%Y')
-    df['session_date'] = pd.to_datetime(df.session_date, format="%d/%m/%Y")
-    
-    # Filter out data
-    df = df[(df.expiration_date == tt) & (df.strike == k)]
-    
-    # Sort by session date
-    df = df.sort_values('session_date', ascending=True)
-    
     # Plot data
     fig, ax = plt.subplots()
-    ax.plot(df.session_date[df.right == 'C'], df.open_interest[df.right == 'C'], 'b', label='Calls')
-    ax.plot(df.session_date[df.right == 'P'], df.open_interest[df.right == 'P'], 'r', label='Puts')
+    ax.plot(call.index, call.open_interest, 'b', label='Calls')
+    ax.plot(put.index, put.open_interest, 'r', label='Puts')
     ax.set_xlabel('Session date')
     ax.set_ylabel('Open interest')
-    ax.set_title('Evolution of open interest for {} strike {} expiring on {}'.format(ticker, k, t))
+    ax.set_title('Evolution of open interest for {} strike {} expiring on {}'.format(ticker, k, expiry.strftime(chain_store.legacy_date_format)))
     ax.grid(True)
     ax.legend()
     
     # Add watermark logo
-    logo_datafile = cbook.get_sample_data(watermark_logo, asfileobj=False)
-    logo = image.imread(logo_datafile)
-    #logo[:, :, -1] = 0.5  # set the alpha channel
-    fig.figimage(logo, xo=250, yo=400, alpha=0.5, origin='upper', zorder=3)
+    fig.figimage(plot_renderer.get_watermark(), xo=250, yo=400, alpha=0.5, origin='upper', zorder=3)
     
     if save_img:
-        plt.savefig(img_path, format='svg', dpi=100)
+        plot_renderer.save_figure(fig, img_path, digest, output_format, dpi=100)
     else:
         plt.show()
     plt.close('all')
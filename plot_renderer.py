@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*
+import os
+from os import path
+import hashlib
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import matplotlib.pyplot as plt
+import matplotlib.image as image
+
+
+watermark_logo = os.path.join(os.getcwd(), 'templates', 'img', 'smartcondor_logo.png')
+
+# Available output formats for rendered plots. 'svg_light' keeps text as text instead of paths and
+# embeds the watermark at a lower resolution, which makes files much smaller than 'svg'
+output_formats = {
+    'svg':       {'extension': 'svg', 'dpi': None, 'rc': {}},
+    'svg_light': {'extension': 'svg', 'dpi': 72,   'rc': {'svg.fonttype': 'none'}},
+    'png':       {'extension': 'png', 'dpi': 100,  'rc': {}},
+}
+default_output_format = 'svg'
+
+# A plot job is a plotting function plus its arguments, identified by a key chosen by the caller
+PlotJob = namedtuple('PlotJob', ['key', 'function', 'args'])
+
+_watermark = None
+
+
+def get_watermark():
+    '''
+    Returns the watermark logo image, decoded only once per process
+    '''
+    global _watermark
+    if _watermark is None:
+        _watermark = image.imread(watermark_logo)
+    return _watermark
+
+
+def image_filename(basename: str, output_format=default_output_format):
+    return '{}.{}'.format(basename, output_formats[output_format]['extension'])
+
+
+def data_digest(df: pd.DataFrame, *params):
+    '''
+    Returns a content hash of the data (and any other parameters) a plot is made of
+    '''
+    digest = hashlib.sha1()
+    digest.update(repr([list(df.columns)] + list(params)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def _digest_path(img_path: str):
+    return img_path + '.sha1'
+
+
+def needs_render(img_path: str, digest: str, rewrite_img: bool):
+    '''
+    Checks if a plot has to be rendered: it is skipped only if the image already exists and was rendered
+    from the same data (unless rewrite option is activated)
+    '''
+    if rewrite_img or not path.isfile(img_path) or not path.isfile(_digest_path(img_path)):
+        return True
+    with open(_digest_path(img_path), 'r') as f:
+        return f.read().strip() != digest
+
+
+def save_figure(fig, img_path: str, digest: str, output_format=default_output_format, dpi=300):
+    '''
+    Saves a figure in the given output format, together with the content hash of its data
+    '''
+    settings = output_formats[output_format]
+    with plt.rc_context(settings['rc']):
+        fig.savefig(img_path, format=settings['extension'], dpi=settings['dpi'] or dpi)
+    with open(_digest_path(img_path), 'w') as f:
+        f.write(digest)
+
+
+def _run_job(job: PlotJob):
+    start = time.perf_counter()
+    try:
+        result = job.function(*job.args)
+    except Exception as e:
+        traceback.print_exc()
+        print('ERROR: Failed to render plot {}: {}'.format(job.key, e))
+        result = None
+    finally:
+        plt.close('all')
+    return result, time.perf_counter() - start
+
+
+def render_jobs(jobs: list, workers=1):
+    '''
+    Renders a queue of plot jobs, using a pool of worker processes if more than one worker is given.
+    A failing job does not stop the others: its result is None. Jobs with the same key write the same files, so only
+    one of them is rendered.
+    jobs: List of PlotJob
+    workers: Number of worker processes
+    returns:
+        dict key -> (result returned by the plotting function, rendering seconds)
+    '''
+    results = {}
+    jobs = list({job.key: job for job in jobs}.values())
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_run_job, job): job.key for job in jobs}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    else:
+        for job in jobs:
+            results[job.key] = _run_job(job)
+    return results
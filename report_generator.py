@@ -9,49 +9,89 @@ import jinja2
 from datetime import datetime
 import open_interest_plot as oip
 import skew_plot
+import greeks
+import chain_store
+import history_cache
+import ib_bar_store
+import plot_renderer
 from argparse import ArgumentParser
 import traceback
 from shutil import copy2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
 
 
-def get_big_movements(ldf: pd.DataFrame, pdf: pd.DataFrame, n=10):
-    # Filter out too small open interest (less than 0.1% of total open interest)
-    ldf = ldf.drop_duplicates()
-    ldf['expiration_date'] = ldf['expiration_date'].apply(lambda x: datetime.strptime(x, '%d/%m/%Y').strftime('%Y/%m/%d'))
-    pdf = pdf.drop_duplicates()
-    pdf['expiration_date'] = pdf['expiration_date'].apply(lambda x: datetime.strptime(x, '%d/%m/%Y').strftime('%Y/%m/%d'))
+def _format_expiration_dates(expiration_dates: pd.Series):
+    '''
+    Formats expiration dates (datetime64 or dd/mm/YYYY strings) only once per distinct value, and returns them
+    as sortable YYYY/mm/dd strings and as YYYYmmdd strings (used to name open interest evolution plots)
+    '''
+    codes, uniques = pd.factorize(expiration_dates)
+    dates = pd.Series(uniques)
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format=chain_store.legacy_date_format)
+    sortable = dates.dt.strftime('%Y/%m/%d').values.take(codes)
+    filenames = dates.dt.strftime('%Y%m%d').values.take(codes)
+    return sortable, filenames
+
+
+def get_big_movements(ldf: pd.DataFrame, pdf: pd.DataFrame, n=10, n_oi=3):
+    '''
+    Looks for the options with highest volume, highest open interest and biggest open interest changes between two sessions
+    ldf: Options dataframe of the latest session (see chain_store.chain_dtypes, dates may also be dd/mm/YYYY strings)
+    pdf: Options dataframe of the previous session
+    n: Number of options to return for volume and open interest changes
+    n_oi: Number of options with highest open interest to return for each right and expiry
+    returns:
+        dict of dataframes: highest_volume, highest_call_oi, highest_put_oi, highest_changers and highest_pc_changers,
+        ready to be shown in the report (session dates as dd/mm/YYYY strings, expiration dates as YYYY/mm/dd strings)
+    '''
+    ldf = chain_store.to_legacy_dates(ldf.drop_duplicates(), ['session_date', 'open_interest_date'])
+    pdf = chain_store.to_legacy_dates(pdf.drop_duplicates(), ['session_date', 'open_interest_date'])
+    ldf['expiration_date'], ldf_filenames = _format_expiration_dates(ldf['expiration_date'])
+    pdf['expiration_date'], _ = _format_expiration_dates(pdf['expiration_date'])
     
     # Get N options with higher volume in the last day of trading available
     ldf_high_volume = ldf[ldf.volume > 0].nlargest(n, 'volume').drop_duplicates(keep='first')
-    ldf['oiev_chart_filename'] = ldf['expiration_date'].apply(lambda x: datetime.strptime(x, '%Y/%m/%d').strftime('%Y%m%d'))
+    ldf['oiev_chart_filename'] = ldf_filenames
     
-    # Get 3 options with higher open interest for each right and expiry available
-    column_names = list(ldf.columns.values)
-    ldf_high_call_oi = pd.DataFrame(columns=column_names)
-    ldf_high_put_oi = pd.DataFrame(columns=column_names)
-
-    for expiry in sorted(ldf.expiration_date.unique().tolist()):
-        ldf_high_call_oi = ldf_high_call_oi.append(ldf.loc[(ldf.expiration_date == expiry) & (ldf.right == 'C')].nlargest(3, 'open_interest').drop_duplicates(keep='first'))
-        ldf_high_put_oi = ldf_high_put_oi.append(ldf.loc[(ldf.expiration_date == expiry) & (ldf.right == 'P')].nlargest(3, 'open_interest').drop_duplicates(keep='first'))
-    ldf_high_call_oi.sort_values(by=['expiration_date', 'open_interest'], ascending=[0, 0])
-    ldf_high_put_oi.sort_values(by=['expiration_date', 'open_interest'], ascending=[0, 0])
+    # Get 3 options with higher open interest for each right and expiry available (sorted by expiry)
+    ldf_high_oi = ldf[ldf.open_interest.notnull()].sort_values(by=['expiration_date', 'open_interest'], ascending=[True, False], kind='mergesort')
+    ldf_high_oi = ldf_high_oi.groupby(['expiration_date', 'right'], sort=False, observed=True).head(n_oi)
+    ldf_high_call_oi = ldf_high_oi[ldf_high_oi.right == 'C']
+    ldf_high_put_oi = ldf_high_oi[ldf_high_oi.right == 'P']
         
     # Merge with previous day data and compare to detect important changes in open interest
     mdf = ldf.merge(pdf, on=['strike', 'right', 'expiration_date'], how='inner', suffixes=('_latest', '_previous'))
-    mdf['open_interest_diff'] = mdf.apply(lambda x: x['open_interest_latest'] - x['open_interest_previous'], axis=1)
-    mdf['open_interest_diff_pc'] = mdf.apply(lambda x: (x['open_interest_latest'] - x['open_interest_previous']) / x['open_interest_previous'] if x['open_interest_previous'] > 0 else x['open_interest_latest'], axis=1)
-    mdf['open_interest_diff_pc_str'] = mdf.apply(lambda x: '{:.2f}%'.format(100 * x['open_interest_diff_pc']), axis=1)
-    mdf['oiev_chart_filename'] = mdf['expiration_date'].apply(lambda x: datetime.strptime(x, '%Y/%m/%d').strftime('%Y%m%d'))
+    mdf['open_interest_diff'] = mdf['open_interest_latest'] - mdf['open_interest_previous']
+    mdf['open_interest_diff_pc'] = (mdf['open_interest_diff'] / mdf['open_interest_previous']).where(mdf['open_interest_previous'] > 0, mdf['open_interest_latest'])
+    mdf['open_interest_diff_pc_str'] = (100 * mdf['open_interest_diff_pc']).map('{:.2f}%'.format)
         
     # Get options with greater change in open interest (N positive)
-    mdf_highest_changers = mdf.loc[mdf.open_interest_diff > 0].nlargest(n, 'open_interest_diff').drop_duplicates(keep='first')
+    mdf_increasing = mdf.loc[mdf.open_interest_diff > 0]
+    mdf_highest_changers = mdf_increasing.nlargest(n, 'open_interest_diff').drop_duplicates(keep='first')
     # And with greater porcentual change in open interest (N positive)
-    mdf_highest_pc_changers = mdf.loc[mdf.open_interest_diff > 0].nlargest(n, 'open_interest_diff_pc').drop_duplicates(keep='first')
+    mdf_highest_pc_changers = mdf_increasing.nlargest(n, 'open_interest_diff_pc').drop_duplicates(keep='first')
         
     # Return as dict
     return {'highest_volume': ldf_high_volume, 'highest_call_oi': ldf_high_call_oi, 'highest_put_oi': ldf_high_put_oi, 'highest_changers': mdf_highest_changers, 'highest_pc_changers': mdf_highest_pc_changers,}
 
     
+def get_iv_summary(ticker: str, root=ib_bar_store.bar_store_folder):
+    '''
+    Returns the latest implied volatility of an underlying stored from IB (see ib_iv_downloader.py), with its range and
+    rank within the last year, or None if there is no stored series for it
+    '''
+    bars = ib_bar_store.load_symbol_bars(ticker, 'OPTION_IMPLIED_VOLATILITY', '1 day', root)
+    if bars is None or bars.empty:
+        return None
+    bars = bars[bars['date'] > bars['date'].iloc[-1] - pd.DateOffset(years=1)]
+    iv = bars['close']
+    low, high = iv.min(), iv.max()
+    return {'date': bars['date'].iloc[-1].strftime('%d/%m/%Y'), 'last': iv.iloc[-1], 'min': low, 'max': high,
+            'rank': (iv.iloc[-1] - low) / (high - low) if high > low else 0.0}
+
+
 def create_report_folder(session_date: str):
     strdate = datetime.strptime(session_date, '%d/%m/%Y').strftime('%Y%m%d')
     output_folder = 'report_{}'.format(strdate)
@@ -72,7 +112,7 @@ def _get_latest_session_date(ticker, df):
     return value
     
     
-def generate_oi_report(movements, output_folder, oi_plots_files, strike_skew_plot_files, exp_skew_plot_files, tickers_under_analysis):
+def generate_oi_report(movements, output_folder, oi_plots_files, strike_skew_plot_files, exp_skew_plot_files, tickers_under_analysis, iv_data=None):
     templateLoader = jinja2.FileSystemLoader('templates')
     templateEnv = jinja2.Environment(
 	    autoescape=False,
@@ -96,6 +136,7 @@ def generate_oi_report(movements, output_folder, oi_plots_files, strike_skew_plo
         volume_data[ticker]['poi_pc_option_list'] = [opt for _, opt in movements[ticker]['highest_pc_changers'].iterrows()]
         volume_data[ticker]['highest_call_oi']    = [opt for _, opt in movements[ticker]['highest_call_oi'].iterrows()]
         volume_data[ticker]['highest_put_oi']     = [opt for _, opt in movements[ticker]['highest_put_oi'].iterrows()]
+        volume_data[ticker]['iv']                 = (iv_data or {}).get(ticker)
         
         oi_data[ticker] = sorted(oi_plots_files[ticker], key=lambda tup: tup[1])
         
@@ -141,6 +182,159 @@ def copy_candlestick_datafiles(report_path: str):
             copy2(candlestick_datafile, os.path.join('reports', report_path, '{}_candlestick_data.csv'.format(ticker)))
 
             
+def get_report_session_date(tickers: list):
+    '''
+    Returns the latest session available in the chain store among the given tickers (dd/mm/YYYY format)
+    '''
+    sessions = [chain_store.list_sessions(ticker) for ticker in tickers]
+    latest = max([s[-1] for s in sessions if s])
+    return datetime.strptime(latest, chain_store.partition_date_format).strftime('%d/%m/%Y')
+
+
+def process_ticker(ticker: str, S: float, session_date: str, output_folder: str, risk_free_rate: float, force_rewrite: bool, plot_format: str):
+    '''
+    Runs the whole per-ticker stage of the report: loads the 2 latest sessions, calculates IV and greeks, looks for
+    big movements, renders the skew plots and queues the open interest plot jobs of the ticker (see collect_plot_files).
+    Tickers are independent, so this can run in a worker process.
+    ticker: Ticker of the underlying asset
+    S: Current underlying price
+    session_date: Report session date (dd/mm/YYYY)
+    output_folder: Report output folder
+    risk_free_rate: Risk-free interest rate
+    force_rewrite: Rewrites existing images if activated
+    plot_format: One of plot_renderer.output_formats
+    returns:
+        dict with movements, plot_jobs, oiev_rows (job key -> movement rows showing its plot), strike_skew_plot_file,
+        exp_skew_plot_file, iv (see get_iv_summary) and timings (seconds per step),
+        or None if there is not enough data for this ticker
+    '''
+    timings = {}
+    step_start = time.perf_counter()
+    
+    # Get 2 last sessions to be compared
+    sessions = chain_store.list_sessions(ticker)
+    if len(sessions) < 2:
+        print('ERROR: not enough sessions in the chain store for ticker {}'.format(ticker))
+        return None
+    
+    # Load latest session data and previous day data
+    try:
+        ldf = chain_store.load_chain(ticker, sessions[-1:])
+    except Exception as e:
+        print('ERROR trying to read session {} of {}: {}'.format(sessions[-1], ticker, e))
+        return None
+    try:
+        pdf = chain_store.load_chain(ticker, sessions[-2:-1])
+    except Exception as e:
+        print('ERROR trying to read session {} of {}: {}'.format(sessions[-2], ticker, e))
+        return None
+        
+    # Continue with the next ticker if DataFrame is empty:
+    if ldf.empty:
+        return None
+    timings['load'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    
+    # Add a column to both DataFrames with the % diff between each strike and current underlying price
+    ldf['diff_from_underlying_price'] = ldf['strike'].apply(get_percentual_diff, args=(S,))
+    pdf['diff_from_underlying_price'] = pdf['strike'].apply(get_percentual_diff, args=(S,))
+    
+    # Calculate implied volatility and greeks for latest data available (and also for previous day)
+    ldf = greeks.add_greeks(ldf, S, risk_free_rate, datetime.now())
+    #pdf['iv'] = skew_plot.calculate_iv(pdf, S, r=risk_free_rate, ticker=ticker)
+    timings['greeks'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+   
+    # Look for big movements for each ticker
+    movements = get_big_movements(ldf, pdf)
+    timings['movements'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    
+    # Queue an open interest evolution plot for those options (jobs only carry a handle to the memory-mapped history,
+    # which each rendering process maps once and reads only the contracts it needs from). An option may show up in
+    # several movements, but its plot is rendered once, as every job of the same option writes the same files.
+    plot_jobs = []
+    oiev_rows = {}  # Job key -> list of (movement, index) showing its plot
+    all_historical_data = history_cache.update_history(ticker)
+    for key, df in movements.items():
+        for index, row in df.iterrows():
+            expiry = chain_store.parse_date(row.expiration_date, '%Y/%m/%d')
+            job_key = (ticker, 'oiev', row.strike, expiry)
+            if job_key not in oiev_rows:
+                oiev_rows[job_key] = []
+                plot_jobs.append(plot_renderer.PlotJob(job_key, oip.plot_open_interest_evolution,
+                                                       (all_historical_data, row.strike, expiry, ticker, output_folder, force_rewrite, True, plot_format)))
+            oiev_rows[job_key].append((key, index))
+    
+    # Get all available expiration dates from previous session
+    expiration_dates = pdf.expiration_date.unique()
+    
+    # Queue open interest plots for all the available expiration dates
+    for t in expiration_dates:
+        if chain_store.parse_date(session_date) < t:
+            plot_jobs.append(plot_renderer.PlotJob((ticker, 'oi', t.strftime(chain_store.legacy_date_format)), oip.plot_open_interest,
+                                                   (ldf[ldf.expiration_date == t], t, ticker, output_folder, force_rewrite, True, plot_format)))
+    timings['plot_jobs'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+                
+    # Generate volatility skew plots for next expiries and strikes covering 20% of current underlying asset price
+    strike_skew_plot_file = None
+    exp_skew_plot_file = None
+    try:
+        strike_skew_plot_file = skew_plot.plot_strikes_skew(ldf, expiration_dates[:4], ticker, output_folder, force_rewrite, True)
+    except Exception as e:
+        print('ERROR while plotting strikes skew: {}'.format(e))
+    try:
+        strikes_to_cover = [k for k in sorted(np.array(ldf.strike.unique().tolist())) if abs(k-S) <= (0.2 * S)]
+        exp_skew_plot_file = skew_plot.plot_expiration_skew(ldf, strikes_to_cover, ticker, output_folder, force_rewrite, True)
+    except Exception as e:
+        print('ERROR while plotting expiration skew: {}'.format(e))
+    timings['skew_plots'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+    
+    # Get the implied volatility of the underlying from the IB bar store
+    iv = None
+    try:
+        iv = get_iv_summary(ticker)
+    except Exception as e:
+        print('ERROR while reading implied volatility of {}: {}'.format(ticker, e))
+    timings['iv'] = time.perf_counter() - step_start
+    
+    return {'movements': movements, 'plot_jobs': plot_jobs, 'oiev_rows': oiev_rows, 'strike_skew_plot_file': strike_skew_plot_file,
+            'exp_skew_plot_file': exp_skew_plot_file, 'iv': iv, 'timings': timings}
+
+
+def collect_plot_files(result: dict, rendered: dict):
+    '''
+    Updates the movements of a ticker with the filenames of its rendered open interest evolution plots,
+    and returns the list of its open interest plots as (expiration date, image path) tuples
+    result: Per-ticker result returned by process_ticker
+    rendered: Results of plot_renderer.render_jobs
+    '''
+    oi_plots_files = []
+    result['timings']['rendering'] = 0.0
+    for job in result['plot_jobs']:
+        filename, seconds = rendered.get(job.key, (None, 0.0))
+        result['timings']['rendering'] += seconds
+        if job.key[1] == 'oiev':
+            if filename:
+                for key, index in result['oiev_rows'][job.key]:
+                    result['movements'][key].at[index, 'oiev_chart_filename'] = filename
+            else:
+                print('ERROR: Failed to create open interest evolution plot for {} {} expiring on {}'.format(job.key[0], job.args[1], job.args[2]))
+        elif filename:
+            oi_plots_files.append((job.key[2], path.join('img', filename)))
+    return oi_plots_files
+
+
+def print_timings(timings: dict, wall_time: float):
+    print('Timing breakdown per ticker (seconds):')
+    for ticker in sorted(timings):
+        steps = ', '.join(['{}: {:.2f}'.format(step, seconds) for step, seconds in timings[ticker].items()])
+        print('  {}: {:.2f} ({})'.format(ticker, sum(timings[ticker].values()), steps))
+    print('Total wall time: {:.2f}'.format(wall_time))
+
+
 if __name__ == '__main__':
     # Configure the command line options
     parser = ArgumentParser()
@@ -148,114 +342,80 @@ if __name__ == '__main__':
                         help='Risk free rate. Default: 0.008')  # https://ycharts.com/indicators/3_month_t_bill
     parser.add_argument('-f', '--force_rewrite', action='store_true', default=False,
                         help='Rewrites existing images if actived')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of worker processes used to process tickers and render plots in parallel. Default: 1')
+    parser.add_argument('-p', '--plot_format', type=str, default=plot_renderer.default_output_format, choices=sorted(plot_renderer.output_formats.keys()),
+                        help='Output format of open interest plots. Default: {}'.format(plot_renderer.default_output_format))
     config = parser.parse_args()
+    start = time.perf_counter()
 
     # Get all available tickers
-    data_folder = 'data'
-    output_folder = None
-    available_tickers = [f for f in os.listdir(data_folder) if path.isdir(path.join(data_folder, f)) and os.listdir(path.join(data_folder, f))]
+    available_tickers = chain_store.list_tickers()
     
     # Get current underlying prices for all the contracts under analysis
     tickers_under_analysis = pd.read_csv('current.csv', sep=';', names=['ticker', 'yahoo_ticker', 'tradingview_ticker', 'description', 'last_price'], dtype={'ticker': str, 'yahoo_ticker': str, 'tradingview_ticker': str, 'description': str, 'last_price': float})
     
-    # Iterate tickers to find important changes in open interest and volume
-    movements              = {}
-    oi_plots_files         = {}
-    strike_skew_plot_files = {}
-    exp_skew_plot_files    = {}
+    # Create report folder (if it does not exist)
+    try:
+        session_date = get_report_session_date(available_tickers)
+        output_folder = create_report_folder(session_date)
+    except Exception as e:
+        session_date = '01/01/1990'
+        output_folder = 'aux'
+        os.makedirs(path.join('reports', output_folder, 'img'), exist_ok=True)
+    
+    # Process every ticker (in parallel if several workers are configured) to find important changes in open interest and volume
+    jobs = {}
     for ticker in available_tickers:
         # Get current underlying price
-        S = float(tickers_under_analysis.loc[tickers_under_analysis.ticker == ticker, 'last_price'])
-
-        # Get 2 last daily files to be compared
-        ticker_data_folder = path.join(data_folder, ticker)
-        daily_files = sorted([f for f in os.listdir(ticker_data_folder) if path.isfile(path.join(ticker_data_folder, f)) and f.lower().endswith('.json')])
-        latest_daily_filepath = path.join(ticker_data_folder, daily_files[-1])
-        previous_day_filepath = path.join(ticker_data_folder, daily_files[-2])
-        
-        # Load latest session data and previous day data
         try:
-            ldf = pd.read_json(latest_daily_filepath)
-        except Exception as e:
-            print('ERROR trying to read json file {}: {}'.format(latest_daily_filepath, e))
-            continue
-        try:
-            pdf = pd.read_json(previous_day_filepath)
-        except Exception as e:
-            print('ERROR trying to read json file {}: {}'.format(previous_day_filepath, e))
-            continue
-            
-        # Continue with the next ticker if DataFrame is empty:
-        if ldf.empty:
+            S = float(tickers_under_analysis.loc[tickers_under_analysis.ticker == ticker, 'last_price'].iloc[0])
+        except IndexError:
+            print('ERROR: no current underlying price for ticker {}'.format(ticker))
             continue
-        
-        # Add a column to both DataFrames with the % diff between each strike and current underlying price
-        ldf['diff_from_underlying_price'] = ldf['strike'].apply(get_percentual_diff, args=(S,))
-        pdf['diff_from_underlying_price'] = pdf['strike'].apply(get_percentual_diff, args=(S,))
-        
-        # Calculate implied volatility for latest data available (and also for previous day)
-        ldf['iv'] = skew_plot.calculate_iv(ldf, S, r=config.risk_free_rate, ticker=ticker)
-        #pdf['iv'] = skew_plot.calculate_iv(pdf, S, r=config.risk_free_rate, ticker=ticker)
-       
-        # Look for big movements for each ticker
-        movements[ticker] = get_big_movements(ldf, pdf)
-        
-        # Create report folder (if it does not exist)
-        if not output_folder:
-            try:
-                session_date = max([sdate['highest_volume'].iloc[0].session_date for sdate in  list(movements.values())])
-                output_folder = create_report_folder(session_date)
-            except Exception as e:
-                output_folder = 'aux'
-                os.makedirs(output_folder)
-                os.makedirs(path.join(output_folder, 'img'))
-        
-        # Generate an open interest evolution plot for those options
-        daily_files = [path.join(ticker_data_folder, f) for f in os.listdir(ticker_data_folder) if path.isfile(path.join(ticker_data_folder, f)) and f.lower().endswith('.json')]
-        all_historical_data = pd.DataFrame()
-        for file in daily_files:  # Append dataframe into a single dataframe with the info from all files
-            try:
-                df = pd.read_json(file)
-                all_historical_data = all_historical_data.append(df)
-            except Exception as e:
-                print('ERROR while reading file {}: {}'.format(file, e))
-        for key, df in movements[ticker].items():
-            for index, row in df.iterrows():
-                try:
-                    filename = oip.plot_open_interest_evolution(all_historical_data, row.strike, row.expiration_date, ticker, output_folder, config.force_rewrite, True)
-                    df.set_value(index, 'oiev_chart_filename', filename)
-                except Exception as e:
-                    print(key, ticker, type(row), row)
-                    print('ERROR: Failed to create open interest evolution plot for {} {} expiring on {}'.format(ticker, row.strike, row.expiration_date))
-                    print(e)
-        
-        # Get all available expiration dates from previous session
-        expiration_dates = pdf.expiration_date.unique()
-        
-        # Generate open interest plots for all the available expiration dates
-        oi_plots_files[ticker] = []
-        for t in expiration_dates:
-            if datetime.strptime(session_date, '%d/%m/%Y') < datetime.strptime(t, '%d/%m/%Y'):
+        jobs[ticker] = (ticker, S, session_date, output_folder, config.risk_free_rate, config.force_rewrite, config.plot_format)
+    
+    results = {}
+    if config.workers > 1:
+        with ProcessPoolExecutor(max_workers=config.workers) as executor:
+            futures = {executor.submit(process_ticker, *args): ticker for ticker, args in jobs.items()}
+            for future in as_completed(futures):
                 try:
-                    image_filename = oip.plot_open_interest(ldf, t, ticker, output_folder, config.force_rewrite, True)
-                    if image_filename:
-                        oi_plots_files[ticker].append((t, path.join('img', image_filename)))
+                    results[futures[future]] = future.result()
                 except Exception as e:
-                    traceback.print_exc()
-                    print('ERROR: Failed to create open interest plot for {} expiring on {}'.format(ticker, t))
-                    print(e)
-                    
-        # Generate volatility skew plots for next expiries and strikes covering 20% of current underlying asset price
-        try:
-            strike_skew_plot_files[ticker] = skew_plot.plot_strikes_skew(ldf, expiration_dates[:4], ticker, output_folder, config.force_rewrite, True)
-        except Exception as e:
-            print('ERROR while plotting strikes skew: {}'.format(e))
-        try:
-            strikes_to_cover = [k for k in sorted(np.array(ldf.strike.unique().tolist())) if abs(k-S) <= (0.2 * S)]
-            exp_skew_plot_files[ticker] = skew_plot.plot_expiration_skew(ldf, strikes_to_cover, ticker, output_folder, config.force_rewrite, True)
-        except Exception as e:
-            print('ERROR while plotting expiration skew: {}'.format(e))
+                    print('ERROR while processing ticker {}: {}'.format(futures[future], e))
+    else:
+        for ticker, args in jobs.items():
+            try:
+                results[ticker] = process_ticker(*args)
+            except Exception as e:
+                traceback.print_exc()
+                print('ERROR while processing ticker {}: {}'.format(ticker, e))
+    
+    # Render the queued plots of all tickers at once
+    plot_jobs = [job for result in results.values() if result is not None for job in result['plot_jobs']]
+    rendered = plot_renderer.render_jobs(plot_jobs, config.workers)
+    
+    # Gather per-ticker results
+    movements              = {}
+    oi_plots_files         = {}
+    strike_skew_plot_files = {}
+    exp_skew_plot_files    = {}
+    iv_data                = {}
+    timings                = {}
+    for ticker, result in results.items():
+        if result is None:
+            continue
+        movements[ticker] = result['movements']
+        oi_plots_files[ticker] = collect_plot_files(result, rendered)
+        if result['strike_skew_plot_file'] is not None:
+            strike_skew_plot_files[ticker] = result['strike_skew_plot_file']
+        if result['exp_skew_plot_file'] is not None:
+            exp_skew_plot_files[ticker] = result['exp_skew_plot_file']
+        iv_data[ticker] = result['iv']
+        timings[ticker] = result['timings']
             
-    report_path = generate_oi_report(movements, output_folder, oi_plots_files, strike_skew_plot_files, exp_skew_plot_files, tickers_under_analysis)
+    report_path = generate_oi_report(movements, output_folder, oi_plots_files, strike_skew_plot_files, exp_skew_plot_files, tickers_under_analysis, iv_data)
     copy_candlestick_datafiles(output_folder)
-    generate_link_to_latest(report_path)
\ No newline at end of file
+    generate_link_to_latest(report_path)
+    print_timings(timings, time.perf_counter() - start)
@@ -1,5 +1,5 @@
-import py_vollib.black_scholes as bs
-import py_vollib.black_scholes.implied_volatility as bsiv
+import iv_solver
+import greeks
 from datetime import datetime
 import numpy as np
 import matplotlib.pyplot as plt
@@ -10,7 +10,74 @@ sns.set(color_codes=True)
 '''
 
 
-def plot_risk_graph(options_data, S, r, save_png=False):
+def get_default_dates(options_data):
+    '''
+    Returns the default time slices for a risk graph: today, front expiration and back expiration
+    '''
+    expiration_dates = [datetime.strptime(opt['expiration_date'], '%d/%m/%Y') for opt in options_data['options']]
+    return [datetime.today(), min(expiration_dates), max(expiration_dates)]
+
+
+def get_price_vector(options_data, S, num_points=500):
+    '''
+    Returns the underlying prices grid for a risk graph, 10% apart from the min and max strikes
+    (making sure current underlying price is into the range)
+    '''
+    strikes = [opt['strike'] for opt in options_data['options']]
+    min_strike = min(min(strikes), S)
+    max_strike = max(max(strikes), S)
+    strike_spread = max_strike - min_strike
+    return np.linspace(min_strike - strike_spread * 0.1, max_strike + strike_spread * 0.1, num_points)
+
+
+def risk_graph_surface(options_data, S, r, dates=None, num_points=500):
+    '''
+    Calculates the P/L surface of the combination of options provided for the given time slices,
+    without plotting it. Each leg IV is calculated once from its latest price, and the whole
+    (dates x prices x legs) surface is then priced at once with Black-Scholes.
+
+    inputs:
+    options_data -> options data composing the strategy
+    S -> current underlying price
+    r -> interest rate on a 3-month U.S. Treasury bill or similar
+    dates -> list of datetimes to evaluate (default: today, front and back expirations)
+    num_points -> resolution of the underlying prices grid (default 500)
+    returns:
+        tuple (x_vector, dates, pl, legs_pl) where pl has shape (dates, prices) and legs_pl has
+        shape (dates, prices, legs). Legs already expired at a given date do not contribute to P/L
+    '''
+    options_list = options_data['options']
+    meta = options_data['meta']
+    if dates is None:
+        dates = get_default_dates(options_data)
+    x_vector = get_price_vector(options_data, S, num_points)
+
+    # Legs data as arrays
+    K = np.array([opt['strike'] for opt in options_list], dtype=float)
+    flag = np.array([opt['right'] for opt in options_list])
+    amount = np.array([opt['amount'] for opt in options_list], dtype=float)
+    last_price = np.array([opt['last_price'] for opt in options_list], dtype=float)
+    expiration_dates = [opt['expiration_date'] for opt in options_list]
+
+    # Calculate IV from latest option price, once per leg
+    sigma, _ = iv_solver.implied_volatility(last_price, S, K, iv_solver.years_to_expiry(expiration_dates, datetime.today()), r, flag)
+
+    # Time to expiration in years for each (date, leg), broadcasted against the prices grid
+    t_exp = np.array([iv_solver.years_to_expiry(expiration_dates, t) for t in dates]).reshape(len(dates), 1, len(options_list))
+    x = x_vector.reshape(1, -1, 1)
+    call = iv_solver.is_call(flag)
+    with np.errstate(invalid='ignore'):
+        value = greeks.black_scholes(call, x, K, t_exp, r, sigma)
+    # At expiration the option is only worth its intrinsic value
+    intrinsic = np.where(call, np.maximum(x - K, 0.0), np.maximum(K - x, 0.0))
+    value = np.where(t_exp == 0, intrinsic, value)
+
+    legs_pl = np.where(t_exp >= 0, meta['amount'] * meta['multiplier'] * amount * value, 0.0)
+    pl = meta['amount'] * meta['multiplier'] * meta['premium'] - meta['commisions'] + legs_pl.sum(axis=2)
+    return x_vector, dates, pl, legs_pl
+
+
+def plot_risk_graph(options_data, S, r, save_png=False, dates=None, num_points=500):
     '''
     Creates a risk graph for the combination of options provided
     in the input list of options for the different times to
@@ -22,67 +89,20 @@ def plot_risk_graph(options_data, S, r, save_png=False):
     S -> current underlying price
     r -> interest rate on a 3-month U.S. Treasury bill or similar
     save_png -> determines if the plot is saved as a PNG file (default False)
+    dates -> list of datetimes to plot (default: today, front and back expirations)
+    num_points -> resolution of the underlying prices grid (default 500)
     returns:
         list of tuples (x, (datetime, y))
     '''
-    # Get the list of options from options_data
-    options_list = options_data['options']
-    
-    # First get the graph bounds, 10% apart from the min and max strikes
-    min_strike = None
-    max_strike = None
-    for opt in options_list:
-        if (min_strike is None) or (opt['strike'] < min_strike):
-            min_strike = opt['strike']
-        if (max_strike is None) or (opt['strike'] > max_strike):
-            max_strike = opt['strike']
-    # Make sure current underlying price is into the range
-    if min_strike > S:
-        min_strike = S
-    if max_strike < S:
-        max_strike = S
-            
-    # Determine front expiration date
-    front_expiration = None
-    back_expiration = None
-    for opt in options_list:
-        aux_date = datetime.strptime(opt['expiration_date'], '%d/%m/%Y')
-        if (front_expiration is None) or (aux_date < front_expiration):
-            front_expiration = aux_date
-        if (back_expiration is None) or (aux_date > back_expiration):
-            back_expiration = aux_date
-
-    # Prices vector
-    strike_spread = max_strike - min_strike
-    x_vector = np.linspace(min_strike - strike_spread * 0.1, max_strike + strike_spread * 0.1, 500)
+    x_vector, dates, pl, _ = risk_graph_surface(options_data, S, r, dates, num_points)
 
     # Now plot the risk graph for the different time values provided
+    back_expiration = datetime.strptime(options_data['options'][-1]['expiration_date'], '%d/%m/%Y')
     return_values = []
-    y = []
-    for t in [datetime.today(), front_expiration, back_expiration]:
-        y_vector = np.zeros(len(x_vector))
-        y_vector.fill(options_data['meta']['amount'] *  options_data['meta']['multiplier'] * options_data['meta']['premium'] - options_data['meta']['commisions'])
-        y.append(y_vector)
-        # Create the discrete values of P/L to plot against xrange
-        for opt in options_list:
-            # Get time to expiration in years
-            days_to_expire = (datetime.strptime(opt['expiration_date'], '%d/%m/%Y') - t).days
-            t_exp = days_to_expire / 365.
-            if t_exp >= 0:
-                # Calculate IV from latest option price
-                iv = bsiv.implied_volatility(opt['last_price'], S, opt['strike'], t_exp, r, opt['right'].lower())
-                
-                # Calculate option price using black-scholes given that IV
-                y[-1] += np.array(
-                    [
-                        options_data['meta']['amount'] * options_data['meta']['multiplier'] * opt['amount'] * 
-                        bs.black_scholes(opt['right'].lower(), x, opt['strike'], t_exp, r, iv)
-                        for x in x_vector
-                    ])
-
-        # Get the number of days to expiration from today for plot's legend
-        plt.plot(x_vector, y[-1], label='t: ' + str(days_to_expire))
-        return_values.append((t, y[-1]))
+    for t, y in zip(dates, pl):
+        # Get the number of days to expiration from each date for plot's legend
+        plt.plot(x_vector, y, label='t: ' + str((back_expiration - t).days))
+        return_values.append((t, y))
 
     # Plot a vertical line where the underlying is currently trading at
     plt.axvline(S, color='r')
@@ -95,7 +115,7 @@ def plot_risk_graph(options_data, S, r, save_png=False):
     plt.ylabel('P/L')
     # Save the plot as a PNG if required, or show plot in a window
     if save_png:
-        plt.savefig(datetime.today().strftime(options_data.meta.ticker + '_%d%b%y.png'))
+        plt.savefig(datetime.today().strftime(options_data['meta']['ticker'] + '_%d%b%y.png'))
     else:
         # Show the plot
         plt.show()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+from os import path
+import gzip
+import json
+from datetime import datetime
+from time import time
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+
+# Archive of the raw pages crawled by the Eurex spiders, one folder per product and session date:
+#     <EUREX_HTTPCACHE_DIR>/<ticker>/<YYYYMMDD>/<expiry>_<right>.html.gz -> page body
+#     <EUREX_HTTPCACHE_DIR>/<ticker>/<YYYYMMDD>/<expiry>_<right>.json    -> url, status, headers and timestamp
+# Pages without expiry (like the start page of each product) are stored as index.
+# When crawling a session, a page not archived yet for it is revalidated against the last archived one (ETag and
+# Last-Modified), so unchanged pages are not downloaded again. With EUREX_REPLAY, pages are only read from the
+# archive of the session, so a session can be parsed again without network (see crawler.py --replay).
+session_date_format = '%Y%m%d'
+
+
+def get_session_date(settings):
+    return settings.get('EUREX_SESSION_DATE') or datetime.now().strftime(session_date_format)
+
+
+def cache_key(spider, request):
+    '''
+    Returns the (product, page) key of a request
+    '''
+    ticker = getattr(spider, 'ticker', None) or spider.name
+    if 'expiration_date' in request.meta:
+        return ticker, '{}_{}'.format(request.meta['expiration_date'], request.meta['right'])
+    return ticker, 'index'
+
+
+class EurexCacheStorage:
+    '''
+    Scrapy HTTPCACHE_STORAGE keyed on product, expiry, right and session date
+    '''
+    def __init__(self, settings):
+        self.cachedir = settings.get('EUREX_HTTPCACHE_DIR', path.join('cache', 'http'))
+        self.session_date = get_session_date(settings)
+        self.replay = settings.getbool('EUREX_REPLAY')
+
+    def open_spider(self, spider):
+        pass
+
+    def close_spider(self, spider):
+        pass
+
+    def _entry_path(self, ticker: str, session_date: str, page: str):
+        return path.join(self.cachedir, ticker, session_date, page)
+
+    def _find_entry(self, ticker: str, page: str):
+        '''
+        Returns the session date of the archived page to use for the crawled session, or None if there is none
+        '''
+        if path.isfile(self._entry_path(ticker, self.session_date, page) + '.json'):
+            return self.session_date
+        if self.replay or not path.isdir(path.join(self.cachedir, ticker)):
+            return None
+        previous = [s for s in os.listdir(path.join(self.cachedir, ticker)) if s < self.session_date and path.isfile(self._entry_path(ticker, s, page) + '.json')]
+        return max(previous) if previous else None
+
+    def retrieve_response(self, spider, request):
+        ticker, page = cache_key(spider, request)
+        session_date = self._find_entry(ticker, page)
+        if session_date is None:
+            return None
+        entry_path = self._entry_path(ticker, session_date, page)
+        with open(entry_path + '.json', 'r') as f:
+            metadata = json.load(f)
+        with gzip.open(entry_path + '.html.gz', 'rb') as f:
+            body = f.read()
+        headers = Headers({k: [v.encode('latin-1') for v in values] for k, values in metadata['headers'].items()})
+        request.meta['cache_timestamp'] = metadata['timestamp']
+        request.meta['cache_session_date'] = session_date
+        respcls = responsetypes.from_args(headers=headers, url=metadata['url'], body=body)
+        return respcls(url=metadata['url'], headers=headers, status=metadata['status'], body=body)
+
+    def store_response(self, spider, request, response):
+        ticker, page = cache_key(spider, request)
+        entry_path = self._entry_path(ticker, self.session_date, page)
+        os.makedirs(path.dirname(entry_path), exist_ok=True)
+        with gzip.open(entry_path + '.html.gz', 'wb') as f:
+            f.write(response.body)
+        metadata = {'url': response.url, 'status': response.status, 'timestamp': time(),
+                    'headers': {k.decode('latin-1'): [v.decode('latin-1') for v in values] for k, values in response.headers.items()}}
+        # Metadata is written last, as it marks the entry as complete
+        with open(entry_path + '.json.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(entry_path + '.json.tmp', entry_path + '.json')
+
+
+class EurexCachePolicy(RFC2616Policy):
+    '''
+    RFC2616 policy which always revalidates the pages archived for a previous session
+    '''
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.session_date = get_session_date(settings)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if request.meta.get('cache_session_date') != self.session_date:
+            self._set_conditional_validators(request, cachedresponse)
+            return False
+        return super().is_cached_response_fresh(cachedresponse, request)
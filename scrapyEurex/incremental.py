@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import os
+from os import path
+import json
+import hashlib
+from datetime import datetime
+
+
+# State of the incremental crawl of a product, one file per market session crawled:
+#     <EUREX_CRAWL_STATE_DIR>/<ticker>/<YYYYMMDD>.json -> {session_date: YYYYMMDD, crawl_date: YYYYMMDD,
+#                                                         pages: page (<expiry>_<right>) -> {fingerprint, volume,
+#                                                                                            unchanged, skipped, fetched}}
+# Files are named after the session date found in the fetched pages (a crawl during a weekend gets the pages of the
+# previous Friday), while the feed and the archived pages of a crawl are named after the day it ran (crawl_date).
+# Together with the feed of the previous crawl (<EUREX_FEED_DIR>/<ticker>/<crawl_date>.json), it lets the next crawl:
+#  - reuse the items of a page whose table is the same as in the previous session (only session dates differ),
+#    instead of building them again
+#  - not request at all illiquid pages (no volume and unchanged at their last fetch) but once every
+#    EUREX_ILLIQUID_CADENCE sessions, reusing their previous items meanwhile
+# Every item of a crawl is stamped with a single session date (see CrawlState.item_session_date).
+state_file_format = '{}.json'
+state_date_format = '%Y%m%d'
+item_date_format = '%d/%m/%Y'
+
+
+def page_fingerprint(rows: list, ignored_cell: int):
+    '''
+    Returns the hash of the cells of a table (list of rows, each one a list of cell texts), ignoring one of the columns
+    '''
+    digest = hashlib.sha1()
+    for cells in rows:
+        digest.update('\x1f'.join(cells[:ignored_cell] + cells[ignored_cell + 1:]).encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+class CrawlState:
+    '''
+    Pages fingerprints and items of the previous session of a product, and the state of the current crawl
+    crawl_date: Day of the crawl (YYYYMMDD), naming its feed and archived pages
+    '''
+    def __init__(self, settings, ticker: str, crawl_date: str):
+        self.ticker = ticker
+        self.crawl_date = crawl_date
+        self.session_date = None  # Market session of the crawled pages (YYYYMMDD), see set_session_date
+        self.enabled = settings.getbool('EUREX_INCREMENTAL')
+        self.replay = settings.getbool('EUREX_REPLAY')
+        self.cadence = settings.getint('EUREX_ILLIQUID_CADENCE', 1)
+        self.folder = path.join(settings.get('EUREX_CRAWL_STATE_DIR', path.join('cache', 'crawl')), ticker)
+        self.feed_folder = path.join(settings.get('EUREX_FEED_DIR', 'data'), ticker)
+        self.previous = {}
+        self.previous_session_date = None
+        self.pages = {}
+        self.items = {}
+        if not self.enabled:
+            return
+        states = self._load_states()
+        if self.replay:
+            # Pages not fetched on the replayed crawl are taken again from the previous one
+            replayed = [state for state in states if state['crawl_date'] == crawl_date]
+            if replayed:
+                self.pages = replayed[-1]['pages']
+                self.session_date = replayed[-1]['session_date']
+                states = [state for state in states if state['session_date'] < self.session_date]
+        previous = [state for state in states if state['crawl_date'] < crawl_date and
+                    path.isfile(path.join(self.feed_folder, '{}.json'.format(state['crawl_date'])))]
+        if previous:
+            self.previous = previous[-1]['pages']
+            self.previous_session_date = previous[-1]['session_date']
+            with open(path.join(self.feed_folder, '{}.json'.format(previous[-1]['crawl_date'])), 'r') as f:
+                for item in json.load(f):
+                    self.items.setdefault((item['expiration_date'], item['right']), []).append(item)
+
+    def _load_states(self):
+        '''
+        Returns the crawl states stored for the product, sorted by session date
+        '''
+        if not path.isdir(self.folder):
+            return []
+        states = []
+        for f in sorted(os.listdir(self.folder)):
+            if not f.endswith('.json'):
+                continue
+            with open(path.join(self.folder, f), 'r') as state_file:
+                state = json.load(state_file)
+            if 'pages' not in state:
+                # States written before they held their session date were named after the crawl date
+                state = {'session_date': f[:-len('.json')], 'crawl_date': f[:-len('.json')], 'pages': state}
+            states.append(state)
+        return states
+
+    def set_session_date(self, item_date: str):
+        '''
+        Sets the session date of the crawl from the one of a fetched page (dd/mm/YYYY), if not set yet. Dates older
+        than the previous session are stale, and never set.
+        returns:
+            False if the date is stale, or differs from the one already set
+        '''
+        session_date = datetime.strptime(item_date, item_date_format).strftime(state_date_format)
+        if self.previous_session_date is not None and session_date < self.previous_session_date:
+            return False
+        if self.session_date is None:
+            self.session_date = session_date
+        return session_date == self.session_date
+
+    def item_session_date(self):
+        '''
+        Returns the session date stamped on every item of the crawl (dd/mm/YYYY): the one of the fetched pages, or
+        the one of the previous session if no page has been fetched, or None if neither is known
+        '''
+        session_date = self.session_date or self.previous_session_date
+        return to_item_date(session_date) if session_date else None
+
+    def previous_items(self, key: str, expiration_date: str, right: str, session_date: str):
+        '''
+        Returns the items of a page in the previous session, with the given session date, or None if there are none
+        '''
+        items = self.items.get((expiration_date, right))
+        if not items or key not in self.previous:
+            return None
+        return [dict(item, session_date=session_date) for item in items]
+
+    def should_fetch(self, key: str):
+        '''
+        Checks if a page has to be requested in this crawl
+        '''
+        if not self.enabled:
+            return True
+        if self.replay:
+            return key not in self.pages or self.pages[key]['fetched'] == self.crawl_date
+        entry = self.previous.get(key)
+        if entry is None or entry['volume'] > 0 or not entry['unchanged']:
+            return True
+        return entry['skipped'] + 1 >= self.cadence
+
+    def is_unchanged(self, key: str, fingerprint: str):
+        '''
+        Checks if a page has the same table as in the previous session
+        '''
+        entry = self.previous.get(key)
+        return self.enabled and not self.replay and entry is not None and entry['fingerprint'] == fingerprint
+
+    def record_fetch(self, key: str, fingerprint: str, volume: int):
+        entry = self.previous.get(key)
+        self.pages[key] = {'fingerprint': fingerprint, 'volume': volume, 'skipped': 0, 'fetched': self.crawl_date,
+                           'unchanged': entry is not None and entry['fingerprint'] == fingerprint}
+
+    def record_skip(self, key: str):
+        self.pages[key] = dict(self.previous[key], skipped=self.previous[key]['skipped'] + 1)
+
+    def save(self):
+        session_date = self.session_date or self.previous_session_date
+        if not self.enabled or self.replay or session_date is None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        state_path = path.join(self.folder, state_file_format.format(session_date))
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump({'session_date': session_date, 'crawl_date': self.crawl_date, 'pages': self.pages}, f, indent=1, sort_keys=True)
+        os.replace(state_path + '.tmp', state_path)
+
+
+def to_item_date(session_date: str):
+    '''
+    Converts a session date (YYYYMMDD) into the date format of the items (dd/mm/YYYY)
+    '''
+    return datetime.strptime(session_date, state_date_format).strftime(item_date_format)
@@ -1,11 +1,122 @@
 # -*- coding: utf-8 -*-
+import math
+import pandas as pd
+from scrapy import signals
+import chain_store
 
-# Define your item pipelines here
-#
-# Don't forget to add your pipeline to the ITEM_PIPELINES setting
-# See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
+# Values found in the items of options not traded, stored as missing values
+missing_values = ['N/A', 'n.a.']
+
+
+class ChainStorePipeline(object):
+    '''
+    Writes the crawled options straight to the chain store (see chain_store.SessionWriter), while crawling.
+    Every option of a crawl is written to a single session partition: the one of the session date of the first item
+    (the spiders stamp every item of a crawl with the session date of the fetched pages).
+    Items are buffered per expiry in column lists, and every batch of EUREX_STORE_BATCH_ROWS options of an expiry is
+    written as a row group of the partition, so memory does not grow with the size of the chain (all buffers are
+    written as well whenever they hold more than EUREX_STORE_MAX_BUFFERED_ROWS options). The partition is made visible
+    when the spider finishes, and kept unchanged if it does not, if some page could not be crawled, or if it would
+    replace a partition holding pages (expiry and right) not crawled this time.
+    '''
+    def __init__(self, root: str, batch_rows: int, max_buffered_rows: int):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.writer = None
+        self.session_date = None
+        self.pages = set()
+        self.dates = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(settings.get('EUREX_STORE_DIR', chain_store.store_folder), settings.getint('EUREX_STORE_BATCH_ROWS', 500),
+                       settings.getint('EUREX_STORE_MAX_BUFFERED_ROWS', 10000))
+        pipeline.stats = crawler.stats
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def to_date(self, value):
+        '''
+        Converts a dd/mm/YYYY date into a datetime64 (only a few distinct dates are crawled, so they are cached)
+        '''
+        date = self.dates.get(value)
+        if date is None:
+            date = self.dates[value] = pd.to_datetime(value, format=chain_store.legacy_date_format, errors='coerce').to_datetime64()
+        return date
 
-class ScrapyeurexPipeline(object):
     def process_item(self, item, spider):
+        if self.session_date is None:
+            self.session_date = item['session_date']
+        key = item['expiration_date']
+        self.pages.add((key, item['right']))
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = {c: [] for c in chain_store.chain_columns}
+        values = dict(item, session_date=self.session_date)
+        for column in chain_store.chain_columns:
+            value = values.get(column)
+            if column in chain_store.date_columns:
+                value = self.to_date(value)
+            elif isinstance(value, str) and value in missing_values:
+                value = math.nan
+            buffer[column].append(value)
+        self.buffered_rows += 1
+        if len(buffer['strike']) >= self.batch_rows:
+            self.flush(spider, key)
+        elif self.buffered_rows >= self.max_buffered_rows:
+            for key in list(self.buffers.keys()):
+                self.flush(spider, key)
         return item
+
+    def flush(self, spider, key):
+        '''
+        Writes the options buffered for an expiry as a row group of the session partition
+        '''
+        buffer = self.buffers.pop(key)
+        if self.writer is None:
+            self.writer = chain_store.SessionWriter(self.ticker(spider), chain_store.parse_date(self.session_date), self.root)
+        self.writer.write(pd.DataFrame(buffer))
+        self.buffered_rows -= len(buffer['strike'])
+        self.stats.inc_value('chain_store/row_groups')
+
+    def ticker(self, spider):
+        return getattr(spider, 'ticker', None) or spider.name
+
+    def close_spider(self, spider):
+        for key in list(self.buffers.keys()):
+            self.flush(spider, key)
+
+    def missing_pages(self, spider):
+        '''
+        Returns the pages (expiry and right) of the session already stored which have not been crawled this time
+        '''
+        session = chain_store.parse_date(self.session_date).strftime(chain_store.partition_date_format)
+        if session not in chain_store.list_sessions(self.ticker(spider), self.root):
+            return set()
+        stored = chain_store.load_chain(self.ticker(spider), [session], ['expiration_date', 'right'], self.root, legacy_dates=True)
+        return set(zip(stored['expiration_date'], stored['right'].astype(str))) - self.pages
+
+    def spider_closed(self, spider, reason):
+        if self.writer is None:
+            return
+        failed = self.stats.get_value('eurex/pages_failed', 0)
+        missing = self.missing_pages(spider) if reason == 'finished' and not failed else set()
+        if reason == 'finished' and not failed and not missing:
+            self.writer.close()
+            self.stats.inc_value('chain_store/rows', self.writer.rows)
+            spider.logger.info('Options of session {} written to {}'.format(self.session_date, self.writer.partition))
+        else:
+            self.writer.abort()
+            if reason != 'finished':
+                cause = 'crawl {}'.format(reason)
+            elif failed:
+                cause = '{} pages could not be crawled'.format(failed)
+            else:
+                cause = '{} pages already stored have not been crawled'.format(len(missing))
+            spider.logger.warning('Options of session {} not written to the chain store ({})'.format(self.session_date, cause))
+        self.writer = None
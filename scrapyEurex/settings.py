@@ -69,9 +69,10 @@ DOWNLOAD_DELAY = 3
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'scrapyEurex.pipelines.ScrapyeurexPipeline': 300,
-#}
+# Options are written to the chain store (store/<TICKER>/<YYYYMMDD>.parquet) while crawling
+ITEM_PIPELINES = {
+    'scrapyEurex.pipelines.ChainStorePipeline': 300,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
@@ -88,11 +89,14 @@ DOWNLOAD_DELAY = 3
 
 # Enable and configure HTTP caching (disabled by default)
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = 'httpcache'
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# Raw pages are archived per product and session date (EUREX_SESSION_DATE, today by default) and revalidated
+# with ETag/Last-Modified on later crawls, see scrapyEurex/httpcache.py
+HTTPCACHE_ENABLED = True
+HTTPCACHE_ALWAYS_STORE = True
+HTTPCACHE_IGNORE_RESPONSE_CACHE_CONTROLS = ['no-store']
+HTTPCACHE_STORAGE = 'scrapyEurex.httpcache.EurexCacheStorage'
+HTTPCACHE_POLICY = 'scrapyEurex.httpcache.EurexCachePolicy'
+EUREX_HTTPCACHE_DIR = 'cache/http'
 
 LOG_STDOUT = True
 LOG_FILE = 'scrapy_output.txt'
\ No newline at end of file
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import scrapy
+from scrapy.settings import Settings
+from lxml import etree
+from scrapyEurex.items import OptionItem
+from scrapyEurex.httpcache import get_session_date
+from scrapyEurex.incremental import CrawlState, page_fingerprint
+from datetime import datetime
+from functools import lru_cache
+
+
+# Compiled once and applied to the lxml tree of every response
+rows_xpath = etree.XPath('(//table[@class="dataTable"])[1]/tbody/tr')
+expiry_dates_xpath = etree.XPath('//select[@id="maturityDate"]/option/@value')
+# Text of every cell of a row in a single query (in document order, cells without text are returned as elements)
+cells_xpath = etree.XPath('td/span[1]/text()[1] | td[not(span[1]/text())]', smart_strings=False)
+
+# Position (0-based) of each field in the cells of a table row
+strike_cell = 0
+open_price_cell = 2
+high_price_cell = 3
+low_price_cell = 4
+percentage_diff_cell = 9
+last_price_cell = 10
+session_date_cell = 11
+volume_cell = 14
+open_interest_cell = 15
+open_interest_date_cell = 16
+
+
+def third_friday(expiration_month: str):
+    '''
+    Returns the expiration date (third Friday of the month, dd/mm/YYYY) of an expiration month in YYYYmm format
+    '''
+    opt_date = datetime.strptime(expiration_month, '%Y%m').date()
+    for d in range(15, 22):
+        opt_date = opt_date.replace(day=d)
+        if opt_date.weekday() == 4:
+            break
+    return opt_date.strftime('%d/%m/%Y')
+
+
+@lru_cache(maxsize=None)
+def to_date(text: str):
+    '''
+    Converts a mm/dd/YYYY date into dd/mm/YYYY (only a few distinct dates appear in a page, so they are cached)
+    '''
+    return datetime.strptime(text, '%m/%d/%Y').strftime('%d/%m/%Y')
+
+
+def page_session_date(rows: list):
+    '''
+    Returns the latest session date (dd/mm/YYYY) of the rows of a page
+    '''
+    return to_date(max(set(cells[session_date_cell] for cells in rows), key=lambda text: datetime.strptime(text, '%m/%d/%Y')))
+
+
+def to_price(text: str):
+    try:
+        return float(text.replace(',', ''))
+    except ValueError:
+        return 'N/A'
+
+
+def row_cells(row):
+    '''
+    Returns the text of every cell of a table row in a single pass
+    '''
+    return [c if isinstance(c, str) else '' for c in cells_xpath(row)]
+
+
+class EurexOptionSpider(scrapy.Spider):
+    '''
+    Base spider for the option chains of an Eurex index. Each index only needs a name, the ticker under which
+    it is stored, its underlying_id, the url of its product folder and its start page, e.g.:
+        name = 'daxspider'
+        ticker = 'DAX'
+        underlying_id = 17254
+        product_url = 'http://www.eurexchange.com/exchange-en/products/idx/dax/'
+        start_urls = [product_url + 'DAX--Options/17254']
+    '''
+    allowed_domains = ["eurexchange.com"]
+    ticker = None
+    underlying_id = None
+    product_url = None
+    url_template = '{product_url}{underlying_id}!quotesSingleViewOption?callPut={right}&maturityDate={expiration_date}'
+    pending_pages = ()  # Pages skipped whose previous items are still to be emitted (see reuse_pending_pages)
+    pages_left = 0  # Pages requested not parsed yet
+
+    @property
+    def crawl_state(self):
+        '''
+        State of the incremental crawl (see scrapyEurex/incremental.py), loaded on first use
+        '''
+        if not hasattr(self, '_crawl_state'):
+            settings = getattr(self, 'settings', None) or Settings()
+            self._crawl_state = CrawlState(settings, self.ticker or self.name, get_session_date(settings))
+        return self._crawl_state
+
+    def inc_stats(self, key: str, count=1):
+        if hasattr(self, 'crawler'):
+            self.crawler.stats.inc_value(key, count)
+
+    def closed(self, reason):
+        self.crawl_state.save()
+
+    def parse(self, response):
+        # Get list of expiration dates
+        expiry_dates = expiry_dates_xpath(response.selector.root)
+
+        # Iterate each the page of each expiration date (for both call and put)
+        requests = []
+        self.pending_pages = []
+        for exp_date in expiry_dates:
+            if exp_date:  # Avoids empty value from "All expiries" option
+                for r in ['Call', 'Put']:
+                    key = '{}_{}'.format(exp_date, r[0])
+                    # Illiquid pages are only requested once every few sessions, and their previous items reused meanwhile
+                    if not self.crawl_state.should_fetch(key) and self.crawl_state.previous_items(key, third_friday(exp_date), r[0], None) is not None:
+                        self.crawl_state.record_skip(key)
+                        self.pending_pages.append((key, third_friday(exp_date), r[0]))
+                        continue
+                    requests.append(scrapy.Request(url=self.url_template.format(product_url=self.product_url, underlying_id=self.underlying_id, right=r, expiration_date=exp_date),
+                                                   callback=self.parse_opt_chain, errback=self.page_failed,
+                                                   meta={'right': r[0], 'expiration_date': exp_date}))
+        # Items of skipped pages are only emitted once the session date of the fetched pages is known
+        self.pages_left = len(requests)
+        yield from requests
+        yield from self.reuse_pending_pages()
+
+    def reuse_pending_pages(self):
+        '''
+        Yields the previous items of the pages skipped in this crawl, stamped with the session date of the fetched pages
+        (or with the previous session date if no page is left to fetch)
+        '''
+        if not self.pending_pages or (self.crawl_state.session_date is None and self.pages_left > 0):
+            return
+        session_date = self.crawl_state.item_session_date()
+        for key, expiration_date, right in self.pending_pages:
+            items = self.crawl_state.previous_items(key, expiration_date, right, session_date)
+            self.inc_stats('incremental/pages_skipped')
+            self.inc_stats('incremental/items_reused', len(items))
+            for item in items:
+                yield OptionItem(item)
+        self.pending_pages = []
+
+    def page_failed(self, failure):
+        self.pages_left -= 1
+        self.inc_stats('eurex/pages_failed')
+        self.logger.error('Failed to get {}: {}'.format(failure.request.url, failure.value))
+        yield from self.reuse_pending_pages()
+
+    def parse_opt_chain(self, response):
+        right = response.meta.get('right')
+        expiration_date = third_friday(response.meta.get('expiration_date'))
+        key = '{}_{}'.format(response.meta.get('expiration_date'), right)
+        # Skip the last row, which only includes the total volume and open interest
+        rows = [row_cells(row) for row in rows_xpath(response.selector.root)[:-1]]
+        self.pages_left -= 1
+
+        # Every item of the crawl gets the session date of the first page fetched: the latest date of its rows, as
+        # untraded strikes may show older ones
+        if rows:
+            page_date = page_session_date(rows)
+            stale_rows = sum(to_date(cells[session_date_cell]) != page_date for cells in rows)
+            if stale_rows:
+                self.inc_stats('eurex/stale_session_rows', stale_rows)
+            if not self.crawl_state.set_session_date(page_date):
+                self.inc_stats('eurex/stale_session_pages')
+                self.logger.warning('Session date {} of {} differs from the one of the crawl ({})'.format(
+                    page_date, response.url, self.crawl_state.item_session_date()))
+        session_date = self.crawl_state.item_session_date()
+        yield from self.reuse_pending_pages()
+
+        # Reuse the items of the previous session if the table did not change (but for the session date)
+        fingerprint = page_fingerprint(rows, session_date_cell)
+        self.crawl_state.record_fetch(key, fingerprint, sum(int(cells[volume_cell].replace(',', '')) for cells in rows))
+        if rows and self.crawl_state.is_unchanged(key, fingerprint):
+            items = self.crawl_state.previous_items(key, expiration_date, right, session_date)
+            if items is not None:
+                self.inc_stats('incremental/pages_reused')
+                self.inc_stats('incremental/items_reused', len(items))
+                for item in items:
+                    yield OptionItem(item)
+                return
+
+        for cells in rows:
+            item = OptionItem()
+            item['right'] = right
+            item['strike'] = float(cells[strike_cell].replace(',', ''))
+            item['expiration_date'] = expiration_date
+            item['session_date'] = session_date
+            item['percentage_diff_to_prev_day'] = float(cells[percentage_diff_cell].replace('%', '').rstrip())
+            item['volume'] = int(cells[volume_cell].replace(',', ''))
+            item['open_interest'] = int(cells[open_interest_cell].replace(',', ''))
+            # Open interest date can be 'n.a.' if no contract has been traded
+            try:
+                item['open_interest_date'] = to_date(cells[open_interest_date_cell])
+            except (ValueError, IndexError):
+                item['open_interest_date'] = 'n.a.'
+            item['last_price'] = to_price(cells[last_price_cell])
+            item['open_price'] = to_price(cells[open_price_cell])
+            item['high_price'] = to_price(cells[high_price_cell])
+            item['low_price'] = to_price(cells[low_price_cell])
+            yield item
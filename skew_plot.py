@@ -1,11 +1,14 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import matplotlib.pyplot as plt
 from os import path
 import py_vollib.black_scholes.implied_volatility as iv
 from py_lets_be_rational.exceptions import BelowIntrinsicException
+import iv_solver
+import chain_store
 
 
 def calculate_iv(df: pd.DataFrame, S: float, r: float, ticker: str):
@@ -15,8 +18,13 @@ def calculate_iv(df: pd.DataFrame, S: float, r: float, ticker: str):
     S: Underlying asset price
     r: Risk-free interest rate
     '''
-    df['years_to_exp'] = df['expiration_date'].apply(lambda x: (datetime.strptime(x, '%d/%m/%Y').date() - datetime.now().date()).days / 365.)
-    return df.apply(lambda row: _calculate_iv(row['last_price'], S, row['strike'], row['years_to_exp'], r, row['right'], ticker), axis=1)
+    df['years_to_exp'] = iv_solver.years_to_expiry(df['expiration_date'], datetime.now())
+    price = pd.to_numeric(df['last_price'], errors='coerce').values  # 'N/A' prices become NaN and are masked out
+    iv_values, converged = iv_solver.implied_volatility(price, S, df['strike'].values, df['years_to_exp'].values, r, df['right'].values)
+    not_converged = (price > 0.0) & (df['years_to_exp'].values > 0.0) & ~np.isnan(iv_values) & ~converged
+    if not_converged.any():
+        print('WARNING: IV did not converge for {} options of ticker {}'.format(int(not_converged.sum()), ticker))
+    return pd.Series(iv_values, index=df.index)
     
     
 def _calculate_iv(price: float, S: float, K: float, t: float, r: float, flag: str, ticker: str):
@@ -37,7 +45,7 @@ def _calculate_iv(price: float, S: float, K: float, t: float, r: float, flag: st
 def plot_strikes_skew(df: pd.DataFrame, t_list: list, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool):
     '''
     Plots the strikes volatility skew
-    df: Options dataframe
+    df: Options dataframe (see chain_store.chain_dtypes)
     t_list: List of xpiration dates to fix for this skew
     ticker: Ticker of the underlying asset
     output_folder: Ouput folder
@@ -58,7 +66,7 @@ def plot_strikes_skew(df: pd.DataFrame, t_list: list, ticker: str, output_folder
         strikes_put = df.strike[(df.right == 'P') & (df.expiration_date == t)]
         iv_put = df.iv[(df.right == 'P') & (df.expiration_date == t)]
         plt.plot(strikes_put, iv_put)
-        plt.legend(t)
+    plt.legend([chain_store.parse_date(t).strftime(chain_store.legacy_date_format) for t in t_list])
     plt.xlabel('Strike prices')
     plt.ylabel('IV')
 
@@ -74,7 +82,7 @@ def plot_strikes_skew(df: pd.DataFrame, t_list: list, ticker: str, output_folder
 def plot_expiration_skew(df: pd.DataFrame, K_list: list, ticker: str, output_folder: str, rewrite_img: bool, save_img: bool):
     '''
     Plots the expiration dates volatility skew
-    df: Options dataframe
+    df: Options dataframe (see chain_store.chain_dtypes)
     K_list: List of strikes to fix for this skew
     ticker: Ticker of the underlying asset
     output_folder: Ouput folder
@@ -92,8 +100,8 @@ def plot_expiration_skew(df: pd.DataFrame, K_list: list, ticker: str, output_fol
             return svg_filename
     
     for K in K_list:
-        expiration_dates_put = pd.to_datetime(df.expiration_date[(df.right == 'P') & (df.strike.astype('float') == K)], format="%d/%m/%Y")
-        iv_put = df.iv[(df.right == 'P') & (df.strike.astype('float') == K)]
+        expiration_dates_put = df.expiration_date[(df.right == 'P') & (df.strike == K)]
+        iv_put = df.iv[(df.right == 'P') & (df.strike == K)]
         plt.plot(expiration_dates_put, iv_put)
         plt.legend(str(K))
     plt.xlabel('Expiration Date')